@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+#
+# library name: balancecache.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: keep the available balance of every currency in memory so orders without the funds are refused before signing.
+
+# Design Outline:
+#  1. "seed" fetches the available balances once (/v1/balances). Until then every check passes (the exchange decides).
+#  2. Balances then move with the account's order events ("record") and with the REST responses of this process:
+#       - an order booked holds its funds (the quote amount plus the fee for bids, the base amount for asks),
+#         at the maker fee for maker-or-cancel bids and at the taker fee for bids that can take liquidity,
+#       - a fill credits what was bought or the proceeds of what was sold (net of its fee) and settles the fee held,
+#       - an order closed returns whatever it still held (nothing once it filled completely).
+#  3. Order functions "reserve" the funds of every order before submitting it ("reserveorder" reads the payload),
+#     raising InsufficientFunds when they are not available,
+#     and "settle" the reservation with the response: kept as the order's hold when it was accepted, returned otherwise.
+#     Cancellations release their hold as soon as the exchange confirms them ("cancelled"), ahead of their closed event.
+#     Submissions without a response keep their reservation until the order is looked up (see ordermanager.resolve).
+#     Order ids and trade ids are remembered (bounded) so the events of orders handled that way are not applied twice.
+#  4. A rejection for insufficient funds despite the cache means it drifted. It is seeded again in the background.
+#     Reservations of orders still in flight survive seeding (they are taken off the balances fetched).
+#
+# Refer to https://docs.gemini.com/rest-api/#get-available-balances and https://docs.gemini.com/websocket-api/#order-events.
+
+import itertools
+import threading
+import collections
+
+from decimal import Decimal
+
+import backstopper.informing.definer as definer
+import backstopper.informing.feeschedule as feeschedule
+import backstopper.timing.deadline as deadline
+import backstopper.authenticating.authenticator as authenticator
+
+from backstopper.logging.logger import logger as logger
+from backstopper.pricing.quantizer import tickscale
+
+class InsufficientFunds ( ValueError ) :
+    pass
+
+balances : dict = None
+reservations : dict = {}
+booked : collections.OrderedDict = collections.OrderedDict()
+closed : collections.OrderedDict = collections.OrderedDict()
+tradeids : collections.OrderedDict = collections.OrderedDict()
+takers : collections.OrderedDict = collections.OrderedDict()
+capacity : int = 65536
+tokens = itertools.count( 1 )
+lock = threading.Lock()
+seeding = threading.Lock()
+
+def remember (
+        seen : collections.OrderedDict,
+        key
+    ) -> bool :
+
+    # Remember a key (return False when it was seen already).
+    if key in seen : return False
+    seen[ key ] = None
+    while len( seen ) > capacity : seen.popitem( last = False )
+    return True
+
+def fetch ( ) -> list :
+
+    # Available balances of the account (one entry per currency).
+    endpoint = '/v1/balances'
+    payload = {
+        'request': endpoint
+    }
+    headers = authenticator.authenticate( payload )
+    request = definer.restserver + endpoint
+    return deadline.post( 'account', request, data = None, headers = headers[ 'restheader' ] ).json()
+
+def seed ( ) -> dict :
+
+    # Replace the cache with the balances available now (blocking).
+    # Orders reserved but not settled yet may not have reached the exchange: their reservations are kept.
+    # (One booked while the balances were fetched is then held twice until the next seeding, which errs on the safe side.)
+    global balances
+    fetched = { entry[ 'currency' ].upper(): Decimal( entry[ 'available' ] ) for entry in fetch() }
+    with lock :
+        balances = collections.defaultdict( Decimal, fetched )
+        for currency, amount, taker in reservations.values() : balances[ currency ] -= amount
+    logger.debug ( f'Balances seeded: { { currency: str( amount ) for currency, amount in fetched.items() } }' )
+    return fetched
+
+def seedinbackground ( ) -> None :
+
+    # At most one seeding at a time (checks keep using the cache meanwhile).
+    if not seeding.acquire( blocking = False ) : return
+
+    def worker () :
+        try : seed()
+        except Exception as e : logger.warning ( f'Unable to seed the balance cache. Error: {e}' )
+        finally : seeding.release()
+
+    threading.Thread( target = worker, name = 'balancecache', daemon = True ).start()
+
+def start ( ) -> None :
+
+    # Seed once for the lifetime of a long-running process (it must also "record" the account's order events).
+    seedinbackground()
+
+def available (
+        currency : str
+    ) -> Decimal :
+
+    # None until seeded.
+    with lock : return balances[ currency.upper() ] if balances is not None else None
+
+def hold (
+        pair : str,
+        side : str,
+        amount,
+        price,
+        taker : bool = False
+    ) -> tuple :
+
+    # Currency and amount an order holds while it is open (bids that can take liquidity hold the taker fee).
+    scale = tickscale( pair )
+    if side == 'buy' : return ( scale.quotecurrency, Decimal( amount ) * Decimal( price ) * ( 1 + ( feeschedule.takerfee() if taker else feeschedule.makerfee() ) ) )
+    return ( scale.basecurrency, Decimal( amount ) )
+
+def istaker (
+        event : dict
+    ) -> bool :
+
+    # Whether an order was held at the taker fee (known by its client order id or its order id).
+    return event.get( 'client_order_id' ) in takers or str( event.get( 'order_id' ) ) in takers
+
+def reserve (
+        pair : str,
+        side : str,
+        amount,
+        price,
+        taker : bool = False,
+        clientid : str = None
+    ) -> int :
+
+    # Set aside the funds of an order about to be submitted (None while the cache is not seeded).
+    if balances is None : return None
+    try : currency, needed = hold( pair, side, amount, price, taker )
+    except KeyError : return None # Pairs missing from definer.ticksizes are left to the exchange.
+    with lock :
+        if balances[ currency ] < needed :
+            raise InsufficientFunds( f'{needed:f} {currency} is needed to {side} {amount} {pair.upper()} but only {balances[ currency ]:f} is available. ' )
+        balances[ currency ] -= needed
+        token = next( tokens )
+        reservations[ token ] = ( currency, needed, taker )
+        if taker and clientid is not None : remember( takers, clientid )
+    return token
+
+def reserveorder (
+        payload : dict
+    ) -> int :
+
+    # Reserve the funds of an order payload ( /v1/order/new ). Only maker-or-cancel orders are sure never to take liquidity.
+    taker = payload[ 'side' ] == 'buy' and 'maker-or-cancel' not in payload.get( 'options', () )
+    return reserve( payload[ 'symbol' ], payload[ 'side' ], payload[ 'amount' ], payload[ 'price' ], taker, payload.get( 'client_order_id' ) )
+
+def settle (
+        token : int,
+        response
+    ) -> None :
+
+    # Keep a reservation as the hold of the order accepted, or return it (the REST response of the submission decides).
+    try : order = response.json()
+    except Exception : order = {}
+    settleorder( token, order )
+
+def settleorder (
+        token : int,
+        order : dict
+    ) -> None :
+
+    # The same with the parsed response (or the status of the order, see ordermanager.resolve).
+    if not isinstance( order, dict ) : order = {}
+    if order.get( 'reason' ) == 'InsufficientFunds' and balances is not None :
+        logger.warning ( f'The exchange reported insufficient funds that the balance cache did not. Seeding it again. ' )
+        seedinbackground()
+    if token is None : return
+    with lock :
+        reservation = reservations.pop( token, None )
+        if reservation is None : return
+        currency, amount, taker = reservation
+        # Return the reservation when nothing was booked or when the booked event was applied first.
+        if 'order_id' not in order or not remember( booked, str( order[ 'order_id' ] ) ) : balances[ currency ] += amount
+        elif taker : remember( takers, str( order[ 'order_id' ] ) )
+
+def release (
+        token : int
+    ) -> None :
+
+    # Return a reservation whose submission failed without a response.
+    with lock :
+        reservation = reservations.pop( token, None )
+        if reservation is not None : balances[ reservation[0] ] += reservation[1]
+
+def cancelled (
+        response
+    ) -> None :
+
+    # Return the hold of an order as soon as its cancellation is confirmed (its closed event is then ignored).
+    try : order = response.json()
+    except Exception : return
+    if isinstance( order, dict ) and order.get( 'is_cancelled' ) : record( dict( order, type = 'closed' ) )
+
+def record (
+        event : dict
+    ) -> bool :
+
+    # Apply an order events "booked", "fill" or "closed" message (return False when it changed nothing).
+    kind = event.get( 'type' )
+    if balances is None or kind not in ( 'booked', 'fill', 'closed' ) : return False
+    try :
+        scale = tickscale( event[ 'symbol' ] )
+        order, side = str( event[ 'order_id' ] ), event[ 'side' ]
+        with lock :
+            if kind == 'booked' :
+                if not remember( booked, order ) : return False
+                currency, amount = hold( scale.pair, side, event[ 'original_amount' ], event[ 'price' ], istaker( event ) )
+                balances[ currency ] -= amount
+            elif kind == 'fill' :
+                fill = event[ 'fill' ]
+                if not remember( tradeids, fill[ 'trade_id' ] ) : return False
+                amount, price, fee = Decimal( fill[ 'amount' ] ), Decimal( fill[ 'price' ] ), Decimal( fill.get( 'fee' ) or '0' )
+                if side == 'buy' :
+                    # The hold covered the limit price plus the fee. Return what the fill did not spend.
+                    balances[ scale.basecurrency ] += amount
+                    balances[ scale.quotecurrency ] += hold( scale.pair, side, amount, event[ 'price' ], istaker( event ) )[1] - amount * price - fee
+                else :
+                    balances[ scale.quotecurrency ] += amount * price - fee
+            else :
+                if not remember( closed, order ) : return False
+                remaining = Decimal( event.get( 'remaining_amount' ) or '0' )
+                if remaining :
+                    currency, amount = hold( scale.pair, side, remaining, event[ 'price' ], istaker( event ) )
+                    balances[ currency ] += amount
+    except ( KeyError, TypeError, ArithmeticError ) as e :
+        logger.debug ( f'Unable to apply an order event to the balance cache ({e}): {event}' )
+        return False
+    return True
+
+def snapshot ( ) -> dict :
+    with lock : return { currency: str( amount ) for currency, amount in balances.items() } if balances is not None else {}
+
+if __name__ == "__main__":
+
+    # Seed (blocking) and report.
+    for currency, amount in sorted( seed().items() ) : logger.info ( f'{currency}: {amount:f} available. ' )
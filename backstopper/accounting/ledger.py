@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+#
+# library name: ledger.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: keep realized and unrealized profit/loss per position and per symbol from the fills actually received.
+
+# Design Outline:
+#  1. Every fill (from order events) carries its own price, amount and fee. Recording one costs O(1):
+#       - buys (and sells while short) add to the quantity held and its cost,
+#       - sells (and buys while short) realize the difference between their price and the average cost,
+#       - fees are summed separately and deducted from the realized profit/loss.
+#  2. Fills are booked twice: under their position (the tag of their client order id, see ordermanager) and under their symbol.
+#     Untagged fills are booked under their symbol as the position name.
+#  3. Trades streamed by the market data feeds mark symbols to market (O(1), only the last price is kept).
+#     Unrealized profit/loss is only computed when a snapshot is asked for (quantity × mark − cost).
+#  4. Fills are recognized by trade id, so replayed events (e.g. after reconnecting) are never booked twice.
+#  5. Amounts are Decimals in the quote currency (e.g. USD). Snapshots render them as strings.
+#  6. "bookorder" books the trades listed by an order status ( /v1/order/status with include_trades ) for processes that
+#     look their own orders up once they are done (e.g. app.py) instead of streaming order events.
+
+import threading
+import collections
+
+from decimal import Decimal
+
+from backstopper.ordering.ordermanager import tagof
+
+class Account :
+
+    __slots__ = ( 'symbol', 'quantity', 'cost', 'realized', 'fees', 'bought', 'sold', 'spent', 'received', 'fills' )
+
+    def __init__ (
+            self,
+            symbol : str
+        ) -> None :
+        self.symbol = symbol
+        self.quantity = Decimal( 0 )
+        self.cost = Decimal( 0 )
+        self.realized = Decimal( 0 )
+        self.fees = Decimal( 0 )
+        self.bought = Decimal( 0 )
+        self.sold = Decimal( 0 )
+        self.spent = Decimal( 0 )
+        self.received = Decimal( 0 )
+        self.fills : int = 0
+
+    def fill (
+            self,
+            side : str,
+            amount : Decimal,
+            price : Decimal,
+            fee : Decimal
+        ) -> None :
+
+        # Average cost accounting that works for long and short quantities alike.
+        signed = amount if side == 'buy' else -amount
+        if side == 'buy' :
+            self.bought += amount
+            self.spent += amount * price
+        else :
+            self.sold += amount
+            self.received += amount * price
+        self.fees += fee
+        self.fills += 1
+        if self.quantity and ( self.quantity > 0 ) != ( signed > 0 ) :
+            # Reduce (and possibly reverse) the quantity held.
+            closing = min( abs( signed ), abs( self.quantity ) )
+            average = self.cost / self.quantity
+            direction = 1 if self.quantity > 0 else -1
+            self.realized += closing * ( price - average ) * direction
+            self.cost -= average * closing * direction
+            self.quantity -= closing * direction
+            signed += closing * direction
+            if not self.quantity : self.cost = Decimal( 0 )
+        if signed :
+            self.quantity += signed
+            self.cost += signed * price
+
+    def snapshot (
+            self,
+            mark : Decimal = None
+        ) -> dict :
+        unrealized = self.quantity * mark - self.cost if mark is not None else None
+        return { 'symbol': self.symbol, 'quantity': str( self.quantity ), 'cost': str( self.cost ),
+                 'average': str( self.cost / self.quantity ) if self.quantity else None, 'mark': str( mark ) if mark is not None else None,
+                 'realized': str( self.realized - self.fees ), 'fees': str( self.fees ),
+                 'unrealized': str( unrealized ) if unrealized is not None else None,
+                 'bought': str( self.bought ), 'sold': str( self.sold ), 'spent': str( self.spent ), 'received': str( self.received ),
+                 'fills': self.fills }
+
+class Ledger :
+
+    def __init__ (
+            self,
+            capacity : int = 65536
+        ) -> None :
+        self.positions : dict = {}
+        self.symbols : dict = {}
+        self.marks : dict = {}
+        self.capacity = capacity
+        self.tradeids = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def fill (
+            self,
+            position : str,
+            symbol : str,
+            side : str,
+            amount,
+            price,
+            fee = '0',
+            tradeid = None
+        ) -> bool :
+
+        # Book one fill (return False for a trade id booked already).
+        symbol = symbol.upper()
+        amount, price, fee = Decimal( amount ), Decimal( price ), Decimal( fee )
+        with self.lock :
+            if tradeid is not None :
+                if tradeid in self.tradeids : return False
+                self.tradeids[ tradeid ] = None
+                while len( self.tradeids ) > self.capacity : self.tradeids.popitem( last = False )
+            name = position or symbol
+            if name not in self.positions : self.positions[ name ] = Account( symbol )
+            if symbol not in self.symbols : self.symbols[ symbol ] = Account( symbol )
+            self.positions[ name ].fill( side, amount, price, fee )
+            self.symbols[ symbol ].fill( side, amount, price, fee )
+        return True
+
+    def record (
+            self,
+            event : dict
+        ) -> bool :
+
+        # Book an order events "fill" message (other messages are ignored).
+        # Refer to https://docs.gemini.com/websocket-api/#order-events for the fields used.
+        if event.get( 'type' ) != 'fill' or 'fill' not in event : return False
+        fill = event[ 'fill' ]
+        return self.fill( tagof( event ), event[ 'symbol' ], event[ 'side' ], fill[ 'amount' ], fill[ 'price' ],
+                          fill.get( 'fee' ) or '0', fill.get( 'trade_id' ) )
+
+    def bookorder (
+            self,
+            order : dict
+        ) -> int :
+
+        # Book the trades listed by an order status (return how many were new).
+        # Refer to https://docs.gemini.com/rest-api/#order-status for the fields used.
+        booked = 0
+        for trade in order.get( 'trades' ) or [] :
+            booked += self.fill( tagof( order ), order[ 'symbol' ], order[ 'side' ], trade[ 'amount' ], trade[ 'price' ],
+                                 trade.get( 'fee_amount' ) or '0', trade.get( 'tid' ) )
+        return booked
+
+    def mark (
+            self,
+            symbol : str,
+            price
+        ) -> None :
+        self.marks[ symbol.upper() ] = Decimal( price )
+
+    def snapshot ( self ) -> dict :
+
+        # Realized (net of fees) and unrealized profit/loss per position and per symbol (plus their totals).
+        with self.lock :
+            positions = { name: account.snapshot( self.marks.get( account.symbol ) ) for name, account in self.positions.items() }
+            symbols = { symbol: account.snapshot( self.marks.get( symbol ) ) for symbol, account in self.symbols.items() }
+        realized = sum( ( Decimal( account[ 'realized' ] ) for account in symbols.values() ), Decimal( 0 ) )
+        unrealized = sum( ( Decimal( account[ 'unrealized' ] ) for account in symbols.values() if account[ 'unrealized' ] is not None ), Decimal( 0 ) )
+        return { 'positions': positions, 'symbols': symbols, 'realized': str( realized ), 'unrealized': str( unrealized ) }
@@ -15,26 +15,44 @@
 #  6. On the occasion that last price exceeds a new price target, cancel the old stop limit order and submit an updated stop-limit order to sell when the new price target is reached.
 #  7. On the occasion that monitored ask prices indicate that the existing stop limit order should close, stop monitoring prices and exit.
 #
+# Emulated Stops (definer.stopmode or BACKSTOPPER_STOPMODE set to 'emulated'):
+#  5. Optionally submit a wide "disaster" stop-limit order that never moves. The trailing stop itself only exists here.
+#  6. On the occasion that last price exceeds a new price target, recalculate the stop and sell prices locally (no REST calls).
+#  7. On the occasion that ask prices fall below the stop price, cancel the disaster order and sell immediately-or-cancel at the sell price.
+#     Whatever is left rests as a limit ask at the sell price (just like a triggered stop-limit order would).
+#
 # Execution:
 #   - Use the wrapper BASH script in the "strategies" directory.
 
+import os
 import sys
 import json
 import time
+import atexit
+import signal
 import asyncio
 
 from decimal import Decimal
 
-from backstopper.informing.definer import ticksizes
+import backstopper.informing.definer as definer
+import backstopper.informing.feeschedule as feeschedule
+import backstopper.authenticating.authenticator as authenticator
 
 from backstopper.logging.logger import logger
+from backstopper.accounting.ledger import Ledger
 from backstopper.ordering.frontrunner import bidorder
+from backstopper.ordering.requoter import Requoter
 from backstopper.ordering.stopper import askstoplimit
-from backstopper.ordering.ordermanager import cancelorder
-from backstopper.informing.volumizer import notionalvolume
+from backstopper.ordering.liquidator import askimmediate, asklimit
+from backstopper.ordering.ordermanager import cancelorder, islive, resolve, UnconfirmedOrder
 from backstopper.monitoring.trademonitor import blockpricerange
+from backstopper.monitoring.candlebuilder import CandleBuilder
+from backstopper.monitoring.tradestatistics import TradeStatistics
 from backstopper.monitoring.closevalidator import confirmexecution
 from backstopper.messaging.messenger import sendmessage as sendmessage
+from backstopper.pricing.quantizer import tickscale, ratio
+from backstopper.recording.tickrecorder import TickRecorder
+from backstopper.timing.deadline import Deadline
 
 # Set bid size in the base currency (BTC in this case).
 # This amount should exceed ~25 cents ['0.00001' is the minimum for BTCUSD].
@@ -47,6 +65,12 @@ longquantity : str = '0.0001'
 stopdiscount : str = '0.0100'
 selldiscount : str = '0.0200'
 
+# Optionally widen the stop discount to a multiple of the volatility expected over a horizon (in seconds).
+# For example, a multiple of '2' with a 300 second horizon keeps the stop two 5-minute standard deviations away.
+# The stop discount above remains the minimum. A multiple of '0' disables the adjustment.
+volatilitymultiple : str = '0'
+volatilityhorizon : int = 300
+
 # Override defaults with command line parameters from BASH wrapper.
 if len(sys.argv) == 5 :
     currencypair = sys.argv[1]
@@ -56,9 +80,13 @@ if len(sys.argv) == 5 :
 else : 
     logger.warning ( f'Incorrect number of command line arguments. Using default values for {currencypair} trailing...' )
 
+# Determine tick size and quantity increments.
+scale = tickscale( currencypair )
+tick = Decimal( scale.tick ) # Only used to round the gains reported.
+
 # Cast strings.
-quotecurrency : str = currencypair[3:]
-assetcurrency : str = currencypair[:3]
+quotecurrency : str = scale.quotecurrency
+assetcurrency : str = scale.basecurrency
 
 # Cast decimals.
 tradesize = Decimal( longquantity )
@@ -73,77 +101,160 @@ if stopinput.compare( sellinput ) == 1 :
     logger.error ( f'{notification}' )
     sys.exit(1)
 
-# Determine tick size.
-item = [ item['tick'] for item in ticksizes if item['currency'] == assetcurrency ]
-tick = Decimal( item[0] )
+# Sign every private request of this position with the same API key (see the key pool in authenticator).
+# Workers started by the supervisor only hold the key allocated to them (BACKSTOPPER_APIKEY), so no two bots share a key.
+# Orders are tagged with the same name (see ordermanager for bulk operations by tag).
+position : str = os.environ.get( 'BACKSTOPPER_POSITION', currencypair )
+authenticator.pinkey( position )
 
-# Determine Gemini API transaction fee. Conversion from basis points required.
-geminiapifee = Decimal( 0.0001 ) * Decimal ( notionalvolume().json()["api_maker_fee_bps"] )
+# Decide what happens to the live stop order when asked to terminate (e.g. by the supervisor).
+terminationpolicy : str = os.environ.get( 'BACKSTOPPER_ONTERM', definer.terminationpolicy )
+liveorder : str = None
 
-# Submit limit bid order, report response, and verify submission.
-logger.debug ( f'Submitting {currencypair} frontrunning limit bid order.' )
+# Remember every order this position booked. Their fills (actual prices, amounts and fees) are looked up to report the profit/loss.
+ownorders : dict = {}
 
-try :
-    jsonresponse : str = bidorder( currencypair, longquantity ).json()
-except Exception as e :
-    # Report exception.
-    notification = f'While trying to submit a frontrunning limit bid order the follow error occurred: {e} '
-    logger.debug ( f'{notification}Let\'s exit. Please try rerunning the code! ' )
-    sys.exit(1) # Exit. Continue no further.
+def track ( response : dict ) -> dict :
+    if isinstance( response, dict ) and response.get( 'order_id' ) is not None : ownorders[ response[ 'order_id' ] ] = None
+    return response
 
-# To debug remove comment character below:
-# logger.info ( json.dumps( jsonresponse, sort_keys=True, indent=4, separators=(',', ': ') ) )
+def terminate ( signum, frame ) :
+    if liveorder is not None and terminationpolicy == 'cancel' :
+        try :
+            cancelorder( liveorder )
+            logger.info ( f'Terminating. Cancelled stop limit order {liveorder}. ' )
+        except Exception as e :
+            logger.error ( f'Terminating. Unable to cancel stop limit order {liveorder}. Error: {e}' )
+    else :
+        logger.info ( f'Terminating. Stop limit order {liveorder} was left on the order book. ' )
+    sys.exit(143)
 
-try :
-    if jsonresponse["is_cancelled"] : 
-        notification = f'Bid order {jsonresponse["order_id"]} was cancelled. '
-        logger.debug ( '{notification} Let\'s exit. Please try rerunning the code!' )
-        sys.exit(1) # Exit. Continue no further.
+signal.signal( signal.SIGTERM, terminate )
 
-    else :
-        infomessage = f'Bid order {jsonresponse["order_id"]} for {jsonresponse["remaining_amount"]} {jsonresponse["symbol"].upper()[:3]} '
-        infomessage = infomessage + f'at {jsonresponse["price"]} {jsonresponse["symbol"].upper()[3:]} is active and booked. '
-        logger.info ( infomessage )
-        sendmessage ( infomessage )
-
-except KeyError as e :
-    warningmessage = f'KeyError : {e} was not present in the response from the REST API server.'
-    logger.warning ( warningmessage )
-    try :    
-        if jsonresponse["result"] : 
-            criticalmessage = f'\"{jsonresponse["reason"]}\" {jsonresponse["result"]}: {jsonresponse["message"]}'
-            logger.critical ( criticalmessage ) ; sendmessage ( criticalmessage )
-            sys.exit(1)
+# Let the supervisor know whenever this position may hold an order or the asset (it must not be restarted then, see supervisor.py).
+holdingpath : str = os.environ.get( 'BACKSTOPPER_HOLDING' )
 
+def holding ( held : bool ) -> None :
+    if holdingpath is None : return
+    if held :
+        with open( holdingpath, 'w' ) as file : file.write( str( os.getpid() ) )
+    elif os.path.exists( holdingpath ) : os.remove( holdingpath )
+
+# Decide where the trailing stop lives: on the exchange ('exchange') or here ('emulated', see above).
+stopmode : str = os.environ.get( 'BACKSTOPPER_STOPMODE', definer.stopmode )
+if stopmode not in ( 'exchange', 'emulated' ) :
+    logger.error ( f'Unknown stop mode "{stopmode}". Use "exchange" or "emulated". ' )
+    sys.exit(1)
+
+# Record streamed trades (flushing whatever is pending when the script exits).
+recorder = TickRecorder() if definer.tickrecording else None
+if recorder is not None : atexit.register( recorder.stop )
+
+# Keep rolling trade statistics (e.g. volatility) and candles up to date while monitoring prices.
+# Candles start from the disk cache (or the candles endpoint when the cache is stale).
+statistics = TradeStatistics()
+candles = CandleBuilder( currencypair )
+candles.seed()
+atexit.register( candles.save )
+
+# Determine Gemini API transaction fee (from the cached fee schedule, refreshed in the background when stale).
+geminiapifee = feeschedule.makerfee()
+
+# Buy either with one frontrunning bid (waiting for its fill) or with a bid kept at the top of the book (see requoter.py).
+entrymode : str = os.environ.get( 'BACKSTOPPER_ENTRYMODE', definer.entrymode )
+holding( True )
+if entrymode == 'requote' :
+
+    # Requote until filled, the deadline passes, prices drift away or an error ends the entry. Trail whatever was filled.
+    jsonresponse : dict = asyncio.run ( Requoter( currencypair, longquantity, position ).run() )
+    if jsonresponse["price"] is None :
+        notification = f'No {currencypair} bid was filled ({jsonresponse["outcome"]}). '
+        logger.info ( f'{notification}Let\'s exit. Please try rerunning the code! ' ) ; sendmessage ( notification )
+        holding( False ) ; sys.exit(1) # Exit. Continue no further.
+    if jsonresponse["outcome"] == 'dust' :
+        # No stop limit order for less than the minimum order would be accepted. Leave the marker: the asset is held.
+        notification = f'Only {jsonresponse["executed_amount"]} {assetcurrency} was bought, below the {jsonresponse["minimum"]} {assetcurrency} minimum order. '
+        notification = notification + 'No stop can protect it. Please sell it manually. '
+        logger.error ( f'{notification}Let\'s exit. ' ) ; sendmessage ( notification )
+        sys.exit(1) # Exit. Continue no further.
+    for order in jsonresponse["orders"] : ownorders[ order ] = None
+    longquantity = jsonresponse["executed_amount"]
+    tradesize = Decimal( longquantity )
+    infomessage = f'Bought {longquantity} {assetcurrency} at {jsonresponse["price"]} {quotecurrency} (on average) '
+    infomessage = infomessage + f'after {jsonresponse["requotes"]} requotes in {jsonresponse["elapsed"]:,.1f} seconds. '
+    logger.info ( infomessage ) ; sendmessage ( infomessage )
+
+else :
+
+    # Submit limit bid order, report response, and verify submission.
+    logger.debug ( f'Submitting {currencypair} frontrunning limit bid order.' )
+
+    try :
+        with Deadline( definer.stepbudget ) : jsonresponse : str = track( bidorder( currencypair, longquantity, position ).json() )
+    except UnconfirmedOrder as e :
+        # The bid may be live. Carry on with it if it was booked (and exit below if it was not).
+        logger.warning ( f'{e}Looking it up. ' )
+        jsonresponse : dict = track( resolve( e, persist = True ) )
     except Exception as e :
-        criticalmessage = f'Exception : {e} '
-        logger.critical ( f'Unexpecter error. Unsuccessful bid order submission. {criticalmessage}' )
-        sys.exit(1)
+        # Report exception.
+        notification = f'While trying to submit a frontrunning limit bid order the follow error occurred: {e} '
+        logger.debug ( f'{notification}Let\'s exit. Please try rerunning the code! ' )
+        sys.exit(1) # Exit. Continue no further.
+
+    # To debug remove comment character below:
+    # logger.info ( json.dumps( jsonresponse, sort_keys=True, indent=4, separators=(',', ': ') ) )
+
+    try :
+        if jsonresponse["is_cancelled"] : 
+            notification = f'Bid order {jsonresponse["order_id"]} was cancelled. '
+            logger.debug ( '{notification} Let\'s exit. Please try rerunning the code!' )
+            holding( False ) ; sys.exit(1) # Exit. Continue no further.
 
-# Confirm order execution.
-asyncio.run ( confirmexecution( jsonresponse["order_id"] ) )
+        else :
+            infomessage = f'Bid order {jsonresponse["order_id"]} for {jsonresponse["remaining_amount"]} {jsonresponse["symbol"].upper()[:3]} '
+            infomessage = infomessage + f'at {jsonresponse["price"]} {jsonresponse["symbol"].upper()[3:]} is active and booked. '
+            logger.info ( infomessage )
+            sendmessage ( infomessage )
+
+    except KeyError as e :
+        warningmessage = f'KeyError : {e} was not present in the response from the REST API server.'
+        logger.warning ( warningmessage )
+        try :    
+            if jsonresponse["result"] : 
+                criticalmessage = f'\"{jsonresponse["reason"]}\" {jsonresponse["result"]}: {jsonresponse["message"]}'
+                logger.critical ( criticalmessage ) ; sendmessage ( criticalmessage )
+                holding( False ) ; sys.exit(1)
+
+        except Exception as e :
+            criticalmessage = f'Exception : {e} '
+            logger.critical ( f'Unexpecter error. Unsuccessful bid order submission. {criticalmessage}' )
+            sys.exit(1)
+
+    # Confirm order execution (unless a bid looked up after a timeout filled already).
+    if jsonresponse.get( 'is_live' ) : asyncio.run ( confirmexecution( jsonresponse["order_id"] ) )
 
-# Define the trade cost price and cast it.
-costprice = Decimal( jsonresponse["price"] )
+# Define the trade cost price and cast it (integer ticks).
+costprice = scale.price( jsonresponse["price"] )
 
 # Calculate exit price.
-exitratio = Decimal( 1 + sellinput + geminiapifee )
-exitprice = Decimal( costprice * exitratio ).quantize( tick )
+exitratio = ratio( 1, sellinput, geminiapifee )
+exitprice = costprice.scaled( exitratio )
 
 # Calculate stop price.
-stopratio = Decimal( 1 - stopinput )
-stopprice = Decimal( exitprice * stopratio ).quantize( tick )
+# Stop and sell prices belong to an ask so they are rounded up (never sell for less than intended).
+stopratio = ratio( 1, -stopinput )
+stopprice = exitprice.scaled( stopratio, "ask" )
 
 # Calculate sell price.
-sellratio = Decimal( 1 - sellinput - geminiapifee )
-sellprice = Decimal( exitprice * sellratio ).quantize( tick )
+sellratio = ratio( 1, -sellinput, -geminiapifee )
+sellprice = exitprice.scaled( sellratio, "ask" )
 
 # Calculate quote gain.
-quotegain = Decimal( sellprice * tradesize - costprice * tradesize ).quantize( tick )
-ratiogain = Decimal( 100 * sellprice * tradesize / costprice / tradesize - 100 ).quantize( tick )
+quotegain = Decimal( ( sellprice.decimal() - costprice.decimal() ) * tradesize ).quantize( tick )
+ratiogain = Decimal( 100 * sellprice.decimal() / costprice.decimal() - 100 ).quantize( tick )
 
 # Validate "stop price".
-if stopprice.compare( exitprice ) == 1:
+if stopprice > exitprice :
     # Make sure that the "stop price" is below the purchase price (i.e. "cost price").
     notification = f'The stop order price {stopprice:,.2f} {quotecurrency} cannot exceed the future market price of {exitprice:,.2f} {quotecurrency}. '
     logger.error ( f'{notification}' ) ; sendmessage ( f'{notification}' ) ; sys.exit(1)
@@ -168,7 +279,7 @@ while True : # Block until the price sellers are willing to take exceeds the exi
     try: 
         # Open websocket connection. 
         # Block until out of bid price bounds (work backwards to get previous stop order's sell price).
-        websocketoutput : dict = asyncio.run (  blockpricerange ( currencypair,  str(exitprice), str(-exitprice) ) )
+        websocketoutput : dict = asyncio.run (  blockpricerange ( currencypair,  str(exitprice), str(-exitprice), recorder, [ statistics, candles ], definer.feedconnections, definer.batchwindowms ) )
     except Exception as e:
         # Report exception.
         notification = f'Error : {e} '
@@ -176,158 +287,302 @@ while True : # Block until the price sellers are willing to take exceeds the exi
         time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
         continue # Restart while loop logic.
     else:
-        logger.info ( f'{Decimal( websocketoutput["price"] ).quantize( tick ):,.2f} is out of bounds. ') # Report status.
+        logger.info ( f'{scale.price( websocketoutput["price"] ):,.2f} is out of bounds. ') # Report status.
         break # Break out of the while loop because the subroutine ran successfully.
 
-# Loop.
-while True : # Block until achieving the successful submission of an initial stop limit ask order. 
-        
-    # Submit initial Gemini "stop-limit" order. 
-    # If in doubt about what's going on, refer to documentation here: https://docs.gemini.com/rest-api/#new-order.
-    notification = f'Submitting initial stop-limit (ask) order with a {stopprice:,.2f} {quotecurrency} stop. '
-    notification = notification + f'This stop limit order has a {sellprice:,.2f} {quotecurrency} limit price to '
-    notification = notification + f'sell {longquantity} {assetcurrency}. Resulting in a {ratiogain:,.2f}% gain if executed. '
-    logger.debug ( f'{notification}' ) ; sendmessage ( f'{notification}' )
-    
-    try :    
-        jsonresponse : str = askstoplimit( currencypair, longquantity, str(stopprice), str(sellprice) ).json()
-    except Exception as e :
-        logger.info ( f'Unable to get information on ask stop limit order. Error: {e}' )
-        time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
-        continue # Keep trying to submit ask stop limit order.
-    else :
-        if jsonresponse['is_live'] :
-            logger.info( f'Initial stop limit order {jsonresponse["order_id"]} is live on the Gemini orderbook. ' )
-            break # Break out of the while loop because the subroutine ran successfully.
+if stopmode == 'emulated' :
 
-# Loop.
-while True : # Block until prices rise (then cancel and resubmit stop limit order) or block until a stop limit ask order was "closed". 
+    # Rest a wide disaster stop-limit order (if any) that protects the position should this script stop running.
+    # It never moves, so ratchets below cost no REST calls.
+    disasterinput = Decimal( definer.disasterdiscount ) if definer.disasterdiscount is not None else None
+    if disasterinput is not None and disasterinput.compare( stopinput ) != 1 :
+        logger.warning ( f'The disaster discount {disasterinput*100}% does not exceed the stop discount {stopinput*100}%. No disaster order. ' )
+        disasterinput = None
 
-    # Break out of loop if order "closed".
-    type ( jsonresponse )
-    logger.debug ( f'\n{jsonresponse} ' )
-    if not jsonresponse["is_live"] : break
+    # Loop.
+    while disasterinput is not None : # Block until the disaster stop limit ask order is live.
+        disasterstop = exitprice.scaled( ratio( 1, -disasterinput ), "ask" )
+        disastersell = exitprice.scaled( ratio( 1, -disasterinput - sellinput + stopinput, -geminiapifee ), "ask" )
+        try :
+            with Deadline( definer.stepbudget ) : jsonresponse : str = track( askstoplimit( currencypair, longquantity, str(disasterstop), str(disastersell), position ).json() )
+        except UnconfirmedOrder as e :
+            logger.warning ( f'{e}Looking it up. ' )
+            jsonresponse : dict = track( resolve( e, persist = True ) )
+        except Exception as e :
+            logger.info ( f'Unable to submit the disaster stop limit order. Error: {e}' )
+            time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
+            continue
+        if jsonresponse.get( 'is_live' ) :
+            liveorder = jsonresponse["order_id"]
+            logger.info ( f'Disaster stop limit order {liveorder} ({disasterstop:,.2f} {quotecurrency} stop {disastersell:,.2f} {quotecurrency} sell) is live. ' )
+            break
+        logger.warning ( f'The disaster stop limit order was not booked: {jsonresponse}' )
+        time.sleep(3)
 
-    # Explain upcoming actions.
-    # debugmessage = f'Changing exitratio from {exitratio} to {Decimal( 1 + stopinput + geminiapifee )}. ' ; logger.debug ( debugmessage )
-    # debugmessage = f'Changing exitprice from {exitprice} to {Decimal( exitprice * exitratio ).quantize( tick )}. ' ; logger.debug ( debugmessage )
+    # Lower the exit ratio to lock gains faster (as the exchange mode does before its first wait).
+    exitprice = exitprice.scaled( ratio( 1, stopinput, geminiapifee ) )
 
-    # Lower the exit ratio to lock gains faster.
-    exitratio = Decimal( 1 + stopinput + geminiapifee )
+    # Loop.
+    while True : # Block until ask prices fall below the emulated stop price (ratcheting it locally whenever prices exceed the exit price).
 
-    # Calculate new exit price (block until exitprice exceeded).
-    exitprice = Decimal( exitprice * exitratio ).quantize( tick )
+        logger.info ( f'Emulating a {stopprice:,.2f} {quotecurrency} stop {sellprice:,.2f} {quotecurrency} sell. Next ratchet above {exitprice:,.2f} {quotecurrency}. ' )
+        try :
+            websocketoutput : dict = asyncio.run ( blockpricerange ( currencypair, str(exitprice), str(stopprice), recorder, [ statistics, candles ], definer.feedconnections, definer.batchwindowms ) )
+        except Exception as e :
+            logger.debug ( f'{e} : The websocket connection failed. Let\'s reestablish the connection and try again! ' )
+            time.sleep(3)
+            continue
+        lastprice = scale.price( websocketoutput["price"] )
+        if stopprice > lastprice : break # Triggered.
 
-    # Recalculate quote gain.
-    quotegain = Decimal( sellprice * tradesize - costprice * tradesize ).quantize( tick )
-    ratiogain = Decimal( 100 * sellprice * tradesize / costprice / tradesize - 100 )
+        # Ratchet (the same prices the exchange mode would submit).
+        exitprice = exitprice.scaled( ratio( 1, stopinput, geminiapifee ) )
+        stopoffset = max( stopinput, Decimal( volatilitymultiple ) * Decimal( statistics.volatility( volatilityhorizon ) ) )
+        stopprice = lastprice.scaled( ratio( 1, -stopoffset ), "ask" )
+        sellprice = lastprice.scaled( ratio( 1, -stopoffset - sellinput + stopinput, -geminiapifee ), "ask" )
+
+    logger.info ( f'{lastprice:,.2f} {quotecurrency} breached the emulated {stopprice:,.2f} {quotecurrency} stop. Selling {longquantity} {assetcurrency}. ' )
+    remaining : int = scale.quanta( longquantity )
 
     # Loop.
-    while True : # Block until prices rise (or fall to stop limit order's sell price).
-
-        try : 
-            # Open websocket connection. 
-            # Block until out of bid price bounds (work backwards to get previous stop order's sell price).
-            exitpricestring : str  = str(exitprice)
-            sellpricestring : str  = str(sellprice)
-            websocketoutput : dict = asyncio.run ( blockpricerange ( currencypair, exitpricestring, exitpricestring ) )
+    while liveorder is not None : # Block until the disaster order is cancelled (releasing the balance it holds) or found executed.
+        try :
+            with Deadline( definer.stepbudget ) :
+                jsonresponse : str = cancelorder( liveorder ).json()
+                if not jsonresponse.get( 'is_cancelled' ) : jsonresponse = islive( liveorder ).json()
         except Exception as e :
-            # Report exception.
-            notification = f'The websocket connection failed. '
-            logger.debug ( f'{e} : {notification}Let\'s reestablish the connection and try again! ' )
-            time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
-            continue # Restart while loop logic.
-        else :
-            lastprice = Decimal( websocketoutput["price"] ) # Define last price.
-            messaging = f'{lastprice.quantize( tick ):,.2f} {quotecurrency} is out of bounds. ' ; logger.info ( messaging ) # Report status.
-            break # Break out of the while loop because the subroutine ran successfully.
+            logger.debug ( f'Unable to cancel disaster order {liveorder}. Error: {e}' )
+            time.sleep(3)
+            continue
+        if jsonresponse.get( 'is_live' ) :
+            time.sleep(3)
+            continue
+        remaining -= scale.quanta( jsonresponse.get( 'executed_amount', '0' ) )
+        liveorder = None
 
-    # Check if lower bound breached.
-    # If so, the stop order will "close".
-    if exitprice.compare( lastprice ) == 1 : 
-        logger.debug ( f'Ask prices have fallen below the ask price of the stop limit order {jsonresponse["order_id"]}. ' )
-        logger.debug ( f'The stop order at {sellprice} {quotecurrency} should have been completely filled and now "closed". ' )
-        break # The stop limit order should have been executed.
-    
     # Loop.
-    while True : # Block until existing stop order is cancelled. 
-
-        # Attempt to cancel active and booked stop limit (ask) order.
-        logger.debug ( f'Going to try to cancel stop limit order {jsonresponse["order_id"]}...' )
-
+    while remaining > 0 : # Block until the rest is sold (or resting at the sell price).
         try :
-            jsonresponse : str = cancelorder( jsonresponse["order_id"] ).json() # Post REST API call to cancel previous order.
+            with Deadline( definer.stepbudget ) : jsonresponse : str = track( askimmediate( currencypair, scale.amountstring( remaining ), str(sellprice), position ).json() )
+        except UnconfirmedOrder as e :
+            logger.warning ( f'{e}Looking it up. ' )
+            jsonresponse : dict = track( resolve( e, persist = True ) )
         except Exception as e :
-            logger.debug ( f'Unable to cancel order. Error: {e}' )
-            time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
-            continue # Keep trying to get information on the order's status infinitely.
-        else :
-            logger.debug = f'Cancelled {jsonresponse["price"]} {quotecurrency} stop sell order {jsonresponse["order_id"]}. '
+            logger.debug ( f'Unable to submit the immediate-or-cancel ask order. Error: {e}' )
+            time.sleep(3)
+            continue
+        if 'executed_amount' not in jsonresponse :
+            logger.warning ( f'The immediate-or-cancel ask order was not accepted: {jsonresponse}' )
+            time.sleep(3)
+            continue
+        remaining -= scale.quanta( jsonresponse[ 'executed_amount' ] )
+        if remaining <= 0 : break
+        try :
+            with Deadline( definer.stepbudget ) : jsonresponse : str = track( asklimit( currencypair, scale.amountstring( remaining ), str(sellprice), position ).json() )
+        except UnconfirmedOrder as e :
+            logger.warning ( f'{e}Looking it up. ' )
+            jsonresponse : dict = track( resolve( e, persist = True ) )
+        except Exception as e :
+            logger.debug ( f'Unable to submit the limit ask order. Error: {e}' )
+            time.sleep(3)
+            continue
+        if jsonresponse.get( 'is_live' ) :
+            liveorder = jsonresponse["order_id"]
+            logger.info ( f'The remaining {scale.amountstring( remaining )} {assetcurrency} rests at {sellprice:,.2f} {quotecurrency} (order {liveorder}). ' )
+            asyncio.run ( confirmexecution( liveorder ) )
             break
+        # Not resting: either filled at once or rejected (in which case selling immediately is tried again).
+        if 'executed_amount' in jsonresponse : remaining -= scale.quanta( jsonresponse[ 'executed_amount' ] )
+        else : time.sleep(3)
 
-    # Explain upcoming actions.
-    explanation  = f'\nRecalculate stop and sell pricing based on the last price {lastprice} {quotecurrency}. \n'
-    explanation += f'Changing stopprice from {stopprice} to {Decimal( lastprice * stopratio ).quantize( tick )}. \n'
-    explanation += f'Changing sellprice from {sellprice} to {Decimal( lastprice * sellratio ).quantize( tick )}. \n'
-    logger.info ( explanation )
-    
-    # Calculate new sell/stop prices.
-    stopprice = Decimal( lastprice * stopratio ).quantize( tick )
-    sellprice = Decimal( lastprice * sellratio ).quantize( tick )
-    # Note : "costprice" is no longer the basis of the new exit price (and thus stop and sell prices).
-    # Note : The last transaction price exceeds the previous exit price and creates the new exit price.
+else :
 
     # Loop.
-    while True : # Block until a new stop limit order is submitted. 
-
-        # Post updated stop-limit order.
-        logger.info = f'Submitting stop-limit (ask) order with a {stopprice:,.2f} {quotecurrency} stop {sellprice:,.2f} {quotecurrency} sell. '
-        logger.info = f'There will be an unrealized (i.e. "ratio gain") {ratiogain:,.2f}% profit/loss of {quotegain:,.2f} {quotecurrency} '
-        # sendmessage ( f'Submitting {stopprice:,.2f} {quotecurrency} stop {sellprice:,.2f} {quotecurrency} sell limit order. ' )
-        # sendmessage ( f'That would realize {quotegain:,.2f} {quotecurrency} [i.e. return {ratiogain:,.2f}%]. ' )
-        try:
-            jsonresponse : str = askstoplimit( currencypair, longquantity, str(stopprice), str(sellprice) ).json()
-            """
-                Response format expected:
-                    {
-                        "order_id": "7419662",
-                        "id": "7419662",
-                        "symbol": "btcusd",
-                        "exchange": "gemini",
-                        "avg_execution_price": "0.00",
-                        "side": "buy",
-                        "type": "stop-limit",
-                        "timestamp": "1572378649",
-                        "timestampms": 1572378649018,
-                        "is_live": True,
-                        "is_cancelled": False,
-                        "is_hidden": False,
-                        "was_forced": False,
-                        "executed_amount": "0",
-                        "options": [],
-                        "stop_price": "10400.00",
-                        "price": "10500.00",
-                        "original_amount": "0.01"
-                    }
-            """
-        except Exception as e:
-            logger.debug ( f'Unable to get information on the stop-limit order cancellation request. Error: {e}' )
+    while True : # Block until achieving the successful submission of an initial stop limit ask order. 
+        
+        # Submit initial Gemini "stop-limit" order. 
+        # If in doubt about what's going on, refer to documentation here: https://docs.gemini.com/rest-api/#new-order.
+        notification = f'Submitting initial stop-limit (ask) order with a {stopprice:,.2f} {quotecurrency} stop. '
+        notification = notification + f'This stop limit order has a {sellprice:,.2f} {quotecurrency} limit price to '
+        notification = notification + f'sell {longquantity} {assetcurrency}. Resulting in a {ratiogain:,.2f}% gain if executed. '
+        logger.debug ( f'{notification}' ) ; sendmessage ( f'{notification}' )
+    
+        try :    
+            with Deadline( definer.stepbudget ) : jsonresponse : str = track( askstoplimit( currencypair, longquantity, str(stopprice), str(sellprice), position ).json() )
+        except UnconfirmedOrder as e :
+            # Resubmit only once the order is known not to be live (a duplicate would be orphaned).
+            logger.warning ( f'{e}Looking it up. ' )
+            jsonresponse : dict = track( resolve( e, persist = True ) )
+        except Exception as e :
+            logger.info ( f'Unable to get information on ask stop limit order. Error: {e}' )
             time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
-            continue # Keep trying to post stop limit order infinitely.
-        else:
+            continue # Keep trying to submit ask stop limit order.
+        if jsonresponse.get( 'is_live' ) :
+            liveorder = jsonresponse["order_id"]
+            logger.info( f'Initial stop limit order {jsonresponse["order_id"]} is live on the Gemini orderbook. ' )
+            break # Break out of the while loop because the subroutine ran successfully.
+        logger.warning ( f'The initial stop limit order was not booked: {jsonresponse}' )
+        time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
+
+    # Loop.
+    while True : # Block until prices rise (then cancel and resubmit stop limit order) or block until a stop limit ask order was "closed". 
+
+        # Break out of loop if order "closed".
+        type ( jsonresponse )
+        logger.debug ( f'\n{jsonresponse} ' )
+        if not jsonresponse["is_live"] : break
+
+        # Explain upcoming actions.
+        # debugmessage = f'Changing exitratio from {exitratio} to {Decimal( 1 + stopinput + geminiapifee )}. ' ; logger.debug ( debugmessage )
+        # debugmessage = f'Changing exitprice from {exitprice} to {Decimal( exitprice * exitratio ).quantize( tick )}. ' ; logger.debug ( debugmessage )
+
+        # Lower the exit ratio to lock gains faster.
+        exitratio = ratio( 1, stopinput, geminiapifee )
+
+        # Calculate new exit price (block until exitprice exceeded).
+        exitprice = exitprice.scaled( exitratio )
+
+        # Recalculate quote gain.
+        quotegain = Decimal( ( sellprice.decimal() - costprice.decimal() ) * tradesize ).quantize( tick )
+        ratiogain = Decimal( 100 * sellprice.decimal() / costprice.decimal() - 100 )
+
+        # Loop.
+        while True : # Block until prices rise (or fall to stop limit order's sell price).
+
+            try : 
+                # Open websocket connection. 
+                # Block until out of bid price bounds (work backwards to get previous stop order's sell price).
+                exitpricestring : str  = str(exitprice)
+                sellpricestring : str  = str(sellprice)
+                websocketoutput : dict = asyncio.run ( blockpricerange ( currencypair, exitpricestring, exitpricestring, recorder, [ statistics, candles ], definer.feedconnections, definer.batchwindowms ) )
+            except Exception as e :
+                # Report exception.
+                notification = f'The websocket connection failed. '
+                logger.debug ( f'{e} : {notification}Let\'s reestablish the connection and try again! ' )
+                time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
+                continue # Restart while loop logic.
+            else :
+                lastprice = scale.price( websocketoutput["price"] ) # Define last price.
+                messaging = f'{lastprice:,.2f} {quotecurrency} is out of bounds. ' ; logger.info ( messaging ) # Report status.
+                break # Break out of the while loop because the subroutine ran successfully.
+
+        # Check if lower bound breached.
+        # If so, the stop order will "close".
+        if exitprice > lastprice : 
+            logger.debug ( f'Ask prices have fallen below the ask price of the stop limit order {jsonresponse["order_id"]}. ' )
+            logger.debug ( f'The stop order at {sellprice} {quotecurrency} should have been completely filled and now "closed". ' )
+            break # The stop limit order should have been executed.
+    
+        # Loop.
+        while True : # Block until existing stop order is cancelled. 
+
+            # Attempt to cancel active and booked stop limit (ask) order.
+            logger.debug ( f'Going to try to cancel stop limit order {jsonresponse["order_id"]}...' )
+
+            try :
+                with Deadline( definer.stepbudget ) : jsonresponse : str = cancelorder( jsonresponse["order_id"] ).json() # Post REST API call to cancel previous order.
+            except Exception as e :
+                logger.debug ( f'Unable to cancel order. Error: {e}' )
+                time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
+                continue # Keep trying to get information on the order's status infinitely.
+            else :
+                liveorder = None
+                logger.debug ( f'Cancelled {jsonresponse["price"]} {quotecurrency} stop sell order {jsonresponse["order_id"]}. ' )
+                break
+
+        # Widen the stop (and sell) discounts when the market is volatile.
+        # The sell discount keeps its distance below the stop discount (Gemini requires the stop price to exceed the sell price).
+        stopoffset = max( stopinput, Decimal( volatilitymultiple ) * Decimal( statistics.volatility( volatilityhorizon ) ) )
+        stopratio = ratio( 1, -stopoffset )
+        sellratio = ratio( 1, -stopoffset - sellinput + stopinput, -geminiapifee )
+
+        # Explain upcoming actions.
+        explanation  = f'\nRecalculate stop and sell pricing based on the last price {lastprice} {quotecurrency}. \n'
+        explanation += f'Changing stopprice from {stopprice} to {lastprice.scaled( stopratio, "ask" )}. \n'
+        explanation += f'Changing sellprice from {sellprice} to {lastprice.scaled( sellratio, "ask" )}. \n'
+        logger.info ( explanation )
+    
+        # Calculate new sell/stop prices.
+        stopprice = lastprice.scaled( stopratio, "ask" )
+        sellprice = lastprice.scaled( sellratio, "ask" )
+        # Note : "costprice" is no longer the basis of the new exit price (and thus stop and sell prices).
+        # Note : The last transaction price exceeds the previous exit price and creates the new exit price.
+
+        # Loop.
+        while True : # Block until a new stop limit order is submitted. 
+
+            # Post updated stop-limit order.
+            logger.info ( f'Submitting stop-limit (ask) order with a {stopprice:,.2f} {quotecurrency} stop {sellprice:,.2f} {quotecurrency} sell. ' )
+            logger.info ( f'There will be an unrealized (i.e. "ratio gain") {ratiogain:,.2f}% profit/loss of {quotegain:,.2f} {quotecurrency} ' )
+            # sendmessage ( f'Submitting {stopprice:,.2f} {quotecurrency} stop {sellprice:,.2f} {quotecurrency} sell limit order. ' )
+            # sendmessage ( f'That would realize {quotegain:,.2f} {quotecurrency} [i.e. return {ratiogain:,.2f}%]. ' )
+            try:
+                with Deadline( definer.stepbudget ) : jsonresponse : str = track( askstoplimit( currencypair, longquantity, str(stopprice), str(sellprice), position ).json() )
+                """
+                    Response format expected:
+                        {
+                            "order_id": "7419662",
+                            "id": "7419662",
+                            "symbol": "btcusd",
+                            "exchange": "gemini",
+                            "avg_execution_price": "0.00",
+                            "side": "buy",
+                            "type": "stop-limit",
+                            "timestamp": "1572378649",
+                            "timestampms": 1572378649018,
+                            "is_live": True,
+                            "is_cancelled": False,
+                            "is_hidden": False,
+                            "was_forced": False,
+                            "executed_amount": "0",
+                            "options": [],
+                            "stop_price": "10400.00",
+                            "price": "10500.00",
+                            "original_amount": "0.01"
+                        }
+                """
+            except UnconfirmedOrder as e:
+                # Resubmit only once the order is known not to be live (a duplicate would be orphaned).
+                logger.warning ( f'{e}Looking it up. ' )
+                jsonresponse : dict = track( resolve( e, persist = True ) )
+                if 'order_id' not in jsonresponse : continue
+            except Exception as e:
+                logger.debug ( f'Unable to get information on the stop-limit order cancellation request. Error: {e}' )
+                time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
+                continue # Keep trying to post stop limit order infinitely.
+            if jsonresponse.get( 'is_live' ) : liveorder = jsonresponse["order_id"]
             # logger.info ( f'Submitted {jsonresponse["type"]} {jsonresponse["side"]} order with a {jsonresponse["stop_price"]} {quotecurrency} stop and a {jsonresponse["price"]} {quotecurrency} sell. ' )
             break
 
-# Recalculate quote gain.
-quotegain = Decimal( sellprice * tradesize - costprice * tradesize ).quantize( tick )
-ratiogain = Decimal( 100 * sellprice * tradesize / costprice / tradesize - 100 )
-
-# Report profit/loss.
-clause0 = f'There was a {ratiogain:,.2f}% profit/loss of {quotegain:,.2f} {quotecurrency} '
-clause1 = f'from the sale of {tradesize} {assetcurrency} at {Decimal(sellprice * tradesize):,.2f} {quotecurrency} '
-clause2 = f'which cost {Decimal(costprice * tradesize):,.2f} {quotecurrency} to acquire.'
-message = f'{clause0}{clause1}{clause2}'
+# Book the fills of every order of this position (at the prices, amounts and fees the exchange reports, see ledger.py).
+ledger = Ledger()
+for order in ownorders :
+    for attempt in range( 5 ) :
+        try :
+            with Deadline( definer.stepbudget ) : ledger.bookorder( islive( order, trades = True ).json() )
+            break
+        except Exception as e :
+            logger.debug ( f'Unable to look up the fills of order {order}. Error: {e}' )
+            time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
+    else : logger.warning ( f'The fills of order {order} could not be looked up. They are missing from the profit/loss reported. ' )
+account : dict = ledger.snapshot()[ 'symbols' ].get( currencypair.upper() )
+
+# Report profit/loss (realized net of the fees of both the purchase and the sale).
+if account is None :
+    message = f'No fills of the {len( ownorders )} orders of this position could be looked up. Profit/loss unknown. '
+else :
+    bought, sold = Decimal( account[ 'bought' ] ), Decimal( account[ 'sold' ] )
+    spent, received = Decimal( account[ 'spent' ] ), Decimal( account[ 'received' ] )
+    quotegain = Decimal( account[ 'realized' ] ).quantize( tick )
+    basis = spent * sold / bought if bought else Decimal( 0 ) # The cost of what was sold.
+    ratiogain = Decimal( 100 * quotegain / basis ) if basis else Decimal( 0 )
+    clause0 = f'There was a {ratiogain:,.2f}% profit/loss of {quotegain:,.2f} {quotecurrency} (net of {Decimal( account[ "fees" ] ):,.2f} {quotecurrency} fees) '
+    clause1 = f'from the sale of {sold} {assetcurrency} for {received:,.2f} {quotecurrency} '
+    clause2 = f'which cost {basis:,.2f} {quotecurrency} to acquire.'
+    message = f'{clause0}{clause1}{clause2}'
+    if Decimal( account[ 'quantity' ] ) : message = message + f' {Decimal( account[ "quantity" ] )} {assetcurrency} remains unsold.'
 logger.info ( message ) ; sendmessage ( message )
+logger.info ( f'API key usage: {authenticator.keyusage()}' )
 
 # Let the shell know we successfully made it this far!
-sys.exit(0)
\ No newline at end of file
+holding( False ) ; sys.exit(0)
\ No newline at end of file
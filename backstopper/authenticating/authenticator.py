@@ -5,25 +5,174 @@
 # library created: 20220816
 # library purpose: authenticate payloads for private interations with Gemini API servers.
 
+# Key Pool Outline:
+#  1. credentials.py may define "keys", a list of { 'name', 'key', 'secret' } dictionaries.
+#     Without it, the single credentials.key/credentials.secret pair forms a pool of one.
+#  2. Each key owns its HMAC object (created once and copied per signature), its nonce stream and its rate budget.
+#  3. Payloads are signed by the key pinned to the current position (see "pinkey") or by the next key in round-robin order.
+#  4. The nonce of every payload is assigned by the key that signs it (i.e. strictly increasing per key).
+#     A key should therefore be used by one process at a time. Pin positions to keys when running several bots.
+#     Processes launched by the supervisor or the coordinator are each allocated a key of their own ("allocate"), named in
+#     BACKSTOPPER_APIKEY. Such a process signs everything with that key only ("restrict").
+#  5. Requests beyond a key's budget wait for the budget to refill rather than being rejected by the exchange.
+#  6. Usage per key is counted in the metrics module and summarized by "keyusage".
+
+import os
 import json
+import time
 import base64
 import hmac
+import zlib
 import hashlib
+import threading
+import itertools
+import contextvars
 
+import backstopper.informing.definer as definer
+import backstopper.logging.metrics as metrics
 import backstopper.authenticating.credentials as credentials
 
-def authenticate ( payload ) -> str :
+class ApiKey :
+
+    def __init__ (
+            self,
+            name : str,
+            key : str,
+            secret : str,
+            rate : float,
+            burst : float
+        ) -> None :
+
+        self.name = name
+        self.key = key
+        self.signer = hmac.new( secret.encode(), digestmod = hashlib.sha384 )
+
+        # Nonce stream (milliseconds, bumped when two payloads share a millisecond).
+        self.nonce : int = 0
+
+        # Token bucket rate budget.
+        self.rate = rate
+        self.burst = burst
+        self.tokens : float = burst
+        self.refilled : float = time.monotonic()
+
+        self.requests : int = 0
+        self.throttled : float = 0.0
+        self.lock = threading.Lock()
+
+    def nextnonce ( self ) -> str :
+        with self.lock :
+            self.nonce = max( self.nonce + 1, int( time.time() * 1000 ) )
+            return str( self.nonce )
+
+    def spend ( self ) -> None :
+
+        # Take one request from the budget (waiting for a refill when it is empty).
+        with self.lock :
+            now = time.monotonic()
+            self.tokens = min( self.burst, self.tokens + ( now - self.refilled ) * self.rate )
+            self.refilled = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.requests += 1
+            self.throttled += wait
+
+        metrics.increment( 'authenticator.requests', key = self.name )
+        if wait > 0 :
+            metrics.increment( 'authenticator.throttledseconds', wait, key = self.name )
+            time.sleep( wait )
+
+    def sign (
+            self,
+            b64 : bytes
+        ) -> str :
+        signer = self.signer.copy()
+        signer.update( b64 )
+        return signer.hexdigest()
+
+def loadkeys ( ) -> list :
+
+    # Build the pool from credentials.py.
+    rate = getattr( definer, 'privaterequestrate', 5 )
+    burst = getattr( definer, 'privaterequestburst', 10 )
+    entries = getattr( credentials, 'keys', None ) or [ { 'name': getattr( credentials, 'name', 'default' ), 'key': credentials.key, 'secret': credentials.secret } ]
+    return [ ApiKey( entry.get( 'name', entry[ 'key' ] ), entry[ 'key' ], entry[ 'secret' ], rate, burst ) for entry in entries ]
+
+keys : list = loadkeys()
+pool : list = keys
+rotation = itertools.cycle( pool )
+pinned = contextvars.ContextVar( 'pinned', default = None )
+
+def selectkey (
+        position : str = None
+    ) -> ApiKey :
+
+    # The same position always maps to the same key. Without a position, rotate through the pool.
+    if position is not None : return pool[ zlib.crc32( str( position ).encode() ) % len( pool ) ]
+    return pinned.get() or next( rotation )
+
+def pinkey (
+        position : str
+    ) -> ApiKey :
+
+    # Sign every payload of the current context (a process, a thread or an asyncio task) with the key of a position.
+    apikey = selectkey( position )
+    pinned.set( apikey )
+    return apikey
+
+def restrict (
+        name : str
+    ) -> ApiKey :
+
+    # Sign every payload of this process with one key of the pool (e.g. the key allocated to it).
+    global pool, rotation
+    matches = [ apikey for apikey in keys if apikey.name == name ]
+    if not matches : raise ValueError( f'No API key named "{name}" is listed in credentials.py. ' )
+    pool = matches[ :1 ]
+    rotation = itertools.cycle( pool )
+    return pool[0]
+
+def allocate (
+        count : int,
+        reserved : int = 0
+    ) -> list :
+
+    # Names of the keys of "count" processes (one each), skipping the first "reserved" keys (kept by the caller).
+    names = [ apikey.name for apikey in keys ][ reserved : ]
+    if count > len( names ) :
+        raise ValueError( f'{count} processes need a key each but credentials.py lists {len( names )} {"spare " if reserved else ""}keys. '
+                          f'A key must be used by one process at a time (list more keys of the account in "keys"). ' )
+    return names[ : count ]
+
+def keyusage ( ) -> list :
+
+    # Requests signed and seconds spent waiting for a rate budget, per key.
+    return [ { 'name': apikey.name, 'requests': apikey.requests, 'throttledseconds': round( apikey.throttled, 3 ) } for apikey in pool ]
+
+def authenticate (
+        payload : dict,
+        position : str = None
+    ) -> str :
+
+    # Assign the nonce from the signing key's stream and spend from its rate budget.
+    apikey = selectkey( position )
+    apikey.spend()
+    payload[ 'nonce' ] = apikey.nextnonce()
+
     encodedpayload = json.dumps( payload ).encode()
     b64 = base64.b64encode( encodedpayload )
-    signature = hmac.new( credentials.secret.encode(), b64, hashlib.sha384 ).hexdigest()
+    signature = apikey.sign( b64 )
     apihead = { 'Content-Type': "text/plain",
                 'Content-Length': "0",
-                'X-GEMINI-APIKEY': credentials.key,
+                'X-GEMINI-APIKEY': apikey.key,
                 'X-GEMINI-PAYLOAD': b64,
                 'X-GEMINI-SIGNATURE': signature,
                 'Cache-Control': "no-cache" }
     wsshead = { 'X-GEMINI-PAYLOAD': b64.decode(),
-                'X-GEMINI-APIKEY': credentials.key,
+                'X-GEMINI-APIKEY': apikey.key,
                 'X-GEMINI-SIGNATURE': signature }
 
     return { 'sockheader': wsshead, 'restheader': apihead }
+
+# A process launched with a key allocated to it signs with that key only.
+if os.environ.get( 'BACKSTOPPER_APIKEY' ) : restrict( os.environ[ 'BACKSTOPPER_APIKEY' ] )
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+#
+# library name: controller.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: send commands to a running engine (see engine.py) over its Unix socket.
+
+# Execution:
+#   python3 -m backstopper.controlling.controller open eth-1 ETHUSD 0.0010 0.0100 0.0200
+#   python3 -m backstopper.controlling.controller modify eth-1 0.0150 0.0250
+#   python3 -m backstopper.controlling.controller close eth-1
+#   python3 -m backstopper.controlling.controller list
+#   python3 -m backstopper.controlling.controller pnl
+
+import sys
+import json
+import socket
+
+import backstopper.informing.definer as definer
+
+from backstopper.logging.logger import logger as logger
+
+def sendcommand (
+        request : dict,
+        socketpath : str = None
+    ) -> dict :
+
+    # Send one JSON request and wait for its JSON reply.
+    with socket.socket( socket.AF_UNIX, socket.SOCK_STREAM ) as connection :
+        connection.connect( socketpath or definer.controlsocket )
+        connection.sendall( json.dumps( request ).encode() + b'\n' )
+        reply = connection.makefile( 'rb' ).readline()
+    return json.loads( reply )
+
+if __name__ == "__main__":
+
+    # Set default command in case a BASH wrapper has not been used.
+    arguments = sys.argv[1:] or [ 'list' ]
+    command = arguments[0]
+
+    if command == 'open' and len( arguments ) == 6 :
+        request = { 'command': 'open', 'name': arguments[1], 'pair': arguments[2], 'size': arguments[3], 'stop': arguments[4], 'sell': arguments[5] }
+    elif command == 'modify' and len( arguments ) == 4 :
+        request = { 'command': 'modify', 'name': arguments[1], 'stop': arguments[2], 'sell': arguments[3] }
+    elif command == 'close' and len( arguments ) == 2 :
+        request = { 'command': command, 'name': arguments[1] }
+    elif command in ( 'list', 'pnl', 'shutdown' ) :
+        request = { 'command': command }
+    else :
+        logger.error ( 'Usage: open <name> <pair> <size> <stop> <sell> | modify <name> <stop> <sell> | close <name> | list | pnl | shutdown' )
+        sys.exit(1)
+
+    reply = sendcommand( request )
+    logger.info ( json.dumps( reply, sort_keys = True, indent = 4 ) )
+    if reply[ 'result' ] != 'ok' : sys.exit(1)
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+#
+# library name: coordinator.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: spread the positions of many pairs over several engine processes (one per core) behind one control socket.
+
+# Sharding Outline:
+#  1. Every worker is an engine (see engine.py) in its own process, listening on its own socket (definer.workersocket).
+#     Local workers are launched (and relaunched after exiting) by the coordinator. Workers started elsewhere can "join".
+#  2. Every pair belongs to one worker, chosen by hashing the pair with every worker's name (rendezvous hashing),
+#     so each pair's trades are decoded by one process only and a worker joining or leaving only moves the pairs it wins or held.
+#  3. Rebalancing moves a position by "release" on the worker holding it and "adopt" on its new worker. Live orders stay on the book.
+#     Positions of a worker that died are adopted from their last snapshot (the adopting worker checks the order they had live).
+#     A worker that stops answering is fenced first, so it never acts on positions adopted elsewhere: a local one is killed
+#     (and waited for), one that joined from elsewhere holds a lease (renewed every poll) and its positions only move once
+#     the lease expired and the action it may have had in progress ended (definer.workerlease plus definer.stepbudget seconds).
+#  4. The coordinator accepts the engine's commands on definer.controlsocket (so controller.py works unchanged) and routes them:
+#     "open" by pair, "modify" and "close" by position, "list" and "metrics" from every worker.
+#     It also accepts { "command": "workers" }, { "command": "join", "name": "x", "socket": "/tmp/x.sock" } (no socket launches
+#     another local worker) and { "command": "leave", "name": "x" } (its positions move before it is stopped).
+#  5. Profit/loss is booked centrally: the coordinator keeps its own ledger (see ledger.py) of the account's order events
+#     and marks it with the prices of the worker streaming each pair. Metrics counters are summed over the workers.
+#  6. Worker health, placements and positions are written to definer.coordinatorpath once a second.
+#  7. Every process signs with an API key of its own (see authenticator): the coordinator with the first key listed in credentials.py,
+#     every local worker with one of the next keys (BACKSTOPPER_APIKEY). A coordinator started without enough keys for the
+#     workers asked for refuses to start (the default of one worker per core is capped instead). Workers that join from
+#     elsewhere must sign with keys no other process uses.
+#
+# Execution:
+#   python3 -m backstopper.controlling.coordinator start [workers] [bots.json]   (workers defaults to one per core)
+#   python3 -m backstopper.controlling.coordinator status
+#   python3 -m backstopper.controlling.coordinator join [name socket]
+#   python3 -m backstopper.controlling.coordinator leave name
+#   python3 -m backstopper.controlling.controller open eth-1 ETHUSD 0.0010 0.0100 0.0200   (and every other controller command)
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import hashlib
+import subprocess
+
+import backstopper.informing.definer as definer
+import backstopper.timing.deadline as deadline
+import backstopper.logging.metrics as metrics
+import backstopper.authenticating.authenticator as authenticator
+
+from backstopper.logging.logger import logger as logger
+from backstopper.accounting.ledger import Ledger
+from backstopper.controlling.controller import sendcommand
+from backstopper.supervising.supervisor import packageroot
+
+class Member :
+
+    def __init__ (
+            self,
+            name : str,
+            socketpath : str = None,
+            local : bool = True,
+            apikey : str = None
+        ) -> None :
+
+        self.name = name
+        self.socketpath = socketpath or definer.workersocket.format( name )
+        self.local = local
+        self.apikey = apikey
+        self.process : subprocess.Popen = None
+        # "starting" until it answers, "up" while it owns pairs, "leaving" while its positions move away,
+        # "fencing" while an unresponsive worker is made unable to act, then "gone".
+        self.state : str = 'starting'
+        self.starts : int = 0
+        self.failures : int = 0
+        self.restartat : float = 0.0
+        self.backoff : float = 0.0
+        self.startedat : float = time.monotonic()
+        self.renewedat : float = None
+        self.fenceat : float = None
+        self.retired : bool = False
+
+    def launch (
+            self,
+            command : list
+        ) -> None :
+
+        # Start a local engine on the member's socket (appending its output to its own log file).
+        if os.path.exists( self.socketpath ) : os.remove( self.socketpath )
+        environment = dict( os.environ, BACKSTOPPER_SOCKET = self.socketpath, BACKSTOPPER_APIKEY = self.apikey )
+        with open( definer.workerlog.format( self.name ), 'ab' ) as logfile :
+            self.process = subprocess.Popen( command, cwd = packageroot, env = environment, stdout = logfile,
+                                             stderr = subprocess.STDOUT, start_new_session = True )
+        self.state = 'starting'
+        self.starts += 1
+        self.failures = 0
+        self.startedat = time.monotonic()
+        logger.info ( f'Started worker {self.name} (pid {self.process.pid}, key {self.apikey}) on {self.socketpath}. ' )
+
+    async def fence ( self ) -> None :
+
+        # Kill a local worker and wait for it to exit (it may be hung rather than dead).
+        if self.process is None or self.process.poll() is not None : return
+        self.process.kill()
+        await asyncio.to_thread( self.process.wait )
+
+    async def request (
+            self,
+            request : dict,
+            timeout : float = 60
+        ) :
+
+        # One command on the worker's socket (its reply's data, or ValueError with its error message).
+        reader, writer = await asyncio.wait_for( asyncio.open_unix_connection( self.socketpath ), timeout )
+        try :
+            writer.write( json.dumps( request ).encode() + b'\n' )
+            await writer.drain()
+            reply = json.loads( await asyncio.wait_for( reader.readline(), timeout ) )
+        finally :
+            writer.close()
+        if reply[ 'result' ] != 'ok' : raise ValueError( f'Worker {self.name}: {reply["message"]}' )
+        return reply[ 'data' ]
+
+    def health ( self ) -> dict :
+        return { 'name': self.name, 'socket': self.socketpath, 'local': self.local, 'apikey': self.apikey, 'state': self.state,
+                 'pid': self.process.pid if self.process else None, 'starts': self.starts, 'failures': self.failures,
+                 'uptime': round( time.monotonic() - self.startedat, 1 ) if self.state == 'up' else 0 }
+
+class Coordinator :
+
+    def __init__ (
+            self,
+            workers : int = None,
+            socketpath : str = None,
+            command : list = None,
+            pollinterval : float = 1.0,
+            maxbackoff : float = 60.0
+        ) -> None :
+
+        self.socketpath = socketpath or definer.controlsocket
+        self.workercommand = command or [ sys.executable, '-m', 'backstopper.controlling.engine' ]
+        self.pollinterval = pollinterval
+        self.maxbackoff = maxbackoff
+
+        # The first API key is the coordinator's, the next ones go to local workers (ValueError when there are too few).
+        spare = len( authenticator.keys ) - 1
+        if workers is None and 0 < spare < ( os.cpu_count() or 1 ) :
+            logger.warning ( f'Starting {spare} workers rather than one per core: credentials.py lists {spare} keys besides the coordinator\'s. ' )
+        count = workers or min( os.cpu_count() or 1, max( 1, spare ) )
+        self.apikey = authenticator.keys[0].name
+        self.members : dict = { str( index ): Member( str( index ), apikey = apikey ) for index, apikey in enumerate( authenticator.allocate( count, reserved = 1 ) ) }
+
+        # Worker holding each position and the last snapshot of each position (refreshed every poll).
+        self.placements : dict = {}
+        self.snapshots : dict = {}
+        self.ledger = Ledger()
+
+        # Commands and rebalances are serialized (a position is never routed while it moves).
+        self.lock = asyncio.Lock()
+        self.stopping = None
+
+    # Placement.
+
+    def owner (
+            self,
+            pair : str
+        ) -> Member :
+
+        # The worker with the highest hash of ( worker, pair ) among the workers up.
+        members = [ member for member in self.members.values() if member.state == 'up' ]
+        if not members : return None
+        weight = lambda member : hashlib.sha1( f'{member.name}/{pair.upper()}'.encode() ).digest()
+        return max( members, key = weight )
+
+    async def rebalance ( self ) -> None :
+
+        # Move every position whose pair belongs to another worker (the caller holds the lock).
+        moved = 0
+        for name, holder in list( self.placements.items() ) :
+            snapshot = self.snapshots[ name ]
+            target = self.owner( snapshot[ 'pair' ] )
+            if target is None or target.name == holder : continue
+            source = self.members.get( holder )
+            if source is not None and source.state == 'fencing' : continue
+            try :
+                if source is not None and source.state in ( 'up', 'leaving' ) : snapshot = await source.request( { 'command': 'release', 'name': name } )
+                self.snapshots[ name ] = snapshot
+                self.snapshots[ name ] = await target.request( { 'command': 'adopt', 'name': name, 'snapshot': snapshot } )
+                self.placements[ name ] = target.name
+                moved += 1
+            except Exception as e :
+                logger.warning ( f'Unable to move {name} from worker {holder} to worker {target.name}. Error: {e}' )
+        if moved :
+            metrics.increment( 'coordinator.moves', moved )
+            logger.info ( f'Moved {moved} positions. Pairs per worker: {self.pairs()}' )
+
+    def sparekey ( self ) -> str :
+
+        # A key no local worker uses (those of workers that left for good are free once they exited).
+        used = { member.apikey for member in self.members.values()
+                 if not ( member.retired and ( member.process is None or member.process.poll() is not None ) ) }
+        for name in authenticator.allocate( len( authenticator.keys ) - 1, reserved = 1 ) :
+            if name not in used : return name
+        raise ValueError( f'Every API key is in use. Another local worker needs another key in credentials.py. ' )
+
+    def pairs ( self ) -> dict :
+        pairs = {}
+        for name, holder in self.placements.items() : pairs.setdefault( holder, set() ).add( self.snapshots[ name ][ 'pair' ] )
+        return { holder: sorted( held ) for holder, held in pairs.items() }
+
+    async def join (
+            self,
+            name : str = None,
+            socketpath : str = None
+        ) -> dict :
+
+        # Add a worker (launched here unless it listens on a socket of its own). It receives its pairs once it answers.
+        name = name or str( max( ( int( member ) for member in self.members if member.isdigit() ), default = -1 ) + 1 )
+        if name in self.members and self.members[ name ].state != 'gone' : raise ValueError( f'Worker {name} already joined. ' )
+        member = Member( name, socketpath, local = socketpath is None, apikey = self.sparekey() if socketpath is None else None )
+        self.members[ name ] = member
+        if member.local : member.launch( self.workercommand )
+        return member.health()
+
+    async def leave (
+            self,
+            name : str
+        ) -> dict :
+
+        # Move a worker's positions away, then stop it (for good).
+        member = self.members[ name ]
+        member.state = 'leaving'
+        member.retired = True
+        await self.rebalance()
+        member.state = 'gone'
+        if member.local and member.process is not None and member.process.poll() is None :
+            try : await member.request( { 'command': 'shutdown' }, 5 )
+            except Exception : member.process.terminate()
+        logger.info ( f'Worker {name} left. ' )
+        return member.health()
+
+    # Monitoring.
+
+    async def monitor ( self ) -> None :
+
+        # Relaunch local workers that exited, bring workers that answer up, refresh snapshots and marks.
+        while True :
+            now = time.monotonic()
+            changed = False
+            for member in list( self.members.values() ) :
+                if member.local and not member.retired and member.process is not None and member.state != 'gone' and member.process.poll() is not None :
+                    logger.warning ( f'Worker {member.name} exited with status {member.process.returncode}. Moving its positions. ' )
+                    member.backoff = 1.0 if now - member.startedat > self.maxbackoff or not member.backoff else min( self.maxbackoff, 2 * member.backoff )
+                    member.restartat = now + member.backoff
+                    member.state = 'gone'
+                    changed = True
+                elif member.local and not member.retired and member.state == 'gone' and now >= member.restartat :
+                    member.launch( self.workercommand )
+                elif member.state == 'fencing' and now >= member.fenceat :
+                    logger.warning ( f'Worker {member.name} is fenced. Moving its positions. ' )
+                    member.state = 'gone'
+                    changed = True
+                elif member.state in ( 'starting', 'up' ) :
+                    try :
+                        listing = await member.request( { 'command': 'list' }, 5 )
+                        pnl = await member.request( { 'command': 'pnl' }, 5 )
+                    except Exception as e :
+                        member.failures += 1
+                        if member.state == 'up' and member.failures >= 3 :
+                            # Fence it before anything it holds is adopted elsewhere.
+                            member.state = 'fencing'
+                            if member.local :
+                                # Once it exited, the next poll moves its positions and schedules its relaunch.
+                                logger.warning ( f'Worker {member.name} stopped answering ({e}). Killing it. ' )
+                                await member.fence()
+                                member.fenceat = now
+                            else :
+                                member.fenceat = ( member.renewedat or member.startedat ) + definer.workerlease + definer.stepbudget
+                                logger.warning ( f'Worker {member.name} stopped answering ({e}). Moving its positions once its lease expires '
+                                                 f'(in {max( 0.0, member.fenceat - now ):,.0f} seconds). ' )
+                        continue
+                    member.failures = 0
+                    if member.state == 'starting' :
+                        member.state = 'up'
+                        changed = True
+                    for name, snapshot in listing.items() :
+                        if self.placements.get( name ) == member.name : self.snapshots[ name ] = snapshot
+                    for symbol, account in pnl[ 'symbols' ].items() :
+                        if account[ 'mark' ] is not None and self.owner( symbol ) is member : self.ledger.mark( symbol, account[ 'mark' ] )
+            if changed :
+                async with self.lock : await self.rebalance()
+            metrics.setgauge( 'coordinator.workers', sum( member.state == 'up' for member in self.members.values() ) )
+            self.writestatus()
+            await asyncio.sleep( self.pollinterval )
+
+    async def renew ( self ) -> None :
+
+        # Renew the leases of workers that joined from elsewhere (apart from "monitor", so a hung worker never delays them).
+        # A lease is renewed as of its reply, which the worker received earlier (so "fenceat" never precedes its expiry).
+        async def renewal ( member : Member ) -> None :
+            try :
+                await member.request( { 'command': 'lease', 'seconds': definer.workerlease }, definer.workerlease / 3 )
+                member.renewedat = time.monotonic()
+            except Exception as e :
+                logger.debug ( f'Unable to renew the lease of worker {member.name}. Error: {e}' )
+
+        while True :
+            members = [ member for member in self.members.values() if not member.local and member.state in ( 'starting', 'up', 'leaving' ) ]
+            await asyncio.gather( *[ renewal( member ) for member in members ] )
+            await asyncio.sleep( self.pollinterval )
+
+    async def orderevents ( self ) -> None :
+
+        # Fills of the account booked centrally (every worker also receives them, for its own positions).
+        connection = definer.sockserver + '/v1/order/events?eventTypeFilter=fill'
+        while True :
+            try :
+                header = authenticator.authenticate( { 'request': '/v1/order/events' } )
+                async with await deadline.connect( connection, extra_headers = header[ 'sockheader' ] ) as websocket :
+                    while True :
+                        dictionary = json.loads( await deadline.recv( websocket ) )
+                        if not isinstance( dictionary, list ) : continue
+                        for event in dictionary : self.ledger.record( event )
+            except asyncio.CancelledError :
+                raise
+            except Exception as e :
+                logger.debug ( f'{e} : The order events connection failed. Let\'s reestablish the connection and try again! ' )
+                await asyncio.sleep( 3 )
+
+    def status ( self ) -> dict :
+        return { 'pid': os.getpid(), 'updated': time.time(), 'workers': [ member.health() for member in self.members.values() ],
+                 'pairs': self.pairs(), 'positions': dict( self.placements ) }
+
+    def writestatus ( self ) -> None :
+        try :
+            with open( definer.coordinatorpath + '.tmp', 'w' ) as file : json.dump( self.status(), file )
+            os.replace( definer.coordinatorpath + '.tmp', definer.coordinatorpath )
+        except OSError as e :
+            logger.warning ( f'Unable to write coordinator status. Error: {e}' )
+
+    # Control.
+
+    async def command (
+            self,
+            request : dict
+        ) -> dict :
+        command = request.get( 'command' )
+
+        if command == 'open' :
+            async with self.lock :
+                member = self.owner( request[ 'pair' ] )
+                if member is None : raise ValueError( 'No worker is up. ' )
+                if self.placements.get( request[ 'name' ] ) not in ( None, member.name ) and self.snapshots[ request[ 'name' ] ][ 'state' ] != 'closed' :
+                    raise ValueError( f'Position {request["name"]} is already open. ' )
+                snapshot = await member.request( request )
+                self.placements[ request[ 'name' ] ] = member.name
+                self.snapshots[ request[ 'name' ] ] = snapshot
+                return snapshot
+
+        if command in ( 'modify', 'close' ) :
+            async with self.lock :
+                member = self.members[ self.placements[ request[ 'name' ] ] ]
+                self.snapshots[ request[ 'name' ] ] = await member.request( request )
+                return self.snapshots[ request[ 'name' ] ]
+
+        if command == 'list' : return dict( self.snapshots )
+        if command == 'pnl' : return self.ledger.snapshot()
+
+        if command == 'metrics' :
+            # Counters summed over the workers (each worker's own snapshot is included as well).
+            workers = {}
+            for member in self.members.values() :
+                if member.state != 'up' : continue
+                try : workers[ member.name ] = await member.request( request, 5 )
+                except Exception as e : logger.warning ( f'Unable to collect metrics from worker {member.name}. Error: {e}' )
+            counters = {}
+            for snapshot in workers.values() :
+                for name, value in snapshot[ 'counters' ].items() : counters[ name ] = counters.get( name, 0 ) + value
+            return { 'counters': counters, 'coordinator': metrics.snapshot(), 'workers': workers }
+
+        if command == 'workers' : return self.status()
+        if command == 'join' :
+            async with self.lock : return await self.join( request.get( 'name' ), request.get( 'socket' ) )
+        if command == 'leave' :
+            async with self.lock : return await self.leave( request[ 'name' ] )
+        if command == 'shutdown' :
+            self.stopping.set()
+            return {}
+        raise ValueError( f'Unknown command "{command}". ' )
+
+    async def control (
+            self,
+            reader : asyncio.StreamReader,
+            writer : asyncio.StreamWriter
+        ) -> None :
+
+        # One JSON request per line. Each gets one JSON reply per line (like engine.py).
+        try :
+            while line := await reader.readline() :
+                try :
+                    reply = { 'result': 'ok', 'data': await self.command( json.loads( line ) ) }
+                except Exception as e :
+                    reply = { 'result': 'error', 'message': f'{type( e ).__name__}: {e}' }
+                writer.write( json.dumps( reply ).encode() + b'\n' )
+                await writer.drain()
+        finally :
+            writer.close()
+
+    async def run (
+            self,
+            bots : list = (),
+            startup : float = 30.0
+        ) -> None :
+
+        self.stopping = asyncio.Event()
+        authenticator.restrict( self.apikey )
+        loop = asyncio.get_running_loop()
+        for signum in ( signal.SIGTERM, signal.SIGINT ) : loop.add_signal_handler( signum, self.stopping.set )
+        for member in self.members.values() : member.launch( self.workercommand )
+        if os.path.exists( self.socketpath ) : os.remove( self.socketpath )
+        server = await asyncio.start_unix_server( self.control, path = self.socketpath )
+        monitor = asyncio.create_task( self.monitor() )
+        leases = asyncio.create_task( self.renew() )
+        events = asyncio.create_task( self.orderevents() )
+        logger.info ( f'Coordinating {len( self.members )} workers. Accepting commands on {self.socketpath}. ' )
+
+        # Open the positions listed once every worker answers (or after "startup" seconds).
+        startedat = time.monotonic()
+        while bots and time.monotonic() - startedat < startup and any( member.state == 'starting' for member in self.members.values() ) :
+            await asyncio.sleep( 0.2 )
+        for index, bot in enumerate( bots ) :
+            request = dict( bot, command = 'open', name = bot.get( 'name' ) or f'{bot["pair"].lower()}-{index}' )
+            try : await self.command( request )
+            except Exception as e : logger.error ( f'Unable to open {bot}. Error: {e}' )
+
+        try :
+            await self.stopping.wait()
+        finally :
+            server.close()
+            monitor.cancel()
+            leases.cancel()
+            events.cancel()
+            # Workers leave their live orders on the book (like engines shutting down).
+            for member in self.members.values() :
+                if not member.local or member.process is None or member.process.poll() is not None : continue
+                try : await member.request( { 'command': 'shutdown' }, 5 )
+                except Exception : member.process.terminate()
+            for member in self.members.values() :
+                if member.process is None : continue
+                try : member.process.wait( 10 )
+                except subprocess.TimeoutExpired : member.process.kill()
+            self.writestatus()
+            if os.path.exists( self.socketpath ) : os.remove( self.socketpath )
+
+if __name__ == "__main__":
+
+    # Set default action in case a BASH wrapper has not been used.
+    action = sys.argv[1] if len( sys.argv ) > 1 else 'status'
+
+    if action == 'start' :
+        workers = int( sys.argv[2] ) if len( sys.argv ) > 2 else None
+        bots : list = []
+        if len( sys.argv ) > 3 :
+            with open( sys.argv[3] ) as file : bots = json.load( file )
+        try : coordinator = Coordinator( workers )
+        except ValueError as e :
+            logger.error ( f'Unable to start the workers. {e}' )
+            sys.exit(1)
+        asyncio.run( coordinator.run( bots ) )
+
+    elif action == 'status' :
+        with open( definer.coordinatorpath ) as file : status = json.load( file )
+        pairs = status[ 'pairs' ]
+        for worker in status[ 'workers' ] :
+            logger.info ( f'[coordinator {status["pid"]}] worker {worker["name"]:<4} {worker["state"]:<8} pid {worker["pid"]} '
+                          f'starts {worker["starts"]} uptime {worker["uptime"]}s pairs {" ".join( pairs.get( worker["name"], [] ) )}' )
+
+    elif action in ( 'join', 'leave' ) :
+        request = { 'command': action }
+        if len( sys.argv ) > 2 : request[ 'name' ] = sys.argv[2]
+        if len( sys.argv ) > 3 : request[ 'socket' ] = sys.argv[3]
+        reply = sendcommand( request )
+        logger.info ( json.dumps( reply, sort_keys = True, indent = 4 ) )
+        if reply[ 'result' ] != 'ok' : sys.exit(1)
+
+    else :
+        logger.error ( f'Unknown action "{action}". Use start, status, join or leave. ' )
+        sys.exit(1)
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+#
+# library name: engine.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: trail many positions in one long-running process that accepts commands while it runs.
+
+# Engine Outline:
+#  1. Every position is a Trailer (see trailer.py) keyed by name.
+#  2. One market data connection per pair (see marketfeed.py) feeds a TriggerIndex holding the bounds of every position in that pair.
+#     Connections open with the first position in a pair and close with the last one.
+#  3. One order events connection reports closed orders (fills and cancellations) for every position.
+#     Its fills are also booked into a ledger (see ledger.py) that the trade stream marks to market.
+#     Its bookings, fills and closings also keep the balance cache current (see balancecache.py), so orders without funds never leave.
+#  4. Orders are placed and cancelled through a Gateway in worker threads, so feeds keep flowing during REST calls.
+#     Actions of a position are serialized by its lock. Failed actions are retried a bounded number of times without holding it.
+#     An order submitted without a response is looked up by its client order id before the position does anything else.
+#  5. Commands arrive as JSON lines on a Unix socket (see controller.py) and take effect immediately:
+#       { "command": "open", "name": "eth-1", "pair": "ETHUSD", "size": "0.001", "stop": "0.01", "sell": "0.02" }
+#       { "command": "modify", "name": "eth-1", "stop": "0.015", "sell": "0.025" }
+#       { "command": "close", "name": "eth-1" }
+#       { "command": "list" }
+#       { "command": "pnl" }
+#       { "command": "metrics" }
+#  6. Positions can move between engines (see coordinator.py) without touching their live orders:
+#       { "command": "release", "name": "eth-1" }                   (forget the position and reply with its snapshot)
+#       { "command": "adopt", "name": "eth-1", "snapshot": {...} }  (resume it, first checking the order it had live)
+#       { "command": "lease", "seconds": 30 }                       (release every position unless renewed in time)
+#     Engines running elsewhere get a lease from the coordinator, which adopts their positions only once it expired.
+#
+# Execution:
+#   python3 -m backstopper.controlling.engine [bots.json]   (optionally opening the positions listed, see examples/example-bots.json)
+#   BACKSTOPPER_SOCKET=/tmp/backstopper-worker-0.sock python3 -m backstopper.controlling.engine   (accepting commands on another socket)
+
+import os
+import sys
+import json
+import asyncio
+
+import backstopper.informing.definer as definer
+import backstopper.informing.feeschedule as feeschedule
+import backstopper.timing.deadline as deadline
+import backstopper.logging.metrics as metrics
+import backstopper.authenticating.authenticator as authenticator
+import backstopper.accounting.balancecache as balancecache
+
+from backstopper.logging.logger import logger as logger
+from backstopper.ordering.gateway import Gateway
+from backstopper.ordering.ordermanager import UnconfirmedOrder
+from backstopper.accounting.ledger import Ledger
+from backstopper.controlling.trailer import Trailer, restore
+from backstopper.monitoring.marketfeed import MarketFeed, TradeBatch
+from backstopper.monitoring.triggerindex import TriggerIndex
+from backstopper.pricing.quantizer import tickscale
+from backstopper.timing.deadline import Deadline
+
+class Position :
+
+    def __init__ (
+            self,
+            name : str,
+            trailer : Trailer
+        ) -> None :
+        self.name = name
+        self.trailer = trailer
+        self.lock = asyncio.Lock()
+        self.released : bool = False
+        # The action and the UnconfirmedOrder of a submission without a response (until "advance" looks it up).
+        self.unconfirmed : tuple = None
+
+class Engine :
+
+    def __init__ (
+            self,
+            gateway : Gateway = None,
+            socketpath : str = None
+        ) -> None :
+
+        self.gateway = gateway or Gateway()
+        self.socketpath = socketpath or definer.controlsocket
+
+        self.positions : dict = {}
+        self.indexes : dict = {}
+        self.feeds : dict = {}
+        self.marketfeeds : dict = {}
+        self.orders : dict = {}
+        self.unmatched : dict = {}
+        self.ledger = Ledger()
+
+        self.leaseuntil : float = None
+        self.watchdog : asyncio.Task = None
+        self.stopping = None
+
+    # Positions.
+
+    async def open (
+            self,
+            name : str,
+            pair : str,
+            size : str,
+            stop : str,
+            sell : str
+        ) -> dict :
+
+        if name in self.positions and self.positions[ name ].trailer.state != 'closed' :
+            raise ValueError( f'Position {name} is already open. ' )
+        # The fee in force when the position opens (the fee schedule never blocks on the REST API).
+        fee = await asyncio.to_thread( self.gateway.fee )
+        position = Position( name, Trailer( pair, size, stop, sell, fee ) )
+        self.positions[ name ] = position
+        self.startfeed( position.trailer.pair )
+
+        async with position.lock :
+            try :
+                with Deadline( definer.stepbudget ) : response = await asyncio.to_thread( self.gateway.buy, position.trailer.pair, size, name )
+            except UnconfirmedOrder as e :
+                logger.warning ( f'{name} bid order got no response. {e}' )
+                position.unconfirmed = ( ( 'buy', ), e )
+            else :
+                if response.get( 'is_cancelled' ) or 'order_id' not in response :
+                    position.trailer.state = 'closed'
+                    self.arm( position )
+                    raise ValueError( f'Bid order for {name} was not booked: {response}' )
+                position.trailer.order = response[ 'order_id' ]
+                self.track( response[ 'order_id' ], name )
+                logger.info ( f'Opened {name}: bid order {response["order_id"]} for {response["remaining_amount"]} at {response["price"]}. ' )
+
+        # A bid without a response is looked up before the position does anything else.
+        if position.unconfirmed is not None : await self.advance( position )
+        return position.trailer.snapshot()
+
+    async def modify (
+            self,
+            name : str,
+            stop : str = None,
+            sell : str = None
+        ) -> dict :
+        position = self.positions[ name ]
+        async with position.lock : position.trailer.modify( stop, sell )
+        await self.advance( position )
+        return position.trailer.snapshot()
+
+    async def close (
+            self,
+            name : str
+        ) -> dict :
+        position = self.positions[ name ]
+        async with position.lock : position.trailer.close()
+        await self.advance( position )
+        return position.trailer.snapshot()
+
+    async def release (
+            self,
+            name : str
+        ) -> dict :
+
+        # Forget a position (leaving its live order alone) once its current action is done. Pending actions are dropped.
+        position = self.positions[ name ]
+        if position.unconfirmed is not None : raise ValueError( f'{name} has an order without a response. Try again once it is looked up. ' )
+        async with position.lock :
+            position.released = True
+            del self.positions[ name ]
+            for order in [ order for order, owner in self.orders.items() if owner == name ] : del self.orders[ order ]
+            index = self.indexes.get( position.trailer.pair )
+            if index is not None :
+                index.removetrigger( name )
+                self.gate( position.trailer.pair )
+            if not any( other.trailer.pair == position.trailer.pair and other.trailer.state != 'closed' for other in self.positions.values() ) :
+                self.stopfeed( position.trailer.pair )
+        logger.info ( f'Released {name} ({position.trailer.state}, order {position.trailer.order}). ' )
+        return position.trailer.snapshot()
+
+    async def adopt (
+            self,
+            name : str,
+            snapshot : dict
+        ) -> dict :
+
+        # Resume a position released by another engine (or left behind by one that died).
+        if name in self.positions and self.positions[ name ].trailer.state != 'closed' :
+            raise ValueError( f'Position {name} is already open. ' )
+        position = Position( name, restore( snapshot ) )
+        trailer = position.trailer
+        self.positions[ name ] = position
+        if trailer.state != 'closed' : self.startfeed( trailer.pair )
+
+        # The order may have closed (or been replaced by an engine that died before reporting it) while nobody was watching.
+        if trailer.order is not None :
+            async with position.lock :
+                try :
+                    with Deadline( definer.stepbudget ) : response = await asyncio.to_thread( self.gateway.status, trailer.order )
+                    if response.get( 'order_id' ) == trailer.order and not response.get( 'is_live' ) :
+                        with Deadline( definer.stepbudget ) : live = ( await asyncio.to_thread( self.gateway.orders ) )[ 'tags' ].get( name, [] )
+                        if live and response.get( 'is_cancelled' ) :
+                            logger.warning ( f'{name} order {trailer.order} was replaced by order {live[-1]} before the handover. Trailing it. ' )
+                            trailer.order = live[-1]
+                        else :
+                            trailer.closedorder( response )
+                except Exception as e :
+                    logger.warning ( f'{name} could not check order {trailer.order} after the handover. Error: {e}' )
+            if trailer.order is not None : self.track( trailer.order, name )
+        logger.info ( f'Adopted {name} ({trailer.state}, order {trailer.order}). ' )
+        await self.advance( position )
+        return trailer.snapshot()
+
+    async def lease (
+            self,
+            seconds : float
+        ) -> dict :
+
+        # Keep trailing for "seconds" more (the coordinator renews the lease every poll).
+        self.leaseuntil = asyncio.get_running_loop().time() + seconds
+        if self.watchdog is None or self.watchdog.done() : self.watchdog = asyncio.create_task( self.watch() )
+        return { 'positions': len( self.positions ) }
+
+    async def watch ( self ) -> None :
+
+        # Release every position once the lease expires (the coordinator is about to have them adopted elsewhere).
+        loop = asyncio.get_running_loop()
+        while loop.time() < self.leaseuntil : await asyncio.sleep( self.leaseuntil - loop.time() )
+        logger.error ( f'The lease expired. Releasing {len( self.positions )} positions (their orders stay on the book). ' )
+        # Actions in progress end with their current REST call.
+        for position in self.positions.values() : position.released = True
+        for name in list( self.positions ) : await self.release( name )
+
+    async def advance (
+            self,
+            position : Position
+        ) -> None :
+
+        # Perform the actions the trailer asks for then re-arm its triggers.
+        # A failed action is retried every 3 seconds (without holding the lock, so commands and events get through meanwhile)
+        # at most "definer.actionattempts" times. The position then waits for a command (e.g. modify or close).
+        failures = 0
+        while True :
+            async with position.lock :
+                if position.released : return
+                trailer = position.trailer
+                failed = False
+                while not position.released :
+                    # An order submitted without a response is looked up first (its status stands in for the response).
+                    action = ( 'resolve', ) if position.unconfirmed is not None else trailer.next()
+                    if action is None : break
+                    try :
+                        # Every REST call of the action shares one budget (see deadline.py).
+                        with Deadline( definer.stepbudget ) :
+                            if action[0] == 'resolve' : response = await asyncio.to_thread( self.gateway.resolve, position.unconfirmed[1] )
+                            elif action[0] == 'place' : response = await asyncio.to_thread( self.gateway.placestop, *action[ 1: ], position.name )
+                            elif action[0] == 'sell' : response = await asyncio.to_thread( self.gateway.sell, *action[ 1: ], position.name )
+                            else : response = await asyncio.to_thread( self.gateway.cancel, action[1] )
+                    except UnconfirmedOrder as e :
+                        logger.warning ( f'{position.name} could not confirm an order. {e}' )
+                        position.unconfirmed = ( action, e )
+                        failed = True
+                        break
+                    except Exception as e :
+                        logger.warning ( f'{position.name} could not {action[0]} an order. Error: {e}' )
+                        failed = True
+                        break
+                    previous = trailer.order
+                    if action[0] == 'resolve' :
+                        action, position.unconfirmed = position.unconfirmed[0], None
+                        confirmed = trailer.resolved( action, response )
+                    else : confirmed = trailer.confirm( action, response )
+                    if not confirmed :
+                        failed = True
+                        break
+                    if previous != trailer.order : self.orders.pop( previous, None )
+                    if trailer.order is not None : self.track( trailer.order, position.name )
+                self.arm( position )
+                if not failed : return
+                failures += 1
+                if failures >= definer.actionattempts :
+                    logger.error ( f'{position.name} could not {action[0]} an order after {failures} attempts. It waits for a command ({trailer.state}). ' )
+                    return
+            await asyncio.sleep( 3 ) # Since we are interfacing with a rate limited Gemini REST API.
+
+    def arm (
+            self,
+            position : Position
+        ) -> None :
+        trailer = position.trailer
+        index = self.indexes.get( trailer.pair )
+        if index is None : return
+        upper, lower = trailer.bounds()
+        if upper is None and lower is None : index.removetrigger( position.name )
+        else : index.settrigger( position.name, upper, lower )
+        self.gate( trailer.pair )
+        if trailer.state == 'closed' and not any( other.trailer.pair == trailer.pair and other.trailer.state != 'closed'
+                                                  for other in self.positions.values() ) :
+            self.stopfeed( trailer.pair )
+
+    # Market data.
+
+    def startfeed (
+            self,
+            pair : str
+        ) -> None :
+        if pair in self.feeds : return
+        self.indexes[ pair ] = TriggerIndex()
+        self.feeds[ pair ] = asyncio.create_task( self.feed( pair ) )
+
+    def stopfeed (
+            self,
+            pair : str
+        ) -> None :
+        task = self.feeds.pop( pair, None )
+        self.indexes.pop( pair, None )
+        if task is not None : task.cancel()
+
+    async def feed (
+            self,
+            pair : str
+        ) -> None :
+
+        # Trades of one pair (reconnecting whenever the connection drops).
+        # The feed drops trades between the nearest armed bounds before decoding them (see "gate").
+        # Triggers are checked once per batch against its highest bid and lowest ask taken (the only trades able to fire one).
+        while True :
+            try :
+                async with MarketFeed( pair, connections = definer.feedconnections ) as marketfeed :
+                    self.marketfeeds[ pair ] = marketfeed
+                    self.gate( pair )
+                    logger.info ( f'Streaming {pair} trades. ' )
+                    async for batch in marketfeed.batches( definer.batchwindowms ) : self.onbatch( pair, batch )
+            except asyncio.CancelledError :
+                raise
+            except Exception as e :
+                logger.debug ( f'{e} : The {pair} market data connection failed. Let\'s reestablish the connection and try again! ' )
+                await asyncio.sleep( 3 )
+            finally :
+                self.marketfeeds.pop( pair, None )
+
+    def onbatch (
+            self,
+            pair : str,
+            batch : TradeBatch
+        ) -> None :
+
+        # Gated feeds only deliver trades beyond the nearest armed bounds, so marks lag inside them.
+        self.ledger.mark( pair, tickscale( pair ).pricestring( batch.last ) )
+        index = self.indexes.get( pair )
+        if index is None : return
+        fired = []
+        if batch.highbid is not None : fired += [ ( trigger, batch.highbid ) for trigger in index.firetriggers( batch.highbid, 'bid' ) ]
+        if batch.lowask is not None : fired += [ ( trigger, batch.lowask ) for trigger in index.firetriggers( batch.lowask, 'ask' ) ]
+        handled = set()
+        for ( name, side, bound ), ticks in fired :
+            position = self.positions.get( name )
+            if position is None or name in handled : continue
+            handled.add( name )
+            # Disarm the other side as well. "advance" re-arms the position once its actions are done.
+            index.removetrigger( name )
+            position.trailer.breached( side, ticks )
+            asyncio.create_task( self.advance( position ) )
+        self.gate( pair )
+
+    def gate (
+            self,
+            pair : str
+        ) -> None :
+
+        # Only trades beyond the nearest armed bounds of a pair can fire a trigger.
+        marketfeed = self.marketfeeds.get( pair )
+        index = self.indexes.get( pair )
+        if marketfeed is None or index is None : return
+        upper, lower = index.nearest()
+        if upper is None and lower is None :
+            # Nothing armed (e.g. every position is placing an order). Drop every trade until something is.
+            marketfeed.setgate( float( '-inf' ), float( 'inf' ) )
+            return
+        scale = tickscale( pair )
+        marketfeed.setgate( scale.pricestring( lower ) if lower is not None else None, scale.pricestring( upper ) if upper is not None else None )
+
+    # Order events.
+
+    async def orderevents ( self ) -> None :
+
+        # Bookings, fills and closed orders of the account (reconnecting whenever the connection drops).
+        connection = definer.sockserver + '/v1/order/events?eventTypeFilter=booked&eventTypeFilter=closed&eventTypeFilter=fill'
+        while True :
+            try :
+                header = authenticator.authenticate( { 'request': '/v1/order/events' } )
+                async with await deadline.connect( connection, extra_headers = header[ 'sockheader' ] ) as websocket :
+                    while True :
+                        message = await deadline.recv( websocket )
+                        dictionary = json.loads( message )
+                        if not isinstance( dictionary, list ) : continue
+                        for event in dictionary : self.onorderevent( event )
+            except asyncio.CancelledError :
+                raise
+            except Exception as e :
+                logger.debug ( f'{e} : The order events connection failed. Let\'s reestablish the connection and try again! ' )
+                await asyncio.sleep( 3 )
+
+    def onorderevent (
+            self,
+            event : dict
+        ) -> None :
+        balancecache.record( event )
+        if self.ledger.record( event ) or event.get( 'type' ) != 'closed' : return
+        name = self.orders.pop( event.get( 'order_id' ), None )
+        if name is None :
+            # Kept by order id: an order can close before the REST response booking it arrives (see "track").
+            self.unmatched[ event.get( 'order_id' ) ] = event
+            while len( self.unmatched ) > 256 : self.unmatched.pop( next( iter( self.unmatched ) ) )
+            return
+        asyncio.create_task( self.closed( self.positions[ name ], event ) )
+
+    def track (
+            self,
+            order : str,
+            name : str
+        ) -> None :
+
+        # Attribute an order to a position (delivering its closed event at once when it already arrived).
+        event = self.unmatched.pop( order, None )
+        if event is None : self.orders[ order ] = name
+        else : asyncio.create_task( self.closed( self.positions[ name ], event ) )
+
+    async def closed (
+            self,
+            position : Position,
+            event : dict
+        ) -> None :
+        async with position.lock :
+            if position.released : return
+            position.trailer.closedorder( event )
+        await self.advance( position )
+
+    # Control.
+
+    async def command (
+            self,
+            request : dict
+        ) -> dict :
+        command = request.get( 'command' )
+        if command == 'open' : return await self.open( request[ 'name' ], request[ 'pair' ], request[ 'size' ], request[ 'stop' ], request[ 'sell' ] )
+        if command == 'modify' : return await self.modify( request[ 'name' ], request.get( 'stop' ), request.get( 'sell' ) )
+        if command == 'close' : return await self.close( request[ 'name' ] )
+        if command == 'list' : return { name: position.trailer.snapshot() for name, position in self.positions.items() }
+        if command == 'pnl' : return self.ledger.snapshot()
+        if command == 'metrics' : return metrics.snapshot()
+        if command == 'release' : return await self.release( request[ 'name' ] )
+        if command == 'adopt' : return await self.adopt( request[ 'name' ], request[ 'snapshot' ] )
+        if command == 'lease' : return await self.lease( float( request[ 'seconds' ] ) )
+        if command == 'shutdown' :
+            self.stopping.set()
+            return {}
+        raise ValueError( f'Unknown command "{command}". ' )
+
+    async def control (
+            self,
+            reader : asyncio.StreamReader,
+            writer : asyncio.StreamWriter
+        ) -> None :
+
+        # One JSON request per line. Each gets one JSON reply per line.
+        try :
+            while line := await reader.readline() :
+                try :
+                    reply = { 'result': 'ok', 'data': await self.command( json.loads( line ) ) }
+                except Exception as e :
+                    reply = { 'result': 'error', 'message': f'{type( e ).__name__}: {e}' }
+                writer.write( json.dumps( reply ).encode() + b'\n' )
+                await writer.drain()
+        finally :
+            writer.close()
+
+    async def run (
+            self,
+            bots : list = ()
+        ) -> None :
+
+        self.stopping = asyncio.Event()
+        if os.path.exists( self.socketpath ) : os.remove( self.socketpath )
+        server = await asyncio.start_unix_server( self.control, path = self.socketpath )
+        events = asyncio.create_task( self.orderevents() )
+        feeschedule.start()
+        balancecache.start()
+        logger.info ( f'Accepting commands on {self.socketpath}. ' )
+
+        for index, bot in enumerate( bots ) :
+            try : await self.open( bot.get( 'name' ) or f'{bot["pair"].lower()}-{index}', bot[ 'pair' ], bot[ 'size' ], bot[ 'stop' ], bot[ 'sell' ] )
+            except Exception as e : logger.error ( f'Unable to open {bot}. Error: {e}' )
+
+        try :
+            await self.stopping.wait()
+        finally :
+            server.close()
+            events.cancel()
+            for pair in list( self.feeds ) : self.stopfeed( pair )
+            if os.path.exists( self.socketpath ) : os.remove( self.socketpath )
+
+if __name__ == "__main__":
+
+    # Optionally open the positions listed in a JSON file.
+    bots : list = []
+    if len( sys.argv ) == 2 :
+        with open( sys.argv[1] ) as file : bots = json.load( file )
+
+    try :
+        asyncio.run( Engine( socketpath = os.environ.get( 'BACKSTOPPER_SOCKET' ) ).run( bots ) )
+    except KeyboardInterrupt : pass
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+#
+# library name: trailer.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: hold the trailing stop logic of app.py as a state machine that engines can drive for many positions.
+
+# State Outline:
+#  1. "buying"     : the frontrunning bid is on the book. A fill moves the position to "arming".
+#  2. "arming"     : waiting for trades above the exit price (cost price plus the sell discount and the API fee).
+#  3. "placing"    : a stop-limit ask has to be submitted (for the first time, after a ratchet or after a modification).
+#  4. "trailing"   : the stop-limit ask is live. Trades above the exit price ratchet it. Trades at or below its stop price
+#                    move the position to "triggered" (the exchange should be filling it).
+#  5. "triggered"  : waiting for the stop-limit ask to close. It still ratchets if prices recover before it fills.
+#  6. "selling"    : the exchange refused a stop-limit ask because prices already fell through its stop (e.g. after a gap down).
+#                    A limit ask at the sell price has to be submitted (what the stop-limit ask would have become). It is
+#                    "triggered" while it rests.
+#  7. "cancelling" : the live stop-limit ask has to be cancelled (before "placing" a replacement).
+#  8. "closing"    : the live order has to be cancelled because the position was closed on request.
+#  9. "closed"     : the stop-limit ask filled (or the position was closed on request). Nothing else happens.
+#
+# The trailer never calls the exchange. Engines ask it for the "next" action, perform it and "confirm" the response.
+# Prices are TickPrice objects (see quantizer) and triggers are integer ticks suitable for TriggerIndex.
+
+from decimal import Decimal
+
+from backstopper.logging.logger import logger as logger
+from backstopper.pricing.quantizer import tickscale, ratio, TickPrice
+
+class Trailer :
+
+    def __init__ (
+            self,
+            pair : str,
+            size : str,
+            stopdiscount : str,
+            selldiscount : str,
+            fee : Decimal
+        ) -> None :
+
+        self.pair = pair.upper()
+        self.size = size
+        self.scale = tickscale( self.pair )
+        self.fee = Decimal( fee )
+        self.setdiscounts( stopdiscount, selldiscount )
+
+        self.state : str = 'buying'
+        self.order : str = None
+        self.costprice = None
+        self.exitprice = None
+        self.stopprice = None
+        self.sellprice = None
+        self.saleprice = None
+
+        # Price the stop and sell prices are derived from (the exit price at first, then the price of each ratchet).
+        self.basis = None
+        self.ratchets : int = 0
+        self.ratcheting : bool = False
+
+    def setdiscounts (
+            self,
+            stopdiscount : str,
+            selldiscount : str
+        ) -> None :
+
+        # Gemini requires the stop price of an ask to exceed its sell price.
+        stopinput = Decimal( stopdiscount )
+        sellinput = Decimal( selldiscount )
+        if stopinput.compare( sellinput ) == 1 :
+            raise ValueError( f'The sell price discount {sellinput*100}% cannot be smaller than the stop price discount {stopinput*100}%. ' )
+        self.stopinput = stopinput
+        self.sellinput = sellinput
+
+    def reprice ( self ) -> None :
+
+        # Stop and sell prices belong to an ask so they are rounded up (never sell for less than intended).
+        self.stopprice = self.basis.scaled( ratio( 1, -self.stopinput ), "ask" )
+        self.sellprice = self.basis.scaled( ratio( 1, -self.sellinput, -self.fee ), "ask" )
+
+    def bounds ( self ) -> tuple :
+
+        # Trigger bounds in ticks: trades above the upper bound and trades at or below the stop price (i.e. below the lower bound).
+        if self.state == 'arming' : return ( self.exitprice.ticks, None )
+        if self.state == 'trailing' : return ( self.exitprice.ticks, self.stopprice.ticks + 1 )
+        if self.state == 'triggered' : return ( self.exitprice.ticks, None )
+        return ( None, None )
+
+    # Events.
+
+    def filled (
+            self,
+            price : str
+        ) -> None :
+
+        # The bid filled. Work out the exit price from the cost price.
+        self.costprice = self.scale.price( price )
+        self.exitprice = self.costprice.scaled( ratio( 1, self.sellinput, self.fee ) )
+        self.basis = self.exitprice
+        self.reprice()
+        self.state = 'arming'
+        logger.info ( f'{self.pair} bought at {self.costprice}. Waiting for trades above {self.exitprice} (stop {self.stopprice}, sell {self.sellprice}). ' )
+
+    def breached (
+            self,
+            side : str,
+            ticks : int
+        ) -> None :
+
+        lastprice = TickPrice( ticks, self.scale )
+        if side == 'upper' :
+            if self.state == 'arming' :
+                self.state = 'placing'
+                self.ratcheting = True
+            elif self.state in ( 'trailing', 'triggered' ) :
+                self.basis = lastprice
+                self.reprice()
+                self.state = 'cancelling'
+                self.ratcheting = True
+                self.ratchets += 1
+        elif side == 'lower' and self.state == 'trailing' :
+            logger.info ( f'{self.pair} traded at {lastprice} (at or below the {self.stopprice} stop). Waiting for {self.order} to close. ' )
+            self.state = 'triggered'
+
+    def closedorder (
+            self,
+            event : dict
+        ) -> None :
+
+        # The current order closed on the exchange (reported by the order events feed).
+        # Events of orders replaced since (e.g. cancelled during a ratchet) are ignored.
+        if event.get( 'order_id' ) != self.order : return
+        if event.get( 'is_cancelled' ) :
+            if self.state in ( 'trailing', 'triggered' ) :
+                logger.warning ( f'{self.pair} stop order {self.order} was cancelled by the exchange. Replacing it. ' )
+                self.order = None
+                self.state = 'placing'
+            elif self.state == 'buying' :
+                logger.warning ( f'{self.pair} bid order {self.order} was cancelled. Closing the position. ' )
+                self.order = None
+                self.state = 'closed'
+            elif self.state == 'selling' :
+                self.order = None
+            elif self.state == 'closing' :
+                self.order = None
+                self.state = 'closed'
+            return
+
+        if self.costprice is None :
+            # The bid filled (even if the position was being closed, in which case it stays closed).
+            closing = self.state == 'closing'
+            self.order = None
+            self.filled( event.get( 'avg_execution_price' ) or event[ 'price' ] )
+            if closing : self.state = 'closed'
+        else :
+            self.saleprice = self.scale.price( event.get( 'avg_execution_price' ) or event[ 'price' ] )
+            self.order = None
+            self.state = 'closed'
+            quotegain = ( self.saleprice.decimal() - self.costprice.decimal() ) * Decimal( self.size )
+            logger.info ( f'{self.pair} sold at {self.saleprice} after {self.ratchets} ratchets. Profit/loss of {quotegain:,.2f} {self.scale.quotecurrency}. ' )
+
+    def modify (
+            self,
+            stopdiscount : str = None,
+            selldiscount : str = None
+        ) -> None :
+
+        # Apply new discounts in place. A live stop order is replaced at the new prices.
+        self.setdiscounts( stopdiscount or self.stopinput, selldiscount or self.sellinput )
+        if self.state == 'arming' :
+            self.exitprice = self.costprice.scaled( ratio( 1, self.sellinput, self.fee ) )
+            self.basis = self.exitprice
+            self.reprice()
+        elif self.state in ( 'trailing', 'triggered' ) :
+            self.reprice()
+            self.state = 'cancelling'
+        elif self.state in ( 'placing', 'selling' ) :
+            self.reprice()
+
+    def close ( self ) -> None :
+
+        # Cancel whatever order is live and stop trailing (the asset bought remains in the account).
+        self.state = 'closing' if self.order is not None else 'closed'
+
+    # Actions.
+
+    def next ( self ) -> tuple :
+
+        # The action the engine should perform now (None when waiting for market data or order events).
+        if self.state == 'placing' : return ( 'place', self.pair, self.size, str( self.stopprice ), str( self.sellprice ) )
+        if self.state == 'selling' : return ( 'sell', self.pair, self.size, str( self.sellprice ) )
+        if self.state in ( 'cancelling', 'closing' ) : return ( 'cancel', self.order )
+        return None
+
+    def confirm (
+            self,
+            action : tuple,
+            response : dict
+        ) -> bool :
+
+        # Fold the REST response to an action into the state. Return False when the action failed (the engine retries).
+        if action[0] == 'place' :
+            if response.get( 'reason' ) == 'InvalidStopPriceSell' and self.stopprice > self.sellprice :
+                # The stop is at or above the last price: it would have triggered already. Sell instead of retrying.
+                logger.warning ( f'{self.pair} traded at or below the {self.stopprice} stop before it was placed. Selling at {self.sellprice}. ' )
+                self.state = 'selling'
+                return True
+            if not response.get( 'is_live' ) :
+                logger.warning ( f'{self.pair} stop-limit order was not accepted: {response}' )
+                return False
+            # Raise the exit price after the first placement and after each ratchet (not after modifications or replacements).
+            # It is derived from the basis so that a jump far above the previous exit price does not ratchet on every trade.
+            self.order = response[ 'order_id' ]
+            if self.ratcheting : self.exitprice = self.basis.scaled( ratio( 1, self.stopinput, self.fee ) )
+            self.ratcheting = False
+            self.state = 'trailing'
+            logger.info ( f'{self.pair} stop-limit order {self.order} is live with a {self.stopprice} stop and a {self.sellprice} sell. Next exit price: {self.exitprice}. ' )
+            return True
+
+        if action[0] == 'sell' :
+            if 'order_id' not in response :
+                logger.warning ( f'{self.pair} limit ask order was not accepted: {response}' )
+                return False
+            self.order = response[ 'order_id' ]
+            if not response.get( 'is_live' ) :
+                # Filled at once (or cancelled, in which case it is submitted again).
+                self.closedorder( response )
+                return True
+            self.state = 'triggered'
+            logger.info ( f'{self.pair} limit ask order {self.order} rests at {self.sellprice}. ' )
+            return True
+
+        if action[0] == 'cancel' :
+            if not response.get( 'is_cancelled' ) :
+                # Most likely the order filled first. Its closed event will close the position.
+                logger.warning ( f'{self.pair} order {action[1]} was not cancelled: {response}' )
+                if self.state == 'closing' : return False # Retried after a pause (the closed event settles it meanwhile).
+                self.state = 'triggered'
+                return True
+            self.order = None
+            self.state = 'closed' if self.state == 'closing' else 'placing'
+            return True
+
+        return True
+
+    def resolved (
+            self,
+            action : tuple,
+            response : dict
+        ) -> bool :
+
+        # Fold the status of an order submitted without a response ( "buy", "place" or "sell" ) like "confirm" would.
+        # The status is an error response when the order was never booked.
+        if action[0] == 'buy' :
+            if 'order_id' not in response :
+                self.state = 'closed'
+                return True
+            # Closed on request meanwhile: cancel the bid (or keep the asset without trailing it, like "closedorder").
+            if self.state == 'closed' : self.state = 'closing'
+            self.order = response[ 'order_id' ]
+            if not response.get( 'is_live' ) : self.closedorder( response )
+            return True
+        if 'order_id' in response and not response.get( 'is_live' ) and not response.get( 'is_cancelled' ) :
+            # Booked and filled already.
+            self.order = response[ 'order_id' ]
+            self.closedorder( response )
+            return True
+        if self.next() == action or not response.get( 'is_live' ) : return self.confirm( action, response )
+        # Modified or closed meanwhile: cancel the order booked (then place the replacement, if any).
+        self.order = response[ 'order_id' ]
+        self.state = 'closing' if self.state in ( 'closing', 'closed' ) else 'cancelling'
+        return True
+
+    def snapshot ( self ) -> dict :
+        return { 'pair': self.pair, 'size': self.size, 'state': self.state, 'order': self.order,
+                 'stopdiscount': str( self.stopinput ), 'selldiscount': str( self.sellinput ),
+                 'costprice': str( self.costprice ) if self.costprice else None, 'exitprice': str( self.exitprice ) if self.exitprice else None,
+                 'stopprice': str( self.stopprice ) if self.stopprice else None, 'sellprice': str( self.sellprice ) if self.sellprice else None,
+                 'saleprice': str( self.saleprice ) if self.saleprice else None, 'ratchets': self.ratchets,
+                 'fee': str( self.fee ), 'basis': str( self.basis ) if self.basis else None, 'ratcheting': self.ratcheting }
+
+def restore (
+        snapshot : dict
+    ) -> Trailer :
+
+    # Rebuild a trailer from its snapshot (e.g. to move a position to another engine without touching its live order).
+    trailer = Trailer( snapshot[ 'pair' ], snapshot[ 'size' ], snapshot[ 'stopdiscount' ], snapshot[ 'selldiscount' ], Decimal( snapshot[ 'fee' ] ) )
+    for attribute in ( 'costprice', 'exitprice', 'stopprice', 'sellprice', 'saleprice', 'basis' ) :
+        if snapshot.get( attribute ) is not None : setattr( trailer, attribute, trailer.scale.price( snapshot[ attribute ] ) )
+    trailer.state = snapshot[ 'state' ]
+    trailer.order = snapshot[ 'order' ]
+    trailer.ratchets = snapshot[ 'ratchets' ]
+    trailer.ratcheting = snapshot.get( 'ratcheting', False )
+    return trailer
@@ -15,6 +15,14 @@ name = 'tester'
 key = 'account-wCyxf41Q3Ytavlkx0CSs'
 secret = '2rmFxuo+XnZG.zB8@mgHvR29zS1c=='
 
+# Optionally list several API keys of the account to raise private REST throughput (each key has its own rate limit).
+# When "keys" is defined the single key above is ignored. Positions are spread across the keys listed.
+# Every process signing requests needs a key of its own: the supervisor and the coordinator refuse to start more bots or workers than keys.
+# keys = [
+#     { 'name': 'tester-1', 'key': 'account-wCyxf41Q3Ytavlkx0CSs', 'secret': '2rmFxuo+XnZG.zB8@mgHvR29zS1c==' },
+#     { 'name': 'tester-2', 'key': 'account-AnotherApiKey000000', 'secret': 'AnotherApiSecret000000000000' }
+# ]
+
 # Webhooks for Discord should be private to prevent spamming from bots. So put them here -
 
 discordwebhook = 'https://discord.com/api/webhooks/1006964160514502888/9I0BJ5kReoZ0NPGvwJklrHiivh12_sYe9wSJzht-wyWJJ1ilAMQs7y0TDBxFKpqyt_mO'
\ No newline at end of file
@@ -19,6 +19,98 @@ restserver = restgenuine
 # sockserver = socksandbox
 # restserver = restsandbox
 
+# Private API Rate Budget (per API key):
+# Gemini allows 600 private requests per minute per key and recommends no more than 5 per second.
+privaterequestrate = 5
+privaterequestburst = 10
+
+# Deadlines:
+# Default timeout (in seconds) of a network call per endpoint class (see deadline.py).
+# Each strategy step (e.g. a ratchet) has a budget of "stepbudget" seconds that can only shorten the timeouts of the calls it makes.
+timeouts = { 'public': 5, 'order': 5, 'account': 10, 'message': 5, 'connect': 10, 'stream': 30 }
+stepbudget = 15
+
+# Trade Recording:
+# Trades streamed by the market data feed are stored as binary columns under this directory (one folder per pair per day).
+# Bots on the same pair share the files: only one process writes a pair at a time (see tickrecorder).
+tickrecording = True
+tickdirectory = '/tmp/ticks'
+
+# Candle Cache:
+# Candles built from the trade stream are cached here (one folder per pair) so restarts do not wait for bars to accumulate.
+candledirectory = '/tmp/candles'
+
+# Supervision:
+# A bot asked to terminate (e.g. by the supervisor) either cancels its live stop order ('cancel') or leaves it on the book ('keep').
+# The supervisor writes the health of its workers under this directory (one file per supervisor).
+terminationpolicy = 'keep'
+supervisordirectory = '/tmp/backstopper-supervisor'
+
+# Entry:
+# With 'frontrun' one maker-or-cancel bid is placed a tick above the best bid (then its fill is awaited).
+# With 'requote' the bid is kept at the top of the book (see requoter.py) for at most "entrydeadline" seconds
+# or until the best bid rises "entrydrift" (as a decimal) above the first quote.
+entrymode = 'frontrun'
+entrydeadline = 300
+entrydrift = '0.005'
+
+# Stop Emulation:
+# With 'exchange' the trailing stop-limit order rests on the exchange (every ratchet cancels it and submits a new one).
+# With 'emulated' the stop trails locally on the trade stream and an immediate-or-cancel ask is only sent once it is hit.
+# Emulated stops can keep a wide "disaster" stop-limit resting this far (as a decimal) below the first exit price (None disables it).
+stopmode = 'exchange'
+disasterdiscount = '0.05'
+
+# Control:
+# The engine accepts commands (open, modify, close and list positions) on this Unix socket.
+controlsocket = '/tmp/backstopper.sock'
+# An order action the exchange keeps refusing is attempted this many times (3 seconds apart) before the position waits for a command.
+actionattempts = 5
+
+# Sharding:
+# The coordinator (see coordinator.py) accepts the same commands on "controlsocket" and routes every pair to one of its worker engines.
+# Worker engines listen on "workersocket" (formatted with their name) and log to "workerlog". The coordinator writes its status to "coordinatorpath".
+workersocket = '/tmp/backstopper-worker-{}.sock'
+workerlog = '/tmp/backstopper-worker-{}.log'
+coordinatorpath = '/tmp/backstopper-coordinator.json'
+# Workers that joined from elsewhere stop trailing (releasing their positions) unless the coordinator renews their lease within this many seconds.
+workerlease = 30
+
+# Market Data:
+# Number of independent connections kept per pair. More than one hedges against a slow path (the first copy of each trade wins).
+feedconnections = 1
+# Trades of the updates queued within this many milliseconds of each other are evaluated as one batch (0 batches per update).
+batchwindowms = 0
+
+# Ledger:
+# The order monitor (see ordermonitor.py) writes the profit/loss of every position and symbol here.
+ledgerpath = '/tmp/backstopper-ledger.json'
+
+# Trade History:
+# Fills fetched from the REST API are cached here (one file per symbol, see historian.py).
+# The prices intended by every sell order placed are journaled here (to measure slippage).
+historydirectory = '/tmp/backstopper-history'
+intentspath = '/tmp/backstopper-intents.jsonl'
+
+# Soak Testing:
+# The soak harness (see soak.py) writes its summary here. Resident memory may grow "soakmemorylimit" bytes
+# and "soakfdslack" more file descriptors may be open than at its first sample before an invariant is violated.
+soakpath = '/tmp/backstopper-soak.json'
+soakmemorylimit = 64 * 2**20
+soakfdslack = 16
+
+# Shadow Evaluation:
+# The shadow (see shadow.py) paper trades every stop/sell discount pair between the first two values of "shadowgrid"
+# (in steps of the third) on the live feed and writes the results here.
+shadowpath = '/tmp/backstopper-shadow.json'
+shadowgrid = ( '0.0025', '0.05', '0.0025' )
+
+# Fee Schedule:
+# The API maker/taker fees of the account are cached here and refreshed in the background once older than the TTL (in seconds).
+# The "apitransactionfee" below is only used until the first refresh.
+feeschedulepath = '/tmp/backstopper-fees.json'
+feeschedulettl = 3600
+
 # Note:
 #
 # The source of these constants can be located here:
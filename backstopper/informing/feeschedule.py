@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# library name: feeschedule.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: serve the API maker/taker fees of the account from a disk cache that is refreshed in the background.
+
+# Design Outline:
+#  1. The fee schedule ( maker and taker basis points plus the time fetched ) is cached in definer.feeschedulepath.
+#  2. Readers ("makerfee" and "takerfee") never wait on the REST API:
+#       - they use the schedule in memory (loaded from the disk cache on first use),
+#       - a schedule older than definer.feeschedulettl seconds is refreshed by a background thread,
+#       - without any cache the fee in definer.apitransactionfee is used until the first refresh lands.
+#  3. Long-running processes can call "start" to refresh the schedule periodically.
+#
+# Refer to https://docs.gemini.com/rest-api/#get-notional-volume for the fields used.
+
+import os
+import json
+import time
+import threading
+
+from decimal import Decimal
+
+import backstopper.informing.definer as definer
+
+from backstopper.logging.logger import logger as logger
+from backstopper.informing.volumizer import notionalvolume
+
+schedule : dict = None
+lock = threading.Lock()
+refreshing = threading.Lock()
+
+def fallback ( ) -> dict :
+
+    # Conversion to basis points of the hard coded fee (never considered fresh).
+    bps = str( Decimal( definer.apitransactionfee ) * 10000 )
+    return { 'maker': bps, 'taker': bps, 'fetched': 0 }
+
+def load ( ) -> dict :
+    try :
+        with open( definer.feeschedulepath ) as file : cached = json.load( file )
+        return { 'maker': str( cached[ 'maker' ] ), 'taker': str( cached[ 'taker' ] ), 'fetched': float( cached[ 'fetched' ] ) }
+    except ( OSError, ValueError, KeyError ) :
+        return None
+
+def save (
+        fees : dict
+    ) -> None :
+
+    # Write then rename so readers never see a partial file.
+    try :
+        with open( definer.feeschedulepath + '.tmp', 'w' ) as file : json.dump( fees, file )
+        os.replace( definer.feeschedulepath + '.tmp', definer.feeschedulepath )
+    except OSError as e :
+        logger.warning ( f'Unable to cache the fee schedule. Error: {e}' )
+
+def refresh ( ) -> dict :
+
+    # Fetch the current tier (blocking) and cache it.
+    global schedule
+    response = notionalvolume()
+    fees = { 'maker': str( response[ 'api_maker_fee_bps' ] ), 'taker': str( response[ 'api_taker_fee_bps' ] ), 'fetched': time.time() }
+    with lock : schedule = fees
+    save( fees )
+    logger.debug ( f'Fee schedule refreshed: {fees["maker"]} bps maker, {fees["taker"]} bps taker. ' )
+    return fees
+
+def refreshinbackground ( ) -> None :
+
+    # At most one refresh at a time (readers keep the schedule they have meanwhile).
+    if not refreshing.acquire( blocking = False ) : return
+
+    def worker () :
+        try : refresh()
+        except Exception as e : logger.warning ( f'Unable to refresh the fee schedule. Error: {e}' )
+        finally : refreshing.release()
+
+    threading.Thread( target = worker, name = 'feeschedule', daemon = True ).start()
+
+def current ( ) -> dict :
+    global schedule
+    with lock :
+        if schedule is None : schedule = load() or fallback()
+        fees = schedule
+    if time.time() - fees[ 'fetched' ] > definer.feeschedulettl : refreshinbackground()
+    return fees
+
+def makerfee ( ) -> Decimal :
+
+    # Decimal fraction (conversion from basis points).
+    return Decimal( '0.0001' ) * Decimal( current()[ 'maker' ] )
+
+def takerfee ( ) -> Decimal :
+    return Decimal( '0.0001' ) * Decimal( current()[ 'taker' ] )
+
+def start (
+        interval : float = None
+    ) -> threading.Thread :
+
+    # Keep the schedule fresh for the lifetime of a long-running process.
+    interval = interval or definer.feeschedulettl
+
+    def worker () :
+        while True :
+            refreshinbackground()
+            time.sleep( interval )
+
+    thread = threading.Thread( target = worker, name = 'feeschedulerefresher', daemon = True )
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+
+    # Refresh (blocking) and report.
+    refresh()
+    logger.info ( f'Maker fee: {makerfee()} Taker fee: {takerfee()}' )
@@ -5,7 +5,7 @@
 # library created: 20220811
 # library purpose: retrieve market data using the Gemini REST API.
 
-import requests
+import backstopper.timing.deadline as deadline
 
 from backstopper.informing.definer import restserver
 
@@ -16,7 +16,7 @@ def ticker ( pair : str ) -> str:
 
     # Get the latest prices and trading volumes.
     endpoint = '/v1/pubticker/' + pair
-    response = requests.get( restserver + endpoint ).json()
+    response = deadline.get( 'public', restserver + endpoint ).json()
 
     # Uncomment to write the response to logs: 
     # logger.debug ( json.dumps( response, sort_keys=True, indent=4, separators=(',', ': ') ) )
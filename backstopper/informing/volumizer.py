@@ -6,9 +6,7 @@
 # library purpose: retrieve trading activity dependent data for the last 30 days across all pairs traded
 
 
-import requests
-import datetime
-import time
+import backstopper.timing.deadline as deadline
 
 from backstopper.informing.definer import restserver
 
@@ -21,15 +19,13 @@ def notionalvolume() -> str:
     # like transaction fees and 
     # trading volume (USD terms).
     endpoint = '/v1/notionalvolume'
-    t = datetime.datetime.now()
     payload = {
-        'nonce': str( int( time.mktime( t.timetuple() ) * 1000 ) ),
         'request': endpoint
     }
     headers = authenticate( payload )
 
     restapirequest = restserver + endpoint
-    responseobject = requests.post( restapirequest, data = None, headers = headers['restheader'] )
+    responseobject = deadline.post( 'account', restapirequest, data = None, headers = headers['restheader'] )
 
     return responseobject.json()
 
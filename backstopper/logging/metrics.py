@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#
+# library name: metrics.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: keep in-process counters, gauges and latency percentiles that libraries update and bots report.
+
+# Usage:
+#   metrics.increment( 'authenticator.requests', key = 'tester' )
+#   metrics.setgauge( 'marketfeed.lagms', 12.5, pair = 'ETHUSD' )
+#   metrics.observe( 'marketfeed.lagms', 12.5, pair = 'ETHUSD' )
+#   metrics.snapshot()  # Dictionary of everything (percentiles included).
+#   metrics.report()    # Write the snapshot to the logs.
+#
+# Labels become part of the metric name (e.g. 'authenticator.requests{key=tester}').
+# Observations are kept in fixed-size ring buffers, so percentiles cover the most recent "reservoir" observations.
+
+import json
+import array
+import threading
+
+from backstopper.logging.logger import logger as logger
+
+reservoir : int = 4096
+
+counters : dict = {}
+gauges : dict = {}
+histograms : dict = {}
+
+lock = threading.Lock()
+
+def metricname (
+        name : str,
+        labels : dict
+    ) -> str :
+    if not labels : return name
+    return name + '{' + ','.join( f'{label}={value}' for label, value in sorted( labels.items() ) ) + '}'
+
+def increment (
+        name : str,
+        amount : float = 1,
+        **labels
+    ) -> None :
+    name = metricname( name, labels )
+    with lock : counters[ name ] = counters.get( name, 0 ) + amount
+
+def setgauge (
+        name : str,
+        value : float,
+        **labels
+    ) -> None :
+    gauges[ metricname( name, labels ) ] = value
+
+class Histogram :
+
+    # Ring buffer of recent observations (plus a running count and sum of every observation).
+
+    def __init__ ( self ) -> None :
+        self.values = array.array( 'd', bytes( 8 * reservoir ) )
+        self.count : int = 0
+        self.total : float = 0.0
+
+    def observe (
+            self,
+            value : float
+        ) -> None :
+        self.values[ self.count % reservoir ] = value
+        self.count += 1
+        self.total += value
+
+    def percentiles (
+            self,
+            points : tuple = ( 50, 90, 99 )
+        ) -> dict :
+        recent = sorted( self.values[ : min( self.count, reservoir ) ] )
+        if not recent : return { f'p{point}': None for point in points }
+        return { f'p{point}': recent[ min( len( recent ) - 1, int( len( recent ) * point / 100 ) ) ] for point in points }
+
+def observe (
+        name : str,
+        value : float,
+        **labels
+    ) -> None :
+    name = metricname( name, labels )
+    histogram = histograms.get( name )
+    if histogram is None :
+        with lock : histogram = histograms.setdefault( name, Histogram() )
+    histogram.observe( value )
+
+def snapshot ( ) -> dict :
+
+    # Everything at once. Histograms report their count, mean and percentiles.
+    with lock :
+        summary = { 'counters': dict( counters ), 'gauges': dict( gauges ), 'histograms': {} }
+        for name, histogram in histograms.items() :
+            summary[ 'histograms' ][ name ] = { 'count': histogram.count, 'mean': histogram.total / histogram.count if histogram.count else None,
+                                                **histogram.percentiles() }
+    return summary
+
+def report ( ) -> None :
+    logger.info ( f'Metrics: {json.dumps( snapshot(), sort_keys = True )}' )
+
+def reset ( ) -> None :
+    with lock :
+        counters.clear()
+        gauges.clear()
+        histograms.clear()
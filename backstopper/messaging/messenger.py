@@ -6,8 +6,8 @@
 # library purpose: send alert messages to a monitored Discord Server Channel using webhooks.
 
 import json
-import requests
 
+import backstopper.timing.deadline as deadline
 import backstopper.authenticating.credentials as credentials
 
 from backstopper.logging.logger import logger as logger
@@ -17,7 +17,7 @@ def sendmessage( message ):
 
     try : 
 
-        appresponse = requests.post( credentials.discordwebhook, 
+        appresponse = deadline.post( 'message', credentials.discordwebhook, 
                                      data = json.dumps( { "content": message } ), 
                                      headers = { 'Content-Type': 'application/json' } 
         ) # Send message to Discord server.
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+#
+# library name: candlebuilder.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: build OHLCV candles incrementally from the trade stream (seeded from a disk cache and the candles endpoint).
+
+# Design Outline:
+#  1. Each timeframe keeps its bars in fixed-size ring buffers (array module) so memory never grows.
+#  2. Trades update the current bar in constant time. A trade in a later bucket closes the bar and opens the next one.
+#  3. At startup each timeframe loads its bars from the disk cache (<candledirectory>/<PAIR>/<timeframe>.json).
+#     The candles endpoint (/v2/candles) is only called when the cache is missing or older than one bar.
+#  4. The cache is rewritten whenever bars close (at most once per "saveinterval" seconds) and on "save".
+#
+# Refer to https://docs.gemini.com/rest-api/#candles for the time frames supported.
+
+import os
+import json
+import time
+import array
+
+import backstopper.informing.definer as definer
+import backstopper.timing.deadline as deadline
+
+from backstopper.logging.logger import logger as logger
+
+timeframes : dict = {
+    '1m': 60000,
+    '5m': 300000,
+    '15m': 900000,
+    '30m': 1800000,
+    '1hr': 3600000,
+    '6hr': 21600000,
+    '1day': 86400000
+}
+
+class CandleSeries :
+
+    # Ring buffers of the most recent bars of one timeframe (oldest bars are overwritten).
+
+    def __init__ (
+            self,
+            timeframe : str,
+            capacity : int = 500
+        ) -> None :
+
+        self.timeframe = timeframe
+        self.framems : int = timeframes[ timeframe ]
+        self.capacity = capacity
+
+        self.starts = array.array( 'q', bytes( 8 * capacity ) )
+        self.opens = array.array( 'd', bytes( 8 * capacity ) )
+        self.highs = array.array( 'd', bytes( 8 * capacity ) )
+        self.lows = array.array( 'd', bytes( 8 * capacity ) )
+        self.closes = array.array( 'd', bytes( 8 * capacity ) )
+        self.volumes = array.array( 'd', bytes( 8 * capacity ) )
+
+        # Number of bars held and the slot of the current (i.e. newest, possibly still open) bar.
+        self.count : int = 0
+        self.current : int = -1
+        self.closed : int = 0
+
+    def __len__ ( self ) -> int :
+        return self.count
+
+    def update (
+            self,
+            timestampms : int,
+            price : float,
+            amount : float
+        ) -> None :
+
+        start = int( timestampms ) // self.framems * self.framems
+        slot = self.current
+
+        if self.count and start == self.starts[ slot ] :
+            if price > self.highs[ slot ] : self.highs[ slot ] = price
+            if price < self.lows[ slot ] : self.lows[ slot ] = price
+            self.closes[ slot ] = price
+            self.volumes[ slot ] += amount
+        elif not self.count or start > self.starts[ slot ] :
+            if self.count : self.closed += 1
+            self.append( start, price, price, price, price, amount )
+        # Otherwise the trade belongs to a bar that already closed. It is ignored.
+
+    def append (
+            self,
+            start : int,
+            open : float,
+            high : float,
+            low : float,
+            close : float,
+            volume : float
+        ) -> None :
+
+        # Open a new bar in the next slot of the ring.
+        slot = ( self.current + 1 ) % self.capacity
+        self.starts[ slot ] = start
+        self.opens[ slot ] = open
+        self.highs[ slot ] = high
+        self.lows[ slot ] = low
+        self.closes[ slot ] = close
+        self.volumes[ slot ] = volume
+        self.current = slot
+        self.count = min( self.count + 1, self.capacity )
+
+    def bars (
+            self,
+            limit : int = None
+        ) -> list :
+
+        # Return up to "limit" bars as [ start, open, high, low, close, volume ] lists (oldest first).
+        count = self.count if limit is None else min( limit, self.count )
+        slots = [ ( self.current - offset ) % self.capacity for offset in range( count - 1, -1, -1 ) ]
+        return [ [ self.starts[ slot ], self.opens[ slot ], self.highs[ slot ], self.lows[ slot ], self.closes[ slot ], self.volumes[ slot ] ] for slot in slots ]
+
+    def lastclose ( self ) -> float :
+        return self.closes[ self.current ] if self.count else None
+
+    def seed (
+            self,
+            bars : list
+        ) -> None :
+
+        # Load bars (in any order) that are newer than the ones held. A bar matching the newest one held replaces it
+        # (the newest bar of a cache or a response is usually still open and therefore incomplete).
+        for bar in sorted( bars, key = lambda bar : bar[0] ) :
+            if self.count and bar[0] < self.starts[ self.current ] : continue
+            if self.count and bar[0] == self.starts[ self.current ] : self.current = ( self.current - 1 ) % self.capacity ; self.count -= 1
+            self.append( int( bar[0] ), float( bar[1] ), float( bar[2] ), float( bar[3] ), float( bar[4] ), float( bar[5] ) )
+
+def fetchcandles (
+        pair : str,
+        timeframe : str
+    ) -> list :
+
+    # Retrieve recent candles: a list of [ time (ms), open, high, low, close, volume ] (newest first).
+    endpoint = '/v2/candles/' + pair.lower() + '/' + timeframe
+    response = deadline.get( 'public', definer.restserver + endpoint )
+    return response.json()
+
+class CandleBuilder :
+
+    def __init__ (
+            self,
+            pair : str,
+            frames : tuple = ( '1m', '5m', '15m', '1hr' ),
+            capacity : int = 500,
+            directory : str = None,
+            saveinterval : float = 60.0
+        ) -> None :
+
+        self.pair = pair.upper()
+        self.series : dict = { timeframe: CandleSeries( timeframe, capacity ) for timeframe in frames }
+        self.directory = os.path.join( directory or definer.candledirectory, self.pair )
+        self.saveinterval = saveinterval
+        self.savedclosed : int = 0
+        self.savedat : float = 0.0
+
+    def __getitem__ ( self, timeframe : str ) -> CandleSeries :
+        return self.series[ timeframe ]
+
+    def update (
+            self,
+            timestampms : int,
+            price : float,
+            amount : float
+        ) -> None :
+
+        # Fold one trade into every timeframe.
+        for series in self.series.values() : series.update( timestampms, price, amount )
+
+        # Persist closed bars now and then (never more often than the save interval).
+        closed = sum( series.closed for series in self.series.values() )
+        if closed != self.savedclosed and time.monotonic() - self.savedat > self.saveinterval :
+            self.save()
+
+    def seed ( self ) -> None :
+
+        # Warm start: disk cache first, then the candles endpoint when the cache does not reach the previous bar.
+        nowms = int( time.time() * 1000 )
+        for timeframe, series in self.series.items() :
+            path = os.path.join( self.directory, f'{timeframe}.json' )
+            try :
+                with open( path ) as file : series.seed( json.load( file ) )
+            except ( OSError, ValueError ) as e :
+                logger.debug ( f'No usable {self.pair} {timeframe} candle cache at {path}. ({e})' )
+
+            if series.count and series.starts[ series.current ] >= nowms // series.framems * series.framems - series.framems :
+                logger.debug ( f'Seeded {series.count} {self.pair} {timeframe} candles from {path}. ' )
+                continue
+
+            try :
+                series.seed( fetchcandles( self.pair, timeframe ) )
+                logger.debug ( f'Seeded {series.count} {self.pair} {timeframe} candles from the candles endpoint. ' )
+            except Exception as e :
+                logger.warning ( f'Unable to retrieve {self.pair} {timeframe} candles. Error: {e}' )
+
+        self.save()
+
+    def save ( self ) -> None :
+
+        # Write every timeframe to the disk cache (write then rename so a crash never leaves a partial file).
+        # The temporary name is per process: bots trading the same pair share the cache.
+        try :
+            os.makedirs( self.directory, exist_ok = True )
+            for timeframe, series in self.series.items() :
+                path = os.path.join( self.directory, f'{timeframe}.json' )
+                temporary = f'{path}.{os.getpid()}.tmp'
+                with open( temporary, 'w' ) as file : json.dump( series.bars(), file )
+                os.replace( temporary, path )
+        except OSError as e :
+            logger.warning ( f'Unable to cache {self.pair} candles. Error: {e}' )
+
+        self.savedclosed = sum( series.closed for series in self.series.values() )
+        self.savedat = time.monotonic()
+
+if __name__ == "__main__":
+
+    import sys
+
+    # Set default pair in case a BASH wrapper has not been used.
+    tradingpair = "ETHUSD"
+
+    # Override defaults with command line parameters from BASH wrapper.
+    if len(sys.argv) == 2 : tradingpair = sys.argv[1]
+    else : logger.warning ( f'Incorrect number of command line arguments. Using default value of {tradingpair}...' )
+
+    # Seed (from the cache when fresh) and report the latest bar of each timeframe.
+    started = time.perf_counter()
+    candles = CandleBuilder( tradingpair )
+    candles.seed()
+    logger.info ( f'Seeded {tradingpair} candles in {1e3 * ( time.perf_counter() - started ):,.1f} ms. ' )
+    for timeframe, series in candles.series.items() :
+        logger.info ( f'{timeframe}: {series.count} bars. Latest: {series.bars( 1 )}' )
@@ -7,14 +7,14 @@
 
 import ssl
 import json
-import time
 import asyncio
-import datetime
-import websockets
+
+import backstopper.timing.deadline as deadline
 
 from backstopper.logging.logger import logger as logger
 from backstopper.messaging.messenger import sendmessage as sendmessage
 from backstopper.authenticating.authenticator import authenticate as authenticate
+from backstopper.ordering.ordermanager import islive
 
 async def confirmexecution (
         order : str
@@ -26,37 +26,49 @@ async def confirmexecution (
     connection = urlrequest + parameters
 
     # Construct payload.
-    t = datetime.datetime.now()
     endpoint = '/v1/order/events'
-    nonce = str( int ( time.mktime( t.timetuple() ) * 1000 ) )
     payload = {
-        'request': endpoint,
-        'nonce': nonce
+        'request': endpoint
     }
-    header = authenticate(payload)
 
     # Introduce function.
     logger.info(f'Looping while {order} is live (i.e. active and not "closed") on Gemini\'s orderbook... ')
 
     keeplooping = True
 
-    async with websockets.connect( connection, extra_headers=header['sockheader'] ) as websocket:
-        while keeplooping :
-            message = await websocket.recv()
-            # Remove comment to debug with: logger.debug( message )
-            # Load update into a dictionary.
-            dictionary = json.loads( message )
-
-            # Check arrays for order.
-            if isinstance(dictionary, list):
-                for closedevent in dictionary:
-                    if closedevent['order_id'] == order : 
-                        infomessage = f'Completed the {closedevent["order_type"]} {closedevent["side"]}ing of '
-                        infomessage = infomessage + f'{closedevent["executed_amount"]} {closedevent["symbol"].upper()[:3]} '
-                        infomessage = infomessage + f'for {closedevent["price"]} {closedevent["symbol"].upper()[3:]}. '
-                        logger.info( infomessage )
-                        sendmessage( infomessage )
-                        keeplooping = False
-            else: 
-                # Display heartbeat
-                if dictionary[ 'type' ] == "heartbeat" : logger.debug ( f'Heartbeat: {dictionary[ "socket_sequence" ]}' )
+    while keeplooping :
+        try :
+            header = authenticate(payload)
+            async with await deadline.connect( connection, extra_headers=header['sockheader'] ) as websocket:
+                while keeplooping :
+                    # Heartbeats arrive every few seconds, so a silent connection is a hung one (see deadline).
+                    message = await deadline.recv( websocket )
+                    # Remove comment to debug with: logger.debug( message )
+                    # Load update into a dictionary.
+                    dictionary = json.loads( message )
+
+                    # Check arrays for order.
+                    if isinstance(dictionary, list):
+                        for closedevent in dictionary:
+                            if closedevent['order_id'] == order : 
+                                infomessage = f'Completed the {closedevent["order_type"]} {closedevent["side"]}ing of '
+                                infomessage = infomessage + f'{closedevent["executed_amount"]} {closedevent["symbol"].upper()[:3]} '
+                                infomessage = infomessage + f'for {closedevent["price"]} {closedevent["symbol"].upper()[3:]}. '
+                                logger.info( infomessage )
+                                sendmessage( infomessage )
+                                keeplooping = False
+                    else: 
+                        # Display heartbeat
+                        if dictionary[ 'type' ] == "heartbeat" : logger.debug ( f'Heartbeat: {dictionary[ "socket_sequence" ]}' )
+        except Exception as e :
+            # The order may have closed while disconnected. Ask the REST API before reconnecting.
+            logger.debug ( f'{e} : The order events connection failed. Let\'s check {order} and reestablish the connection! ' )
+            try :
+                status = ( await asyncio.to_thread( islive, order ) ).json()
+                if status.get( 'is_live' ) is False :
+                    logger.info ( f'Order {order} closed with {status.get( "executed_amount" )} executed at {status.get( "avg_execution_price" )}. ' )
+                    keeplooping = False
+            except Exception as e :
+                logger.debug ( f'Unable to check order {order}. Error: {e}' )
+            if keeplooping : await asyncio.sleep( 3 )
+
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+#
+# library name: marketfeed.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: stream the trades of a pair with as little bandwidth and decoding as possible.
+
+# Design Outline:
+#  1. Subscribe (v1 market data) to the event types consumers need only. Trades and heartbeats by default.
+#     Order book and auction events are explicitly switched off.
+#  2. Ask for permessage-deflate compression. Whether the server agreed is logged when connecting.
+#  3. Look at the raw text of every message before decoding it:
+#       - heartbeats and updates without trades are counted and dropped,
+#       - with a price gate ( lower, upper ), updates whose trade prices all lie within the gate are dropped.
+#         Consumers that need every trade (e.g. recorders and statistics) simply leave the gate unset.
+#  4. Count messages, payload bytes (after decompression) and dropped messages. Rates per second are published
+#     through the metrics module every "reportinterval" seconds.
+#  5. Measure the lag between the exchange timestamp of every update and its local receipt (read from the raw text,
+#     so dropped updates count too). Lag percentiles are kept in the metrics module ("marketfeed.lagms").
+#  6. Watch the stream. It is considered stale when nothing (not even a heartbeat) arrives for "staleseconds"
+#     or when "lagcount" consecutive updates lag by more than "maxlagms". A stale (or closed) stream fails over to
+#     polling the trades endpoint every "pollinterval" seconds while reconnecting in the background.
+#     Streaming resumes as soon as a new connection opens. Trades are never delivered twice (their "tid" increases).
+#  7. Optionally hedge: keep "connections" independent connections to the same feed (each reconnecting on its own).
+#     The first copy of every update is delivered. Later copies are recognized from the trade ids in their raw text
+#     (a bounded seen-set of recent ids) and dropped before decoding. The connection delivering each first copy
+#     and its lead over the next copy are recorded ("marketfeed.wins" and "marketfeed.leadms").
+#  8. Optionally coalesce: "batches" hands over the trades of one update (or of every update already queued within
+#     "windowms" of the first) as one TradeBatch with its low, high, last and volume precomputed in integer ticks.
+#     The highest bid-maker and lowest ask-maker trades are kept too, so strategies evaluate once per batch
+#     without missing a breach. Coalescing never waits: a batch is handed over as soon as the queue runs dry.
+#
+# Usage:
+#   async with MarketFeed( 'ETHUSD' ) as feed :
+#       async for timestampms, event in feed.trades() : ...
+#       async for batch in feed.batches( windowms = 50 ) : ...
+
+import re
+import sys
+import json
+import time
+import asyncio
+import collections
+
+import backstopper.informing.definer as definer
+import backstopper.logging.metrics as metrics
+import backstopper.timing.deadline as deadline
+
+from backstopper.logging.logger import logger as logger
+from backstopper.pricing.quantizer import tickscale
+
+# Trade prices in the raw text of an update (only used by the price gate).
+pricepattern = re.compile( r'"type":\s*"trade"[^}]*?"price":\s*"([0-9.]+)"' )
+timestamppattern = re.compile( r'"timestampms":\s*([0-9]+)' )
+tidpattern = re.compile( r'"tid":\s*([0-9]+)' )
+
+class StaleFeed ( Exception ) :
+    pass
+
+def fetchtrades (
+        pair : str,
+        sincems : int
+    ) -> list :
+
+    # Recent trades from the REST API (oldest first) in the format of market data events.
+    # The REST "type" is the taker side, so a "buy" took a resting ask.
+    endpoint = '/v1/trades/' + pair.lower()
+    response = deadline.get( 'public', definer.restserver + endpoint, params = { 'timestamp': sincems, 'limit_trades': 500 } )
+    trades = response.json()
+    if not isinstance( trades, list ) : raise RuntimeError( f'Unable to retrieve {pair} trades: {trades}' )
+    return [ ( trade[ 'timestampms' ], { 'type': 'trade', 'tid': trade[ 'tid' ], 'price': trade[ 'price' ], 'amount': trade[ 'amount' ],
+                                         'makerSide': 'ask' if trade[ 'type' ] == 'buy' else 'bid' } ) for trade in reversed( trades ) ]
+
+class TradeBatch :
+
+    # Trades delivered together with the aggregates strategies need (prices in ticks, volume in base currency).
+    __slots__ = ( 'trades', 'startms', 'timestampms', 'low', 'high', 'last', 'volume', 'highbid', 'lowask', 'highbidtrade', 'lowasktrade' )
+
+    def __init__ ( self ) -> None :
+        self.trades : list = []
+        self.startms : int = None
+        self.timestampms : int = None
+        self.low : int = None
+        self.high : int = None
+        self.last : int = None
+        self.volume : float = 0.0
+        # Extremes per maker side: a bid taken can only breach upper bounds and an ask taken lower bounds.
+        self.highbid : int = None
+        self.lowask : int = None
+        self.highbidtrade : tuple = None
+        self.lowasktrade : tuple = None
+
+    def __len__ ( self ) -> int :
+        return len( self.trades )
+
+    def add (
+            self,
+            timestampms : int,
+            event : dict,
+            ticks : int
+        ) -> None :
+        trade = ( timestampms, event )
+        self.trades.append( trade )
+        if self.startms is None : self.startms = timestampms
+        self.timestampms = timestampms
+        if self.low is None or ticks < self.low : self.low = ticks
+        if self.high is None or ticks > self.high : self.high = ticks
+        self.last = ticks
+        self.volume += float( event[ 'amount' ] )
+        if event[ 'makerSide' ] == 'bid' :
+            if self.highbid is None or ticks > self.highbid : self.highbid, self.highbidtrade = ticks, trade
+        elif self.lowask is None or ticks < self.lowask : self.lowask, self.lowasktrade = ticks, trade
+
+class MarketFeed :
+
+    def __init__ (
+            self,
+            pair : str,
+            heartbeat : bool = True,
+            compression : bool = True,
+            gate : tuple = None,
+            reportinterval : float = 10.0,
+            staleseconds : float = 15.0,
+            maxlagms : float = 5000.0,
+            lagcount : int = 20,
+            pollinterval : float = 1.0,
+            connections : int = 1,
+            seencapacity : int = 8192
+        ) -> None :
+
+        self.pair = pair.upper()
+        self.heartbeat = heartbeat
+        self.compression = compression
+        self.gate = gate
+        self.reportinterval = reportinterval
+        self.staleseconds = staleseconds
+        self.maxlagms = maxlagms
+        self.lagcount = lagcount
+        self.pollinterval = pollinterval
+        self.connections = connections
+        self.seencapacity = seencapacity
+
+        # Connections, their reader tasks and the queue of ( connection, message ) they fill.
+        self.websockets : list = [ None ] * connections
+        self.readers : list = []
+        self.queue : asyncio.Queue = None
+
+        # Recent trade ids mapped to ( connection, local receipt time ) of their first copy (oldest evicted first).
+        self.seen = collections.OrderedDict()
+        self.wins : list = [ 0 ] * connections
+        self.duplicates : int = 0
+
+        self.polling : bool = False
+        self.lasttid : int = 0
+        self.lasttimestampms : int = None
+        self.receivedat : float = time.monotonic()
+        self.lagging : int = 0
+        self.messages : int = 0
+        self.bytes : int = 0
+        self.dropped : int = 0
+        self.reportedat : float = time.monotonic()
+        self.reported : tuple = ( 0, 0, 0 )
+
+    @property
+    def url ( self ) -> str :
+        parameters = f'?trades=true&bids=false&offers=false&auctions=false&heartbeat={str( self.heartbeat ).lower()}'
+        return definer.sockserver + '/v1/marketdata/' + self.pair.lower() + parameters
+
+    def setgate (
+            self,
+            lower : float = None,
+            upper : float = None
+        ) -> None :
+
+        # Drop updates whose trades all lie within [ lower, upper ] (None disables the gate).
+        self.gate = None if lower is None and upper is None else ( float( lower ) if lower is not None else float( '-inf' ),
+                                                                   float( upper ) if upper is not None else float( 'inf' ) )
+
+    async def connect ( self ) :
+        websocket = await deadline.connect( self.url, compression = 'deflate' if self.compression else None )
+        extensions = getattr( websocket, 'extensions', None ) or getattr( getattr( websocket, 'protocol', None ), 'extensions', [] )
+        logger.debug ( f'Streaming {self.pair} trades (compression {"negotiated" if extensions else "unavailable"}). ' )
+        self.lagging = 0
+        return websocket
+
+    async def reader (
+            self,
+            connection : int
+        ) -> None :
+
+        # Keep one connection open (reconnecting whenever it fails or is recycled) and queue everything it receives.
+        while True :
+            websocket = None
+            try :
+                websocket = await self.connect()
+                self.websockets[ connection ] = websocket
+                async for message in websocket : self.queue.put_nowait( ( connection, message ) )
+            except asyncio.CancelledError :
+                raise
+            except Exception as e :
+                logger.debug ( f'{self.pair} market data connection {connection} failed. Error: {e}' )
+            finally :
+                self.websockets[ connection ] = None
+                if websocket is not None : await websocket.close()
+            await asyncio.sleep( 1 )
+
+    def recycle ( self ) -> None :
+
+        # Close every open connection (their readers reconnect) and discard what they queued.
+        # Trades discarded are recovered by polling (which starts from the last exchange timestamp seen).
+        for websocket in self.websockets :
+            if websocket is not None : asyncio.create_task( websocket.close() )
+        while not self.queue.empty() : self.queue.get_nowait()
+
+    async def __aenter__ ( self ) -> 'MarketFeed' :
+        self.queue = asyncio.Queue()
+        self.receivedat = time.monotonic()
+        self.readers = [ asyncio.create_task( self.reader( connection ) ) for connection in range( self.connections ) ]
+        return self
+
+    async def __aexit__ ( self, *exception ) -> None :
+        for reader in self.readers : reader.cancel()
+        await asyncio.gather( *self.readers, return_exceptions = True )
+        self.report()
+
+    def relevant (
+            self,
+            message : str
+        ) -> bool :
+
+        # Decide from the raw text whether a message is worth decoding.
+        if '"trade"' not in message : return False
+        if self.gate is None : return True
+        # Anything the pattern cannot read is decoded (i.e. the gate only ever drops what it understood).
+        lower, upper = self.gate
+        prices = pricepattern.findall( message )
+        if not prices : return True
+        for price in prices :
+            price = float( price )
+            if price < lower or price > upper : return True
+        return False
+
+    async def trades ( self ) :
+
+        # Yield ( timestampms, event ) for every relevant trade (streamed, or polled while the stream is stale).
+        async for timestampms, events in self.updates() :
+            for event in events : yield ( timestampms, event )
+
+    async def batches (
+            self,
+            windowms : int = 0
+        ) :
+
+        # Yield a TradeBatch per update or, with a window, per run of updates already queued within "windowms" of the first.
+        scale = tickscale( self.pair )
+        batch = None
+        async for timestampms, events in self.updates() :
+            for event in events :
+                if batch is None : batch = TradeBatch()
+                batch.add( timestampms, event, scale.ticks( event[ 'price' ] ) )
+            if batch is None : continue
+            if windowms and not self.queue.empty() and ( timestampms or batch.startms ) - batch.startms < windowms : continue
+            metrics.observe( 'marketfeed.batchsize', len( batch ), pair = self.pair )
+            yield batch
+            batch = None
+
+    async def updates ( self ) :
+
+        # Yield ( timestampms, events ) per update received: streamed, or polled while the stream is stale.
+        while True :
+            try :
+                async for update in self.stream() : yield update
+            except StaleFeed as e :
+                logger.warning ( f'The {self.pair} market data stream is stale ({e}). Polling trades until it recovers. ' )
+                metrics.increment( 'marketfeed.failovers', pair = self.pair )
+            async for update in self.poll() : yield update
+
+    async def stream ( self ) :
+
+        # Read the connections until they go stale (raising StaleFeed).
+        # Dropped messages yield ( None, () ) so that a pending batch is handed over as soon as the queue runs dry.
+        while True :
+            try :
+                connection, message = await asyncio.wait_for( self.queue.get(), self.staleseconds )
+            except asyncio.TimeoutError :
+                raise StaleFeed( f'nothing received for {self.staleseconds} seconds' )
+            if not self.receive( connection, message ) :
+                yield ( None, () )
+                continue
+            if not self.relevant( message ) :
+                self.dropped += 1
+                yield ( None, () )
+                continue
+            dictionary = json.loads( message )
+            yield ( dictionary[ 'timestampms' ], [ event for event in dictionary.get( 'events', () ) if event.get( 'type' ) == 'trade' and self.fresh( event ) ] )
+
+    def receive (
+            self,
+            connection : int,
+            message : str
+        ) -> bool :
+
+        # Count the message and measure its lag (heartbeats carry no timestamp).
+        # Return False for later copies of an update already received on another connection.
+        now = time.monotonic()
+        self.receivedat = now
+        self.messages += 1
+        self.bytes += len( message )
+        if now - self.reportedat > self.reportinterval : self.report()
+
+        if self.connections > 1 and not self.first( connection, message, now ) : return False
+
+        match = timestamppattern.search( message )
+        if match is None : return True
+        timestampms = int( match.group( 1 ) )
+        self.lasttimestampms = timestampms
+        lagms = time.time() * 1000 - timestampms
+        metrics.observe( 'marketfeed.lagms', lagms, pair = self.pair )
+        self.lagging = self.lagging + 1 if lagms > self.maxlagms else 0
+        if self.lagging >= self.lagcount : raise StaleFeed( f'{self.lagging} updates lagged by more than {self.maxlagms:,.0f} ms' )
+        return True
+
+    def first (
+            self,
+            connection : int,
+            message : str,
+            now : float
+        ) -> bool :
+
+        # Is this the first copy of the trades it carries? Messages without trades (e.g. heartbeats) always pass.
+        tids = tidpattern.findall( message )
+        if not tids : return True
+        earlier = self.seen.get( tids[0] )
+        if earlier is not None :
+            # A copy of an update delivered already. Credit the connection that won and by how much.
+            winner, receivedat = earlier
+            if winner != connection : metrics.observe( 'marketfeed.leadms', 1000 * ( now - receivedat ), pair = self.pair )
+            self.duplicates += 1
+            return False
+        for tid in tids : self.seen[ tid ] = ( connection, now )
+        while len( self.seen ) > self.seencapacity : self.seen.popitem( last = False )
+        self.wins[ connection ] += 1
+        metrics.increment( 'marketfeed.wins', pair = self.pair, connection = connection )
+        return True
+
+    def fresh (
+            self,
+            event : dict
+        ) -> bool :
+
+        # Deliver each trade once (streamed and polled trades overlap around a failover).
+        tid = int( event[ 'tid' ] )
+        if tid <= self.lasttid : return False
+        self.lasttid = tid
+        return True
+
+    async def poll ( self ) :
+
+        # Poll the trades endpoint (at most once per poll interval) until any connection delivers again.
+        self.polling = True
+        self.recycle()
+        sincems = self.lasttimestampms or int( time.time() * 1000 )
+        try :
+            while self.queue.empty() :
+                started = time.monotonic()
+                try :
+                    trades = await asyncio.to_thread( fetchtrades, self.pair, sincems )
+                    metrics.increment( 'marketfeed.polls', pair = self.pair )
+                except Exception as e :
+                    logger.debug ( f'Unable to poll {self.pair} trades. Error: {e}' )
+                    trades = []
+                for timestampms, event in trades :
+                    sincems = max( sincems, timestampms )
+                    self.lasttimestampms = sincems
+                    if self.fresh( event ) : yield ( timestampms, [ event ] )
+                await asyncio.sleep( max( 0.0, self.pollinterval - ( time.monotonic() - started ) ) )
+            logger.info ( f'The {self.pair} market data stream recovered. ' )
+        finally :
+            self.polling = False
+
+    def lag ( self ) -> dict :
+
+        # Exchange to local lag percentiles (in milliseconds) of recent updates.
+        histogram = metrics.histograms.get( metrics.metricname( 'marketfeed.lagms', { 'pair': self.pair } ) )
+        return histogram.percentiles() if histogram is not None else {}
+
+    def hedging ( self ) -> dict :
+
+        # First copies delivered per connection and the lead (in milliseconds) of winners over the next copy.
+        histogram = metrics.histograms.get( metrics.metricname( 'marketfeed.leadms', { 'pair': self.pair } ) )
+        return { 'wins': list( self.wins ), 'duplicates': self.duplicates, 'leadms': histogram.percentiles() if histogram is not None else {} }
+
+    def report ( self ) -> dict :
+
+        # Rates since the previous report (published as gauges) and totals (published as counters).
+        now = time.monotonic()
+        elapsed = max( now - self.reportedat, 1e-9 )
+        messages, bytes, dropped = self.reported
+        rates = { 'messagespersecond': ( self.messages - messages ) / elapsed, 'bytespersecond': ( self.bytes - bytes ) / elapsed,
+                  'droppedpersecond': ( self.dropped - dropped ) / elapsed }
+        for name, value in rates.items() : metrics.setgauge( f'marketfeed.{name}', value, pair = self.pair )
+        metrics.setgauge( 'marketfeed.silentseconds', now - self.receivedat, pair = self.pair )
+        metrics.increment( 'marketfeed.messages', self.messages - messages, pair = self.pair )
+        metrics.increment( 'marketfeed.bytes', self.bytes - bytes, pair = self.pair )
+        metrics.increment( 'marketfeed.dropped', self.dropped - dropped, pair = self.pair )
+        self.reported = ( self.messages, self.bytes, self.dropped )
+        self.reportedat = now
+        return rates
+
+if __name__ == "__main__":
+
+    # Stream the trades of several pairs and report the rates each feed consumes.
+
+    # Set default pairs and duration in case a BASH wrapper has not been used.
+    pairs : list = [ 'ETHUSD', 'BTCUSD' ]
+    duration : float = 60
+
+    # Override defaults with command line parameters from BASH wrapper.
+    if len( sys.argv ) > 2 :
+        duration = float( sys.argv[1] )
+        pairs = sys.argv[2:]
+    else : logger.warning ( f'Incorrect number of command line arguments. Using default values of {duration} seconds and {pairs}...' )
+
+    async def consume ( pair : str ) -> None :
+        async with MarketFeed( pair ) as feed :
+            async for timestampms, event in feed.trades() : pass
+
+    async def main () -> None :
+        tasks = [ asyncio.create_task( consume( pair ) ) for pair in pairs ]
+        await asyncio.sleep( duration )
+        for task in tasks : task.cancel()
+        await asyncio.gather( *tasks, return_exceptions = True )
+        logger.info ( f'{metrics.snapshot()}' )
+
+    asyncio.run( main() )
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+#
+# library name: ordermonitor.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: book every fill of the account into a ledger marked to market by the trade stream.
+
+# Design Outline:
+#  1. One order events connection (fills only) feeds a Ledger (see ledger.py) with the actual price, amount and fee of every fill.
+#  2. One market data connection per symbol traded marks the ledger to market (connections open with the first fill in a symbol).
+#  3. Every "interval" seconds the ledger snapshot is written to definer.ledgerpath, so any process can read the
+#     profit/loss of every position and symbol without a REST call (see "readsnapshot").
+#
+# Execution:
+#   python3 -m backstopper.monitoring.ordermonitor [pair ...]   (marking the pairs listed from the start)
+#   python3 -m backstopper.monitoring.ordermonitor show
+
+import os
+import sys
+import json
+import asyncio
+
+import backstopper.informing.definer as definer
+import backstopper.timing.deadline as deadline
+import backstopper.authenticating.authenticator as authenticator
+
+from backstopper.logging.logger import logger as logger
+from backstopper.accounting.ledger import Ledger
+from backstopper.monitoring.marketfeed import MarketFeed
+from backstopper.pricing.quantizer import tickscale
+
+def readsnapshot (
+        path : str = None
+    ) -> dict :
+    with open( path or definer.ledgerpath ) as file : return json.load( file )
+
+class OrderMonitor :
+
+    def __init__ (
+            self,
+            ledger : Ledger = None,
+            pairs : list = (),
+            interval : float = 10.0,
+            path : str = None
+        ) -> None :
+        self.ledger = ledger or Ledger()
+        self.pairs = [ pair.upper() for pair in pairs ]
+        self.interval = interval
+        self.path = path or definer.ledgerpath
+        self.feeds : dict = {}
+
+    async def orderevents ( self ) -> None :
+
+        # Fills of the account (reconnecting whenever the connection drops).
+        connection = definer.sockserver + '/v1/order/events?eventTypeFilter=fill'
+        while True :
+            try :
+                header = authenticator.authenticate( { 'request': '/v1/order/events' } )
+                async with await deadline.connect( connection, extra_headers = header[ 'sockheader' ] ) as websocket :
+                    while True :
+                        dictionary = json.loads( await deadline.recv( websocket ) )
+                        if not isinstance( dictionary, list ) : continue
+                        for event in dictionary :
+                            if self.ledger.record( event ) : self.startfeed( event[ 'symbol' ] )
+            except asyncio.CancelledError :
+                raise
+            except Exception as e :
+                logger.debug ( f'{e} : The order events connection failed. Let\'s reestablish the connection and try again! ' )
+                await asyncio.sleep( 3 )
+
+    def startfeed (
+            self,
+            pair : str
+        ) -> None :
+        pair = pair.upper()
+        if pair not in self.feeds : self.feeds[ pair ] = asyncio.create_task( self.marks( pair ) )
+
+    async def marks (
+            self,
+            pair : str
+        ) -> None :
+
+        # Mark a symbol to the last trade of every batch (reconnecting whenever the connection drops).
+        scale = tickscale( pair )
+        while True :
+            try :
+                async with MarketFeed( pair ) as feed :
+                    async for batch in feed.batches( definer.batchwindowms ) : self.ledger.mark( pair, scale.pricestring( batch.last ) )
+            except asyncio.CancelledError :
+                raise
+            except Exception as e :
+                logger.debug ( f'{e} : The {pair} market data connection failed. Let\'s reestablish the connection and try again! ' )
+                await asyncio.sleep( 3 )
+
+    def publish ( self ) -> dict :
+
+        # Write then rename so readers never see a partial file.
+        snapshot = self.ledger.snapshot()
+        try :
+            with open( self.path + '.tmp', 'w' ) as file : json.dump( snapshot, file )
+            os.replace( self.path + '.tmp', self.path )
+        except OSError as e :
+            logger.warning ( f'Unable to write the ledger snapshot. Error: {e}' )
+        return snapshot
+
+    async def run ( self ) -> None :
+        for pair in self.pairs : self.startfeed( pair )
+        events = asyncio.create_task( self.orderevents() )
+        try :
+            while True :
+                await asyncio.sleep( self.interval )
+                snapshot = self.publish()
+                logger.info ( f'Realized {snapshot["realized"]} and unrealized {snapshot["unrealized"]} profit/loss. ' )
+        finally :
+            events.cancel()
+            for feed in self.feeds.values() : feed.cancel()
+            self.publish()
+
+if __name__ == "__main__":
+
+    if sys.argv[1:] == [ 'show' ] :
+        logger.info ( json.dumps( readsnapshot(), sort_keys = True, indent = 4 ) )
+        sys.exit(0)
+
+    try : asyncio.run( OrderMonitor( pairs = sys.argv[1:] ).run() )
+    except KeyboardInterrupt : pass
@@ -7,79 +7,69 @@
 
 
 import sys
-import json
 import asyncio
-import websockets
-
-from decimal import Decimal
 
 from backstopper.logging.logger import logger as logger
 from backstopper.messaging.messenger import sendmessage as sendmessage
+from backstopper.pricing.quantizer import tickscale, TickPrice
+from backstopper.monitoring.marketfeed import MarketFeed
 
 async def blockpricerange(
         marketpair: str,
         upperbound: str,
-        lowerbound: str
+        lowerbound: str,
+        recorder = None,
+        listeners : list = (),
+        connections : int = 1,
+        windowms : int = 0
     ) -> dict : # Annotate that the return value of this function is a dictionary (i.e. dictionary type).
     
-    # Cast as decimals.
-    upperlimit = Decimal( upperbound )
-    lowerlimit = Decimal( lowerbound )
-
-    # Request trade data only.
-    urlrequest : str = "wss://api.gemini.com/v1/marketdata/" + marketpair.lower()
-    parameters : str = "?trades=true&heartbeat=true"
-    connection : str = urlrequest + parameters
+    # Cast as integer ticks (the hot loop below compares plain ints).
+    scale = tickscale( marketpair )
+    upperticks : int = scale.ticks( upperbound )
+    lowerticks : int = scale.ticks( lowerbound )
+    upperlimit = scale.price( upperbound )
+    lowerlimit = scale.price( lowerbound )
+
+    # Request trade data only (through the lean market feed).
+    # Without a recorder or listeners only trades outside the bounds matter, so the rest are dropped before decoding.
+    # Several connections hedge against a slow path (the first copy of each trade wins).
+    feed = MarketFeed( marketpair, connections = connections )
+    if recorder is None and not listeners : feed.setgate( str( lowerlimit ), str( upperlimit ) )
 
     # Introduce function.
     infomessage : str = f'Looping while {marketpair[:3]} prices are between the {lowerlimit:,.2f} {marketpair[3:]} lower limit '
     logger.info ( f'{infomessage} and the {upperlimit:,.2f} {marketpair[3:]} upper limit. ' )
 
-    keeplooping : bool = True
-
-    async with websockets.connect( connection ) as websocket:
-        while keeplooping :
-            message : str = await websocket.recv()
-            # Remove comment to debug with: logger.debug( message )
-            # Load update into a dictionary.
-            dictionary : dict = json.loads( message )
-
-            # Display heartbeat
-            if dictionary[ 'type' ] == "heartbeat" : logger.debug ( f'Heartbeat: {dictionary[ "socket_sequence" ]}' )
-            else :
-
-                # Define events array/list.
-                events : list = dictionary[ 'events' ]
-                if events == [] : 
-                    logger.debug( f'No update events. Received: {message}  ' )
-                else:
-                    # Verify the array of events is a list.
-                    # Iterate through each event in the update.
-                    if isinstance ( events, list ):
-                        for event in events:
-                            tradeprice = Decimal( event[ 'price' ] )
-                            tradevalue = Decimal( event[ 'amount' ] )
-                            amountless = Decimal( 100 * ( upperlimit - tradeprice ) / upperlimit )
-                            amountmore = Decimal( 100 * ( tradeprice - lowerlimit ) / lowerlimit )
-                            tradevalue = Decimal( tradevalue * tradeprice ).quantize( tradeprice )
-                            if event['makerSide'] == "ask" : takeraction = "increase"
-                            if event['makerSide'] == "bid" : takeraction = "decrease"
-                            infomessage = f'[{amountless:.2f}% below {upperlimit:,.2f} {marketpair[3:]} upper bound] '
-                            infomessage = infomessage + f'[{amountmore:.2f}% above {lowerlimit:,.2f} {marketpair[3:]} lower bound] '
-                            infomessage = infomessage + f'{tradeprice:,.2f} {marketpair[3:]} {event["makerSide"]} price taken to '
-                            infomessage = infomessage + f'quickly {takeraction} {marketpair[:3]} hoard by {tradevalue:,.2f} {marketpair[3:]}. '
-                            logger.info ( f'{infomessage}' )
-                            if event['makerSide'] == "ask" : 
-                                if lowerlimit.compare( tradeprice ) == 1 : 
-                                    infomessage = f'{lowerlimit:,.2f} {marketpair[3:]} lower/ask price bound breached. '
-                                    keeplooping = False
-                            if event['makerSide'] == "bid" : 
-                                if tradeprice.compare( upperlimit ) == 1 : 
-                                    infomessage = f'{upperlimit:,.2f} {marketpair[3:]} upper/bid price bound breached. '
-                                    keeplooping = False
-        logger.info ( infomessage )
-        sendmessage ( infomessage )
-        return dict ( event ) # Dictionary.
+    # Trades arrive in batches (one per update or micro-window) that are evaluated and reported once.
+    # Only the highest bid and lowest ask taken in a batch can breach a bound, so none is missed.
+    async with feed :
+        async for batch in feed.batches( windowms ) :
+            for timestampms, event in batch.trades :
+                if recorder is not None : recorder.record( marketpair, timestampms, event )
+                # Listeners (e.g. TradeStatistics and CandleBuilder) receive every trade through "update".
+                for listener in listeners : listener.update( timestampms, float( event[ 'price' ] ), float( event[ 'amount' ] ) )
+            lastprice = TickPrice( batch.last, scale ) # Only used for reporting below.
+            amountless = 100 * ( upperticks - batch.high ) / upperticks
+            amountmore = 100 * ( batch.low - lowerticks ) / lowerticks
+            infomessage = f'[{amountless:.2f}% below {upperlimit:,.2f} {marketpair[3:]} upper bound] '
+            infomessage = infomessage + f'[{amountmore:.2f}% above {lowerlimit:,.2f} {marketpair[3:]} lower bound] '
+            infomessage = infomessage + f'{len( batch )} trade(s) of {batch.volume:,.6f} {marketpair[:3]} between '
+            infomessage = infomessage + f'{TickPrice( batch.low, scale ):,.2f} and {TickPrice( batch.high, scale ):,.2f} {marketpair[3:]} (last {lastprice:,.2f}). '
+            logger.info ( f'{infomessage}' )
+            if batch.lowask is not None and lowerticks > batch.lowask :
+                infomessage = f'{lowerlimit:,.2f} {marketpair[3:]} lower/ask price bound breached. '
+                timestampms, event = batch.lowasktrade
+                break
+            if batch.highbid is not None and batch.highbid > upperticks :
+                infomessage = f'{upperlimit:,.2f} {marketpair[3:]} upper/bid price bound breached. '
+                timestampms, event = batch.highbidtrade
+                break
+        else :
+            raise ConnectionError( f'The {marketpair} market data connection closed before a bound was breached. ' )
+    logger.info ( infomessage )
+    sendmessage ( infomessage )
+    return dict ( event ) # Dictionary.
 
 if __name__ == "__main__":
 
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+#
+# library name: tradestatistics.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: maintain rolling trade statistics (volatility, VWAP, trade rate, high/low) incrementally from the trade stream.
+
+# Design Outline:
+#  1. Volatility is an exponentially weighted estimate of the variance of log returns per second.
+#     Squared returns and elapsed time decay with the same half-life, so volatility( horizon ) is sqrt( rate * horizon ).
+#  2. Volume, notional and trade counts are kept in one second buckets inside preallocated ring buffers (array module).
+#     Each window keeps running sums. When a bucket leaves a window its contents are subtracted (constant time per trade).
+#  3. Highs and lows use a monotonic deque per window (amortized constant time per trade).
+#  4. Every reading (e.g. volatility) is a few arithmetic operations on stored state. Nothing rescans history.
+
+import math
+import array
+import collections
+
+class TradeStatistics :
+
+    def __init__ (
+            self,
+            windows : tuple = ( 60, 300, 900 ),
+            halflife : float = 300.0
+        ) -> None :
+
+        # Windows and half-life are in seconds.
+        self.windows : tuple = tuple( sorted( windows ) )
+        self.decay : float = math.log( 2 ) / halflife
+        self.size : int = self.windows[-1] + 1
+
+        # Ring buffers (one slot per second).
+        self.volumes = array.array( 'd', bytes( 8 * self.size ) )
+        self.notionals = array.array( 'd', bytes( 8 * self.size ) )
+        self.counts = array.array( 'q', bytes( 8 * self.size ) )
+
+        # Running sums per window.
+        self.windowvolume = array.array( 'd', bytes( 8 * len( self.windows ) ) )
+        self.windownotional = array.array( 'd', bytes( 8 * len( self.windows ) ) )
+        self.windowcount = array.array( 'q', bytes( 8 * len( self.windows ) ) )
+
+        # Monotonic deques of ( second, price ) per window.
+        self.highs : list = [ collections.deque() for window in self.windows ]
+        self.lows : list = [ collections.deque() for window in self.windows ]
+
+        # Exponentially weighted sums of squared log returns and elapsed seconds.
+        self.weightedsquares : float = 0.0
+        self.weightedseconds : float = 0.0
+
+        self.second : int = None
+        self.lastprice : float = None
+        self.lasttimestampms : int = None
+        self.trades : int = 0
+
+    def update (
+            self,
+            timestampms : int,
+            price : float,
+            amount : float
+        ) -> None :
+
+        # Fold one trade into every statistic.
+        timestampms = int( timestampms )
+        second = timestampms // 1000
+        if self.second is None : self.second = second
+        if second > self.second : self.advance( second )
+
+        # Volatility.
+        if self.lastprice is not None and price > 0 :
+            elapsed = max( 0, timestampms - self.lasttimestampms ) / 1000.0
+            factor = math.exp( -self.decay * elapsed )
+            logreturn = math.log( price / self.lastprice )
+            self.weightedsquares = self.weightedsquares * factor + logreturn * logreturn
+            self.weightedseconds = self.weightedseconds * factor + elapsed
+        self.lastprice = price
+        self.lasttimestampms = max( timestampms, self.lasttimestampms or timestampms )
+
+        # Buckets and window sums (late trades are counted in the current bucket).
+        slot = self.second % self.size
+        notional = price * amount
+        self.volumes[ slot ] += amount
+        self.notionals[ slot ] += notional
+        self.counts[ slot ] += 1
+        for position in range( len( self.windows ) ) :
+            self.windowvolume[ position ] += amount
+            self.windownotional[ position ] += notional
+            self.windowcount[ position ] += 1
+
+            highs = self.highs[ position ]
+            while highs and highs[-1][1] <= price : highs.pop()
+            highs.append( ( self.second, price ) )
+
+            lows = self.lows[ position ]
+            while lows and lows[-1][1] >= price : lows.pop()
+            lows.append( ( self.second, price ) )
+
+        self.trades += 1
+
+    def advance (
+            self,
+            second : int
+        ) -> None :
+
+        # Move the current bucket forward, expiring buckets that leave each window.
+        steps = min( second - self.second, self.size )
+        for step in range( 1, steps + 1 ) :
+            current = self.second + step
+            for position, window in enumerate( self.windows ) :
+                expired = ( current - window ) % self.size
+                self.windowvolume[ position ] -= self.volumes[ expired ]
+                self.windownotional[ position ] -= self.notionals[ expired ]
+                self.windowcount[ position ] -= self.counts[ expired ]
+            slot = current % self.size
+            self.volumes[ slot ] = 0.0
+            self.notionals[ slot ] = 0.0
+            self.counts[ slot ] = 0
+
+        # A gap longer than the ring empties every window (guard against floating point residue).
+        if steps == self.size :
+            for position in range( len( self.windows ) ) :
+                self.windowvolume[ position ] = 0.0
+                self.windownotional[ position ] = 0.0
+                self.windowcount[ position ] = 0
+
+        self.second = second
+        for position, window in enumerate( self.windows ) :
+            for extremes in ( self.highs[ position ], self.lows[ position ] ) :
+                while extremes and extremes[0][0] <= second - window : extremes.popleft()
+
+    def position (
+            self,
+            window : int
+        ) -> int :
+        return self.windows.index( window )
+
+    # Readings.
+
+    def volatility (
+            self,
+            horizon : float = 1.0
+        ) -> float :
+
+        # Standard deviation of log returns expected over the horizon (in seconds).
+        if self.weightedseconds <= 0 : return 0.0
+        return math.sqrt( self.weightedsquares / self.weightedseconds * horizon )
+
+    def vwap (
+            self,
+            window : int
+        ) -> float :
+        position = self.position( window )
+        volume = self.windowvolume[ position ]
+        return self.windownotional[ position ] / volume if volume > 0 else None
+
+    def traderate (
+            self,
+            window : int
+        ) -> float :
+
+        # Trades per second.
+        return self.windowcount[ self.position( window ) ] / window
+
+    def volume (
+            self,
+            window : int
+        ) -> float :
+        return self.windowvolume[ self.position( window ) ]
+
+    def high (
+            self,
+            window : int
+        ) -> float :
+        highs = self.highs[ self.position( window ) ]
+        return highs[0][1] if highs else None
+
+    def low (
+            self,
+            window : int
+        ) -> float :
+        lows = self.lows[ self.position( window ) ]
+        return lows[0][1] if lows else None
+
+    def snapshot ( self ) -> dict :
+
+        # Every reading at once (e.g. for logs and metrics).
+        readings = { 'trades': self.trades, 'lastprice': self.lastprice, 'volatility300s': self.volatility( 300 ) }
+        for window in self.windows :
+            readings[ f'{window}s' ] = { 'vwap': self.vwap( window ), 'traderate': self.traderate( window ), 'volume': self.volume( window ),
+                                         'high': self.high( window ), 'low': self.low( window ) }
+        return readings
+
+if __name__ == "__main__":
+
+    # Measure the per-trade cost of the statistics on a synthetic random walk.
+
+    import sys
+    import time
+    import random
+
+    from backstopper.logging.logger import logger as logger
+
+    # Set default trade count in case a BASH wrapper has not been used.
+    tradecount : int = 200000
+
+    # Override defaults with command line parameters from BASH wrapper.
+    if len( sys.argv ) == 2 : tradecount = int( sys.argv[1] )
+    else : logger.warning ( f'Incorrect number of command line arguments. Using default value of {tradecount} trades...' )
+
+    random.seed( 20261019 )
+    statistics = TradeStatistics()
+    timestampms = int( time.time() * 1000 )
+    price = 1500.0
+    trades = []
+    for _ in range( tradecount ) :
+        timestampms += random.randint( 0, 400 )
+        price *= math.exp( random.gauss( 0, 0.0002 ) )
+        trades.append( ( timestampms, price, random.random() ) )
+
+    started = time.perf_counter()
+    for trade in trades : statistics.update( *trade )
+    elapsed = time.perf_counter() - started
+
+    logger.info ( f'{1e9 * elapsed / tradecount:,.0f} ns per trade. ' )
+    logger.info ( f'{statistics.snapshot()}' )
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+#
+# library name: triggerindex.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: index the upper and lower price thresholds of many positions so each trade only visits the crossed triggers.
+
+# Design Outline:
+#  1. Every position registers an upper bound (its "exitprice") and a lower bound (derived from its stop).
+#  2. Upper bounds live in a min-heap. A trade above the smallest upper bound crosses it (and possibly the next ones).
+#  3. Lower bounds live in a max-heap (stored negated). A trade below the largest lower bound crosses it.
+#  4. A trade therefore costs one comparison against each heap top plus O(log n) for each of the k crossed triggers.
+#  5. Ratcheting a position pushes a fresh entry and bumps the position's generation number.
+#     Entries carrying an outdated generation are discarded lazily when they surface at the top of a heap.
+#  6. Heaps are rebuilt from the live entries when stale entries outnumber them (after arming or disarming, keeps memory bounded).
+#
+# Fired triggers are removed from the index. Re-arm a position with "settrigger" after acting on it.
+
+import sys
+import heapq
+
+class TriggerIndex :
+
+    def __init__ ( self ) -> None :
+
+        # Heap entries are [ price, generation, key ].
+        # Lower bound prices are negated so that heapq (a min-heap) behaves like a max-heap.
+        self.upperheap : list = []
+        self.lowerheap : list = []
+
+        # Map each key to its current generation and its armed bounds.
+        self.generations : dict = {}
+        self.upperbounds : dict = {}
+        self.lowerbounds : dict = {}
+
+    def __len__ ( self ) -> int :
+        return len( self.generations )
+
+    def __contains__ ( self, key ) -> bool :
+        return key in self.generations
+
+    def settrigger (
+            self,
+            key,
+            upperbound = None,
+            lowerbound = None
+        ) -> None :
+
+        # Arm (or re-arm after a ratchet) the bounds of a position.
+        # Pass None to leave a side unarmed.
+        generation = self.generations.get( key, 0 ) + 1
+        self.generations[ key ] = generation
+
+        self.upperbounds.pop( key, None )
+        self.lowerbounds.pop( key, None )
+
+        if upperbound is not None :
+            self.upperbounds[ key ] = upperbound
+            heapq.heappush( self.upperheap, [ upperbound, generation, key ] )
+        if lowerbound is not None :
+            self.lowerbounds[ key ] = lowerbound
+            heapq.heappush( self.lowerheap, [ -lowerbound, generation, key ] )
+
+        self.compact()
+
+    def removetrigger (
+            self,
+            key
+        ) -> None :
+
+        # Disarm a position. Its heap entries become stale and are dropped lazily (or by the next rebuild).
+        self.generations.pop( key, None )
+        self.upperbounds.pop( key, None )
+        self.lowerbounds.pop( key, None )
+
+        self.compact()
+
+    def firetriggers (
+            self,
+            price,
+            makerside : str = None
+        ) -> list :
+
+        # Return a list of ( key, "upper"|"lower", bound ) for every trigger crossed by the trade.
+        # Mirror trademonitor: upper bounds are breached by trades against resting bids (i.e. "bid" maker side)
+        # and lower bounds are breached by trades against resting asks (i.e. "ask" maker side).
+        # A makerside of None checks both bounds.
+        fired : list = []
+
+        if makerside != "ask" :
+            heap = self.upperheap
+            while heap and heap[0][0] < price :
+                bound, generation, key = heapq.heappop( heap )
+                if self.generations.get( key ) != generation or key not in self.upperbounds : continue
+                del self.upperbounds[ key ]
+                fired.append( ( key, "upper", bound ) )
+
+        if makerside != "bid" :
+            heap = self.lowerheap
+            while heap and -heap[0][0] > price :
+                bound, generation, key = heapq.heappop( heap )
+                if self.generations.get( key ) != generation or key not in self.lowerbounds : continue
+                del self.lowerbounds[ key ]
+                fired.append( ( key, "lower", -bound ) )
+
+        # A position whose bounds have all fired is no longer armed.
+        for key, side, bound in fired :
+            if key not in self.upperbounds and key not in self.lowerbounds :
+                self.generations.pop( key, None )
+
+        return fired
+
+    def nearest ( self ) -> tuple :
+
+        # Return the lowest armed upper bound and the highest armed lower bound (None when unarmed).
+        # Callers can skip a trade entirely when it falls between the two.
+        self.prune()
+        upper = self.upperheap[0][0] if self.upperheap else None
+        lower = -self.lowerheap[0][0] if self.lowerheap else None
+        return ( upper, lower )
+
+    def prune ( self ) -> None :
+
+        # Drop stale entries sitting on top of either heap.
+        for heap, bounds in ( ( self.upperheap, self.upperbounds ), ( self.lowerheap, self.lowerbounds ) ) :
+            while heap and ( self.generations.get( heap[0][2] ) != heap[0][1] or heap[0][2] not in bounds ) :
+                heapq.heappop( heap )
+
+    def compact ( self ) -> None :
+
+        # Rebuild the heaps from live entries once stale entries dominate.
+        live = len( self.upperbounds ) + len( self.lowerbounds )
+        if len( self.upperheap ) + len( self.lowerheap ) <= 2 * live + 64 : return
+
+        self.upperheap = [ [ bound, self.generations[ key ], key ] for key, bound in self.upperbounds.items() ]
+        self.lowerheap = [ [ -bound, self.generations[ key ], key ] for key, bound in self.lowerbounds.items() ]
+        heapq.heapify( self.upperheap )
+        heapq.heapify( self.lowerheap )
+
+if __name__ == "__main__":
+
+    # Benchmark the per-trade cost of the index from 1 to 10,000 active positions.
+    # Prices are integer ticks and every fired position is re-armed around the trade price to imitate a ratchet,
+    # so the number of active positions stays constant throughout. A random walk needs about d^2 steps to leave a band
+    # of half-width d, so bounds within 50 * sqrt( positions ) ticks make every position fire about once per "positions"
+    # trades. The crossing rate (i.e. "k", reported) then stays roughly steady, which isolates the cost of the index itself.
+    # (Bounds spread in proportion to the positions would let the walk clear the bounds around it and k would collapse.)
+    # Finally, every position is disarmed and re-armed repeatedly (modify and close churn) to check the heaps stay bounded.
+
+    import time
+    import math
+    import random
+
+    from backstopper.logging.logger import logger as logger
+
+    # Set default trade count in case a BASH wrapper has not been used.
+    tradecount : int = 200000
+
+    # Override defaults with command line parameters from BASH wrapper.
+    if len( sys.argv ) == 2 : tradecount = int( sys.argv[1] )
+    else : logger.warning ( f'Incorrect number of command line arguments. Using default value of {tradecount} trades...' )
+
+    random.seed( 20261019 )
+
+    for positions in ( 1, 10, 100, 1000, 10000 ) :
+
+        index = TriggerIndex()
+        spread = max( 1, int( 50 * math.sqrt( positions ) ) )
+        price = 1500000 # Ticks (i.e. 15,000.00 with a 0.01 tick).
+        for key in range( positions ) :
+            index.settrigger( key, price + random.randint( 1, spread ), price - random.randint( 1, spread ) )
+
+        # Pregenerate a random walk (and the offsets of re-armed bounds) so that only the index is timed.
+        walk = [ random.randint( -25, 25 ) for _ in range( tradecount ) ]
+        side = [ "bid" if step > 0 else "ask" for step in walk ]
+        offsets = iter( [ ( random.randint( 1, spread ), random.randint( 1, spread ) ) for _ in range( tradecount ) ] )
+
+        firedcount = 0
+        started = time.perf_counter()
+        for step, makerside in zip( walk, side ) :
+            price += step
+            for key, level, bound in index.firetriggers( price, makerside ) :
+                firedcount += 1
+                upper, lower = next( offsets, ( spread, spread ) )
+                index.settrigger( key, price + upper, price - lower )
+        elapsed = time.perf_counter() - started
+
+        logger.info ( f'{positions:>6} positions: {1e9 * elapsed / tradecount:,.0f} ns/trade [{firedcount / tradecount:.3f} triggers fired per trade]. ' )
+
+        for round in range( 20 ) :
+            for key in range( positions ) :
+                index.removetrigger( key )
+                index.settrigger( key, price + random.randint( 1, spread ), price - random.randint( 1, spread ) )
+        churned = len( index.upperheap ) + len( index.lowerheap )
+        for key in range( positions ) : index.removetrigger( key )
+        logger.info ( f'{positions:>6} positions: {churned:,} heap entries for {2 * positions:,} armed bounds after {20 * positions:,} re-arms, '
+                      f'{len( index.upperheap ) + len( index.lowerheap ):,} once every position closed. ' )
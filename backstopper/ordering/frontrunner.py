@@ -6,63 +6,68 @@
 # library purpose: bid/ask one tick above/below the best bid/ask offer.
 
 
-import requests
-import datetime
-import time
-
-from decimal import Decimal
-
 from backstopper.logging.logger import logger as logger
 
 import backstopper.informing.definer as definer
+import backstopper.timing.deadline as deadline
+import backstopper.informing.feeschedule as feeschedule
 import backstopper.authenticating.authenticator as authenticator
+import backstopper.accounting.balancecache as balancecache
+
+from backstopper.pricing.quantizer import tickscale, ratio
+from backstopper.ordering.ordermanager import clientorderid, submitorder
 
 def bidorder (
         pair: str,
         size: str,
+        tag: str = None
     ) -> str :
 
-    # Determine tick size.
-    list = definer.ticksizes
-    item = [ item['tick'] for item in list if item['currency'] == pair[:3] ]
-    tick = Decimal( item[0] )
-
-    # Determine quantity size.
-    list = definer.minimumquantities
-    item = [ item['minimumquantity'] for item in list if item['currency'] == pair[:3] ]
-    bump = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
     # Get the highest bid in the orderbook.
     # Make an offer that's one tick better.
     endpoint = '/v1/pubticker/' + pair
-    response = requests.get( definer.restserver + endpoint )
-    bidprice = Decimal( response.json()['bid'] )
-    offering = str( Decimal( bidprice + tick ).quantize( tick ) )
-    quantity = str( Decimal( size ).quantize( bump ) )
+    response = deadline.get( 'public', definer.restserver + endpoint )
+    bidprice = response.json()['bid']
+    offering = scale.pricestring( scale.ticks( bidprice, "bid" ) + 1 )
+    quantity = scale.amountstring( scale.quanta( size ) )
 
     # Update logs.
     logger.debug(f'Bidprice: {bidprice}')
     logger.debug(f'Offering: {offering}')
     logger.debug(f'Quantity: {quantity}')
 
+    return postbid( pair, quantity, offering, tag )
+
+def postbid (
+        pair: str,
+        size: str,
+        price: str,
+        tag: str = None
+    ) -> str :
+
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str(int(time.mktime(t.timetuple())*1000)),
         'symbol': pair,
-        'amount': quantity,
-        'price': offering,
+        'amount': size,
+        'price': price,
         'side': 'buy',
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    if tag is not None : payload['client_order_id'] = clientorderid(tag)
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
+    # Without a response the bid may be live (see ordermanager.UnconfirmedOrder).
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    response = submitorder( request, headers['restheader'], payload.get('client_order_id'), token )
+    balancecache.settle( token, response )
 
     return response
 
@@ -74,28 +79,21 @@ def quotabid (
     # Determine API transaction fee.
     # Refer to https://docs.gemini.com/rest-api/#basis-point.
     # Fees are calculated on the notional value of each trade (price × size).
-    # Meaning (for API transactions): size * price * 1.001 = cash
-    fraction = Decimal( definer.apitransactionfee )
-    notional = Decimal(cash) / Decimal( 1 + fraction )
+    # Meaning (for API transactions): size * price * ( 1 + maker fee ) = cash
+    notional = ratio( cash ) / ratio( 1, feeschedule.makerfee() )
 
-    # Determine tick size.
-    list = definer.ticksizes
-    item = [ item['tick'] for item in list if item['currency'] == pair[:3] ]
-    tick = Decimal( item[0] )
-
-    # Determine quantity size.
-    list = definer.minimumquantities
-    item = [ item['minimumquantity'] for item in list if item['currency'] == pair[:3] ]
-    bump = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
     # Get the highest bid in the orderbook.
     # Make an offer that's one tick better.
     # Then determine the bid order size.
     endpoint = '/v1/pubticker/' + pair
-    response = requests.get( definer.restserver + endpoint )
-    bidprice = Decimal( response.json()['bid'] )
-    offering = str( Decimal( bidprice + tick ).quantize( tick ) )
-    quantity = str( Decimal( notional / Decimal(offering) ).quantize( bump ) )
+    response = deadline.get( 'public', definer.restserver + endpoint )
+    bidprice = response.json()['bid']
+    bidticks = scale.ticks( bidprice, "bid" ) + 1
+    offering = scale.pricestring( bidticks )
+    quantity = scale.amountstring( scale.affordable( notional, bidticks ) )
 
     # Update logs.
     logger.debug(f'Bidprice: {bidprice}')
@@ -105,10 +103,8 @@ def quotabid (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str(int(time.mktime(t.timetuple())*1000)),
         'symbol': pair,
         'amount': quantity,
         'price': offering,
@@ -116,10 +112,15 @@ def quotabid (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
 
@@ -128,23 +129,16 @@ def askorder (
         size: str,
     ) -> str :
 
-    # Determine tick size.
-    list = definer.ticksizes
-    item = [ item['tick'] for item in list if item['currency'] == pair[:3] ]
-    tick = Decimal( item[0] )
-
-    # Determine quantity size.
-    list = definer.minimumquantities
-    item = [ item['minimumquantity'] for item in list if item['currency'] == pair[:3] ]
-    bump = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
     # Get the lowest ask in the orderbook.
     # Make an offer that's one tick better.
     endpoint = '/v1/pubticker/' + pair
-    response = requests.get( definer.restserver + endpoint )
-    askprice = Decimal( response.json()['ask'] )
-    offering = str( Decimal( askprice - tick ).quantize( tick ) )
-    quantity = str( Decimal( size ).quantize( bump ) )
+    response = deadline.get( 'public', definer.restserver + endpoint )
+    askprice = response.json()['ask']
+    offering = scale.pricestring( scale.ticks( askprice, "ask" ) - 1 )
+    quantity = scale.amountstring( scale.quanta( size ) )
 
     # Update logs.
     logger.debug(f'Askprice: {askprice}')
@@ -154,10 +148,8 @@ def askorder (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str(int(time.mktime(t.timetuple())*1000)),
         'symbol': pair,
         'amount': quantity,
         'price': offering,
@@ -165,10 +157,15 @@ def askorder (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
 
@@ -180,28 +177,21 @@ def quotaask (
     # Determine API transaction fee.
     # Refer to https://docs.gemini.com/rest-api/#basis-point.
     # Fees are calculated on the notional value of each trade (price × size).
-    # Meaning (for API transactions): size * price * 1.001 = cash
-    fraction = Decimal( definer.apitransactionfee )
-    notional = Decimal(cash) / Decimal( 1 + fraction )
-
-    # Determine tick size.
-    list = definer.ticksizes
-    item = [ item['tick'] for item in list if item['currency'] == pair[:3] ]
-    tick = Decimal( item[0] )
+    # Meaning (for API transactions): size * price * ( 1 + maker fee ) = cash
+    notional = ratio( cash ) / ratio( 1, feeschedule.makerfee() )
 
-    # Determine quantity size.
-    list = definer.minimumquantities
-    item = [ item['minimumquantity'] for item in list if item['currency'] == pair[:3] ]
-    bump = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
     # Get the lowest ask in the orderbook.
     # Make an offer that's one tick better.
     # Then determine the ask order size.
     endpoint = '/v1/pubticker/' + pair
-    response = requests.get( definer.restserver + endpoint )
-    askprice = Decimal( response.json()['ask'] )
-    offering = str( Decimal( askprice - tick ).quantize( tick ) )
-    quantity = str( Decimal( notional / Decimal(offering) ).quantize( bump ) )
+    response = deadline.get( 'public', definer.restserver + endpoint )
+    askprice = response.json()['ask']
+    askticks = scale.ticks( askprice, "ask" ) - 1
+    offering = scale.pricestring( askticks )
+    quantity = scale.amountstring( scale.affordable( notional, askticks ) )
 
     # Update logs.
     logger.debug(f'Askprice: {askprice}')
@@ -211,10 +201,8 @@ def quotaask (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str(int(time.mktime(t.timetuple())*1000)),
         'symbol': pair,
         'amount': quantity,
         'price': offering,
@@ -222,9 +210,14 @@ def quotaask (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#
+# library name: gateway.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: present the order entry functions used by long-running engines as one replaceable object.
+
+# Every method blocks on the REST API and returns the parsed JSON response.
+# Orders submitted without a response raise UnconfirmedOrder. "resolve" looks them up before anything else is attempted.
+# Engines run them in a worker thread (e.g. asyncio.to_thread) and never call the ordering modules directly,
+# so a simulated exchange only has to provide the same methods.
+
+from decimal import Decimal
+
+import backstopper.informing.feeschedule as feeschedule
+
+from backstopper.ordering.frontrunner import bidorder
+from backstopper.ordering.stopper import askstoplimit
+from backstopper.ordering.liquidator import asklimit
+from backstopper.ordering.ordermanager import cancelorder, islive, ordersnapshot, resolve, UnconfirmedOrder
+
+class Gateway :
+
+    def buy (
+            self,
+            pair : str,
+            size : str,
+            tag : str = None
+        ) -> dict :
+
+        # Frontrunning (maker-or-cancel) limit bid.
+        return bidorder( pair, size, tag ).json()
+
+    def placestop (
+            self,
+            pair : str,
+            size : str,
+            stop : str,
+            sell : str,
+            tag : str = None
+        ) -> dict :
+        return askstoplimit( pair, size, stop, sell, tag ).json()
+
+    def sell (
+            self,
+            pair : str,
+            size : str,
+            sell : str,
+            tag : str = None
+        ) -> dict :
+
+        # Limit ask (filled at once when bids reach the sell price, resting otherwise).
+        return asklimit( pair, size, sell, tag ).json()
+
+    def cancel (
+            self,
+            order : str
+        ) -> dict :
+        return cancelorder( order ).json()
+
+    def resolve (
+            self,
+            unconfirmed : UnconfirmedOrder
+        ) -> dict :
+
+        # Status of the order an unconfirmed submission booked (an "OrderNotFound" error when none was booked).
+        return resolve( unconfirmed )
+
+    def status (
+            self,
+            order : str
+        ) -> dict :
+        return islive( order ).json()
+
+    def orders ( self ) -> dict :
+
+        # Every active order indexed by order id, symbol and tag (see ordermanager).
+        return ordersnapshot()
+
+    def fee ( self ) -> Decimal :
+
+        # API maker fee as a decimal (from the cached fee schedule).
+        return feeschedule.makerfee()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+#
+# library name: liquidator.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: sell at once (or rest the remainder) when a locally emulated stop is hit.
+
+import backstopper.informing.definer as definer
+import backstopper.authenticating.authenticator as authenticator
+import backstopper.recording.intentjournal as intentjournal
+import backstopper.accounting.balancecache as balancecache
+
+from backstopper.ordering.ordermanager import clientorderid, submitorder
+
+def askimmediate (
+        pair : str,
+        size : str,
+        sell : str,
+        tag : str = None
+    ) -> str :
+
+    # Construct an immediate-or-cancel limit ask payload.
+    # Everything bid at or above the sell price is taken. Whatever remains is cancelled (never rests on the orderbook).
+    endpoint = '/v1/order/new'
+    payload = {
+        'request': endpoint,
+        'symbol': pair,
+        'amount': size,
+        'price': sell,
+        'side': 'sell',
+        'type': 'exchange limit',
+        'options': ['immediate-or-cancel']
+    }
+    if tag is not None : payload['client_order_id'] = clientorderid(tag)
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
+    headers = authenticator.authenticate(payload)
+
+    request = definer.restserver + endpoint
+    response = submitorder( request, headers['restheader'], payload.get('client_order_id'), token )
+    balancecache.settle( token, response )
+    intentjournal.record(response)
+
+    return response
+
+def asklimit (
+        pair : str,
+        size : str,
+        sell : str,
+        tag : str = None
+    ) -> str :
+
+    # Construct a plain limit ask payload (what a triggered stop-limit order becomes on the exchange).
+    endpoint = '/v1/order/new'
+    payload = {
+        'request': endpoint,
+        'symbol': pair,
+        'amount': size,
+        'price': sell,
+        'side': 'sell',
+        'type': 'exchange limit'
+    }
+    if tag is not None : payload['client_order_id'] = clientorderid(tag)
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
+    headers = authenticator.authenticate(payload)
+
+    request = definer.restserver + endpoint
+    response = submitorder( request, headers['restheader'], payload.get('client_order_id'), token )
+    balancecache.settle( token, response )
+    intentjournal.record(response)
+
+    return response
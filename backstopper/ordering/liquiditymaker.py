@@ -1,16 +1,15 @@
 #!/usr/bin/env python3
 
 
-import requests
-import datetime
-import time
-
-from decimal import Decimal
-
 from backstopper.logging.logger import logger as logger
 
 import backstopper.informing.definer as definer
+import backstopper.timing.deadline as deadline
+import backstopper.informing.feeschedule as feeschedule
 import backstopper.authenticating.authenticator as authenticator
+import backstopper.accounting.balancecache as balancecache
+
+from backstopper.pricing.quantizer import tickscale, ratio
 
 def bidorder (
         pair: str,
@@ -21,10 +20,8 @@ def bidorder (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str(int(time.mktime(t.timetuple())*1000)),
         'symbol': pair,
         'amount': size,
         'price': str(last),
@@ -32,10 +29,15 @@ def bidorder (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
 
@@ -48,17 +50,14 @@ def quotabid (
     # Determine API transaction fee.
     # Refer to https://docs.gemini.com/rest-api/#basis-point.
     # Fees are calculated on the notional value of each trade (price × size).
-    # Meaning (for API transactions): size * price * 1.001 = cash
-    fraction = Decimal( definer.apitransactionfee )
-    notional = Decimal(cash) / Decimal( 1 + fraction )
+    # Meaning (for API transactions): size * price * ( 1 + maker fee ) = cash
+    notional = ratio( cash ) / ratio( 1, feeschedule.makerfee() )
 
-    # Determine minimum order size (let's call it a tock).
-    list = definer.minimumorders
-    item = [ item['minimumorder'] for item in list if item['currency'] == pair[:3] ]
-    tock = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
-    # Determine bid size.
-    quantity = str( Decimal( notional / Decimal(cost) ).quantize( tock ) )
+    # Determine order size.
+    quantity = scale.amountstring( scale.affordable( notional, scale.ticks( cost ) ) )
     bidprice = str(cost)
 
     # Update logs.
@@ -68,10 +67,8 @@ def quotabid (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str(int(time.mktime(t.timetuple())*1000)),
         'symbol': pair,
         'amount': quantity,
         'price': bidprice,
@@ -79,10 +76,15 @@ def quotabid (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
 
@@ -95,10 +97,8 @@ def askorder (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str(int(time.mktime(t.timetuple())*1000)),
         'symbol': pair,
         'amount': size,
         'price': str(last),
@@ -106,10 +106,15 @@ def askorder (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
 
@@ -122,17 +127,14 @@ def quotaask (
     # Determine API transaction fee.
     # Refer to https://docs.gemini.com/rest-api/#basis-point.
     # Fees are calculated on the notional value of each trade (price × size).
-    # Meaning (for API transactions): size * price * 1.001 = cash
-    fraction = Decimal( definer.apitransactionfee )
-    notional = Decimal(cash) / Decimal( 1 + fraction )
+    # Meaning (for API transactions): size * price * ( 1 + maker fee ) = cash
+    notional = ratio( cash ) / ratio( 1, feeschedule.makerfee() )
 
-    # Determine minimum order size (let's call it a tock).
-    list = definer.minimumorders
-    item = [ item['minimumorder'] for item in list if item['currency'] == pair[:3] ]
-    tock = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
-    # Determine bid size.
-    quantity = str( Decimal( notional / Decimal(cost) ).quantize( tock ) )
+    # Determine order size.
+    quantity = scale.amountstring( scale.affordable( notional, scale.ticks( cost ) ) )
     askprice = str(cost)
 
     # Update logs.
@@ -142,10 +144,8 @@ def quotaask (
     # Construct sell order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str(int(time.mktime(t.timetuple())*1000)),
         'symbol': pair,
         'amount': quantity,
         'price': askprice,
@@ -153,9 +153,14 @@ def quotaask (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
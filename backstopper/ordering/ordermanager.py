@@ -5,32 +5,47 @@
 # library created: 20220816
 # library purpose: check order number specified is active on the orderbook (i.e. has remaining size and has not been canceled).
 
+# Bulk Operations:
+#  - "ordersnapshot" lists every active order of the account in one request (/v1/orders) and indexes it by order id, symbol and tag.
+#  - "cancelsession" cancels every order placed with the signing API key (/v1/order/cancel/session) in one request.
+#  - "cancelall" cancels every order of the account (/v1/order/cancel/all) in one request.
+#  - "cancelorders" cancels the active orders of a symbol and/or tag (one request for the snapshot plus one per order matched).
+#    It never falls back on a cancel-all: orders placed after the snapshot (e.g. by other bots) would be cancelled too.
+#
+# Tags are carried in the client order id ( "<tag>.<sequence>" , see "clientorderid" ) of orders submitted with a tag.
+#
+# Unconfirmed Orders:
+#  - "submitorder" posts a new order. A failure that may come after the exchange received it (e.g. a read timeout) raises
+#    UnconfirmedOrder when the order carries a client order id. The order may be live: nothing is retried and no balance
+#    reservation is returned until "resolve" looked it up by its client order id.
+
 import time
-import datetime
 import requests
+import itertools
 
 from backstopper.logging.logger import logger as logger
 
 import backstopper.informing.definer as definer
+import backstopper.timing.deadline as deadline
 import backstopper.authenticating.authenticator as authenticator
+import backstopper.accounting.balancecache as balancecache
 
 def islive (
-        order : str
+        order : str,
+        trades : bool = False
     ) -> str :
 
-    # Construct order status payload.
+    # Construct order status payload (optionally listing the order's trades with their fees).
     endpoint = '/v1/order/status'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str( int ( time.mktime( t.timetuple() ) * 1000 ) ),
         'order_id': order,
-        'include_trades': False
+        'include_trades': trades
     }
     headers = authenticator.authenticate(payload)
     request = definer.restserver + endpoint
     
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    response = deadline.post('account', request, data = None, headers = headers['restheader'])
 
     return response
 
@@ -40,15 +55,199 @@ def cancelorder (
 
     # Construct order status payload.
     endpoint = '/v1/order/cancel'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str( int ( time.mktime( t.timetuple() ) * 1000 ) ),
         'order_id': order
     }
     headers = authenticator.authenticate(payload)
     request = definer.restserver + endpoint
 
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    balancecache.cancelled(response)
+
+    return response
+
+class UnconfirmedOrder ( Exception ) :
+
+    # A new order without a response that the exchange may have booked anyway (see "resolve").
+    def __init__ (
+            self,
+            clientid : str,
+            token : int,
+            error : Exception
+        ) -> None :
+        super().__init__( f'No response to order {clientid} ({type( error ).__name__}: {error}). ' )
+        self.clientid = clientid
+        self.token = token
+
+def submitorder (
+        request : str,
+        headers : dict,
+        clientid : str = None,
+        token : int = None
+    ) -> str :
+
+    # Post a new order (the balance reservation given is returned when the exchange surely never received it).
+    try : return deadline.post('order', request, data = None, headers = headers)
+    except ( deadline.DeadlineExceeded, requests.ConnectTimeout ) :
+        balancecache.release( token )
+        raise
+    except Exception as e :
+        if clientid is None :
+            balancecache.release( token )
+            raise
+        raise UnconfirmedOrder( clientid, token, e ) from e
+
+def clientorder (
+        clientid : str
+    ) -> str :
+
+    # Construct order status payload (by client order id).
+    endpoint = '/v1/order/status'
+    payload = {
+        'request': endpoint,
+        'client_order_id': clientid,
+        'include_trades': False
+    }
+    headers = authenticator.authenticate(payload)
+    request = definer.restserver + endpoint
+
+    response = deadline.post('account', request, data = None, headers = headers['restheader'])
+
+    return response
+
+def resolve (
+        unconfirmed : UnconfirmedOrder,
+        persist : bool = False
+    ) -> dict :
+
+    # The status of the order an unconfirmed submission booked, or an "OrderNotFound" error when it was never booked.
+    # Its balance reservation is settled either way. With "persist" the lookup is retried (3 seconds apart) until it answers.
+    while True :
+        try :
+            with deadline.Deadline( definer.stepbudget ) : order = clientorder( unconfirmed.clientid ).json()
+            if isinstance( order, list ) : order = order[0] if order else { 'result': 'error', 'reason': 'OrderNotFound', 'message': 'No such order.' }
+            if not isinstance( order, dict ) or 'order_id' not in order and order.get( 'reason' ) != 'OrderNotFound' :
+                raise RuntimeError( f'Unexpected order status: {order}' )
+        except Exception as e :
+            if not persist : raise
+            logger.warning ( f'Unable to look up order {unconfirmed.clientid}. Error: {e}' )
+            time.sleep(3) # Sleep for 3 seconds since we are interfacing with a rate limited Gemini REST API.
+            continue
+        balancecache.settleorder( unconfirmed.token, order )
+        logger.info ( f'Order {unconfirmed.clientid} was {"booked as " + str( order[ "order_id" ] ) if "order_id" in order else "never booked"}. ' )
+        return order
+
+sequence = itertools.count()
+
+def clientorderid (
+        tag : str
+    ) -> str :
+
+    # Unique client order id carrying a tag (e.g. a position name) that "tagof" recovers.
+    return f'{tag}.{int( time.time() * 1000 )}{next( sequence ) % 1000:03d}'
+
+def tagof (
+        order : dict
+    ) -> str :
+    clientid = order.get( 'client_order_id' ) or ''
+    tag, separator, unique = clientid.rpartition( '.' )
+    return tag if separator else None
+
+def activeorders ( ) -> str :
+
+    # Construct active orders payload.
+    endpoint = '/v1/orders'
+    payload = {
+        'request': endpoint
+    }
+    headers = authenticator.authenticate(payload)
+    request = definer.restserver + endpoint
+
+    response = deadline.post('account', request, data = None, headers = headers['restheader'])
+
+    return response
+
+def ordersnapshot ( ) -> dict :
+
+    # Every active order in one round trip, indexed by order id, symbol and tag.
+    orders = activeorders().json()
+    if not isinstance( orders, list ) : raise RuntimeError( f'Unable to list active orders: {orders}' )
+
+    snapshot = { 'orders': {}, 'symbols': {}, 'tags': {} }
+    for order in orders :
+        snapshot[ 'orders' ][ order[ 'order_id' ] ] = order
+        snapshot[ 'symbols' ].setdefault( order[ 'symbol' ].upper(), [] ).append( order[ 'order_id' ] )
+        tag = tagof( order )
+        if tag is not None : snapshot[ 'tags' ].setdefault( tag, [] ).append( order[ 'order_id' ] )
+    return snapshot
+
+def cancelsession ( ) -> str :
+
+    # Construct cancel session payload (every order placed with the signing API key).
+    endpoint = '/v1/order/cancel/session'
+    payload = {
+        'request': endpoint
+    }
+    headers = authenticator.authenticate(payload)
+    request = definer.restserver + endpoint
+
+    response = deadline.post('order', request, data = None, headers = headers['restheader'])
+
+    return response
+
+def cancelall ( ) -> str :
+
+    # Construct cancel all payload (every order of the account, whatever the session).
+    endpoint = '/v1/order/cancel/all'
+    payload = {
+        'request': endpoint
+    }
+    headers = authenticator.authenticate(payload)
+    request = definer.restserver + endpoint
+
+    response = deadline.post('order', request, data = None, headers = headers['restheader'])
+
+    return response
+
+def cancelorders (
+        symbol : str = None,
+        tag : str = None,
+        snapshot : dict = None
+    ) -> dict :
+
+    # Cancel the active orders matching a symbol and/or a tag. Return the ids cancelled and the ids rejected.
+    snapshot = snapshot or ordersnapshot()
+    matched = set( snapshot[ 'orders' ] )
+    if symbol is not None : matched &= set( snapshot[ 'symbols' ].get( symbol.upper(), [] ) )
+    if tag is not None : matched &= set( snapshot[ 'tags' ].get( tag, [] ) )
+
+    result = { 'cancelled': [], 'rejected': [] }
+    for order in sorted( matched ) :
+        try :
+            response = cancelorder( order ).json()
+        except Exception as e :
+            logger.warning ( f'Unable to cancel order {order}. Error: {e}' )
+            result[ 'rejected' ].append( order )
+            continue
+        result[ 'cancelled' if response.get( 'is_cancelled' ) else 'rejected' ].append( order )
+    return result
+
+if __name__ == "__main__":
+
+    import sys
+    import json
+
+    # Set default action in case a BASH wrapper has not been used.
+    # Usage: list | cancel [symbol|-] [tag]
+    action = sys.argv[1] if len( sys.argv ) > 1 else 'list'
+
+    if action == 'list' :
+        snapshot = ordersnapshot()
+        logger.info ( f'{len( snapshot["orders"] )} active orders. ' )
+        logger.info ( json.dumps( { 'symbols': snapshot[ 'symbols' ], 'tags': snapshot[ 'tags' ] }, sort_keys = True, indent = 4 ) )
 
-    return response
\ No newline at end of file
+    elif action == 'cancel' :
+        symbol = sys.argv[2] if len( sys.argv ) > 2 and sys.argv[2] != '-' else None
+        tag = sys.argv[3] if len( sys.argv ) > 3 else None
+        logger.info ( f'{cancelorders( symbol, tag )}' )
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+#
+# library name: requoter.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: keep a maker-or-cancel bid at the top of the book until it fills, the deadline passes or prices drift away.
+
+# Design Outline:
+#  1. Stream the top of the book (v1 market data with "top_of_book") and the closed orders of the account (order events).
+#  2. Bid one tick above the best bid (never at or above the best ask) with a maker-or-cancel limit order.
+#  3. Requote at once:
+#       - when the bid is no longer the best bid (cancel it, then bid one tick above the new best bid),
+#       - when the exchange rejects the bid because it would have taken liquidity (post-only rejection),
+#       - when the exchange closes the bid with part of it unfilled.
+#  4. Give up once "deadline" seconds have passed or once the best bid rose more than "maxdrift" (a decimal) above the first quote.
+#     Whatever was filled until then is reported (partially filled entries are kept).
+#     Failed submissions and cancellations (timeouts, connection errors) are retried after a pause. Insufficient funds end the entry.
+#     Any other error ends it too, after the bid was withdrawn, so the fills are always reported.
+#     A fill below the minimum order of the asset (definer.minimumorders) is reported as 'dust': no stop could ever sell it.
+#     Requoting also ends once the unfilled remainder is below that minimum (no bid for it would be accepted).
+#  5. Time to fill, requotes, rejections and outcomes are recorded in the metrics module ("requoter.*").
+#
+# Usage:
+#   entry = asyncio.run( Requoter( 'ETHUSD', '0.001' ).run() )   # entry[ 'executed_amount' ] at entry[ 'price' ] (average).
+#   entry[ 'orders' ] lists every bid booked (e.g. to look up their fills and fees, see ledger.bookorder).
+
+import sys
+import json
+import time
+import asyncio
+
+import backstopper.informing.definer as definer
+import backstopper.logging.metrics as metrics
+import backstopper.timing.deadline as deadline
+import backstopper.authenticating.authenticator as authenticator
+
+from backstopper.logging.logger import logger as logger
+from backstopper.accounting.balancecache import InsufficientFunds
+from backstopper.ordering.frontrunner import postbid
+from backstopper.ordering.ordermanager import cancelorder, islive, resolve, UnconfirmedOrder
+from backstopper.pricing.quantizer import tickscale, ratio, divide
+
+class Requoter :
+
+    def __init__ (
+            self,
+            pair : str,
+            size : str,
+            tag : str = None,
+            deadline : float = None,
+            maxdrift : str = None
+        ) -> None :
+
+        self.pair = pair.upper()
+        self.scale = tickscale( pair )
+        self.tag = tag
+        self.deadline = deadline if deadline is not None else definer.entrydeadline
+        self.maxdrift = maxdrift if maxdrift is not None else definer.entrydrift
+
+        # Quantities in quanta and prices in ticks. "notional" sums ticks times quanta of every fill (for the average price).
+        self.target : int = self.scale.quanta( size )
+        self.filled : int = 0
+        self.notional : int = 0
+        minimums = [ item[ 'minimumorder' ] for item in definer.minimumorders if item[ 'currency' ] == self.scale.basecurrency ]
+        self.minimum : int = self.scale.quanta( minimums[0], 'ask' ) if minimums else 0
+
+        # Best bid and ask (ticks) of the book and the bid order currently resting (if any).
+        self.best : dict = { 'bid': None, 'ask': None }
+        self.order : str = None
+        self.price : int = None
+        self.closedorders : dict = {}
+        self.settled : set = set()
+        self.changed : asyncio.Event = None
+
+        self.quotes : int = 0
+        self.rejections : int = 0
+
+    # Streams.
+
+    async def book ( self ) -> None :
+
+        # Top of book changes (reconnecting whenever the connection drops).
+        connection = definer.sockserver + '/v1/marketdata/' + self.pair.lower() + '?top_of_book=true&bids=true&offers=true&trades=false&heartbeat=true'
+        while True :
+            try :
+                async with await deadline.connect( connection ) as websocket :
+                    while True :
+                        message = await deadline.recv( websocket )
+                        for event in json.loads( message ).get( 'events', () ) :
+                            if event.get( 'type' ) != 'change' : continue
+                            side = 'bid' if event[ 'side' ] == 'bid' else 'ask'
+                            ticks = self.scale.ticks( event[ 'price' ] )
+                            if event[ 'remaining' ] != '0' : self.best[ side ] = ticks
+                            elif self.best[ side ] == ticks : self.best[ side ] = None
+                        self.changed.set()
+            except asyncio.CancelledError :
+                raise
+            except Exception as e :
+                logger.debug ( f'{e} : The {self.pair} top of book connection failed. Let\'s reestablish the connection and try again! ' )
+                self.best = { 'bid': None, 'ask': None }
+                await asyncio.sleep( 1 )
+
+    async def orderevents ( self ) -> None :
+
+        # Closed orders of the account in this pair (reconnecting whenever the connection drops).
+        connection = definer.sockserver + '/v1/order/events?eventTypeFilter=closed&symbolFilter=' + self.pair.lower()
+        while True :
+            try :
+                header = authenticator.authenticate( { 'request': '/v1/order/events' } )
+                async with await deadline.connect( connection, extra_headers = header[ 'sockheader' ] ) as websocket :
+                    while True :
+                        message = await deadline.recv( websocket )
+                        dictionary = json.loads( message )
+                        if not isinstance( dictionary, list ) : continue
+                        for event in dictionary :
+                            # Kept by order id: a bid can close before the REST response booking it arrives.
+                            if event.get( 'order_id' ) in self.settled : continue
+                            self.closedorders[ event.get( 'order_id' ) ] = event
+                            while len( self.closedorders ) > 256 : self.closedorders.pop( next( iter( self.closedorders ) ) )
+                            self.changed.set()
+            except asyncio.CancelledError :
+                raise
+            except Exception as e :
+                logger.debug ( f'{e} : The order events connection failed. Let\'s reestablish the connection and try again! ' )
+                await asyncio.sleep( 1 )
+
+    # Orders.
+
+    def quote ( self ) -> int :
+
+        # One tick above the best bid but below the best ask (a maker-or-cancel bid at the ask would be rejected).
+        ticks = self.best[ 'bid' ] + 1
+        if self.best[ 'ask' ] is not None : ticks = min( ticks, self.best[ 'ask' ] - 1 )
+        return ticks
+
+    async def place (
+            self,
+            ticks : int
+        ) -> bool :
+
+        # Post the unfilled remainder. Return False when it was not booked (e.g. a post-only rejection).
+        size = self.scale.amountstring( self.target - self.filled )
+        self.quotes += 1
+        try :
+            response = ( await asyncio.to_thread( postbid, self.pair, size, self.scale.pricestring( ticks ), self.tag ) ).json()
+        except UnconfirmedOrder as e :
+            # The bid may be live (and filling). Look it up before quoting again.
+            logger.warning ( f'{e}Looking it up. ' )
+            response = await asyncio.to_thread( resolve, e, True )
+        if response.get( 'is_cancelled' ) or 'order_id' not in response :
+            self.rejections += 1
+            metrics.increment( 'requoter.rejections', pair = self.pair )
+            logger.debug ( f'Bid for {size} at {self.scale.pricestring( ticks )} was not booked: {response.get( "reason", response )}' )
+            return False
+        self.order = response[ 'order_id' ]
+        self.price = ticks
+        logger.info ( f'Bid order {self.order} for {size} {self.pair[:3]} at {self.scale.pricestring( ticks )} {self.pair[3:]} is booked. ' )
+        return True
+
+    def account (
+            self,
+            response : dict
+        ) -> None :
+
+        # Add the fills of a closed (or cancelled) order and forget the order.
+        executed = self.scale.quanta( response.get( 'executed_amount' ) or '0' )
+        if executed :
+            self.filled += executed
+            self.notional += executed * self.scale.ticks( response[ 'avg_execution_price' ] )
+        self.settled.add( self.order )
+        self.closedorders.pop( self.order, None )
+        self.order = None
+        self.price = None
+
+    async def withdraw ( self ) -> bool :
+
+        # Cancel the resting bid (or learn that it closed meanwhile). Return False when it is still live.
+        def settle () -> dict :
+            response = cancelorder( self.order ).json()
+            if not response.get( 'is_cancelled' ) : response = islive( self.order ).json()
+            return response
+        response = await asyncio.to_thread( settle )
+        if response.get( 'is_live' ) or 'executed_amount' not in response : return False
+        self.account( response )
+        return True
+
+    # Entry.
+
+    async def run ( self ) -> dict :
+
+        self.changed = asyncio.Event()
+        started = time.monotonic()
+        streams = [ asyncio.create_task( self.book() ), asyncio.create_task( self.orderevents() ) ]
+        outcome, limit = 'deadline', None
+
+        try :
+            while True :
+                remaining = self.deadline - ( time.monotonic() - started )
+                if remaining <= 0 : break
+                if self.order is not None and self.order in self.closedorders :
+                    self.account( self.closedorders[ self.order ] )
+                    if self.filled >= self.target :
+                        outcome = 'filled'
+                        break
+                if self.order is None and 0 < self.target - self.filled < self.minimum :
+                    outcome = 'remainder'
+                    break
+                if self.order is None and self.best[ 'bid' ] is not None :
+                    ticks = self.quote()
+                    if limit is None : limit = self.scale.scaleticks( ticks, ratio( 1, self.maxdrift ), 'ask' )
+                    if ticks > limit :
+                        outcome = 'drift'
+                        break
+                    # Resubmit at once when a rejected bid was already overtaken by a change of the book.
+                    self.changed.clear()
+                    try : placed = await self.place( ticks )
+                    except InsufficientFunds as e :
+                        logger.warning ( f'Unable to bid for the rest of the {self.pair} entry. Error: {e}' )
+                        outcome = 'funds'
+                        break
+                    except Exception as e :
+                        logger.warning ( f'Unable to submit a {self.pair} bid. Error: {e}' )
+                        await asyncio.sleep( min( remaining, 3 ) ) # Since we are interfacing with a rate limited Gemini REST API.
+                        continue
+                    if placed or self.changed.is_set() : continue
+                elif self.order is not None and self.best[ 'bid' ] is not None and self.best[ 'bid' ] > self.price :
+                    # Outbid. Requote as soon as the bid is withdrawn.
+                    try : withdrawn = await self.withdraw()
+                    except Exception as e :
+                        logger.warning ( f'Unable to cancel bid order {self.order}. Error: {e}' )
+                        await asyncio.sleep( min( remaining, 3 ) )
+                        continue
+                    if withdrawn :
+                        if self.filled >= self.target :
+                            outcome = 'filled'
+                            break
+                        continue
+                # Wait for the book (or the order) to change.
+                self.changed.clear()
+                try : await asyncio.wait_for( self.changed.wait(), min( remaining, 1.0 ) )
+                except asyncio.TimeoutError : pass
+        except Exception as e :
+            logger.error ( f'The {self.pair} entry stopped. Error: {e}' )
+            outcome = 'error'
+        finally :
+            # Never leave a bid behind.
+            while self.order is not None :
+                try :
+                    if not await self.withdraw() : await asyncio.sleep( 1 )
+                except Exception as e :
+                    logger.warning ( f'Unable to cancel bid order {self.order}. Error: {e}' )
+                    await asyncio.sleep( 3 ) # Since we are interfacing with a rate limited Gemini REST API.
+            for stream in streams : stream.cancel()
+            await asyncio.gather( *streams, return_exceptions = True )
+
+        elapsed = time.monotonic() - started
+        requotes = max( 0, self.quotes - 1 )
+        if self.filled >= self.target : outcome = 'filled'
+        elif 0 < self.filled < self.minimum : outcome = 'dust'
+        metrics.increment( 'requoter.outcomes', pair = self.pair, outcome = outcome )
+        metrics.increment( 'requoter.requotes', requotes, pair = self.pair )
+        if outcome == 'filled' : metrics.observe( 'requoter.timetofillms', 1000 * elapsed, pair = self.pair )
+        averageprice = self.scale.pricestring( divide( self.notional, self.filled ) ) if self.filled else None
+        logger.info ( f'Entry {outcome} after {elapsed:,.1f} seconds: {self.scale.amountstring( self.filled )} {self.pair[:3]} filled '
+                      f'at {averageprice} {self.pair[3:]} (requotes: {requotes}, rejections: {self.rejections}). ' )
+        return { 'symbol': self.pair.lower(), 'outcome': outcome, 'price': averageprice,
+                 'executed_amount': self.scale.amountstring( self.filled ), 'remaining_amount': self.scale.amountstring( self.target - self.filled ),
+                 'minimum': self.scale.amountstring( self.minimum ), 'requotes': requotes, 'rejections': self.rejections, 'elapsed': elapsed,
+                 'orders': list( self.settled ) }
+
+if __name__ == "__main__":
+
+    # Set default trading pair and size in case a BASH wrapper has not been used.
+    pair : str = 'ETHUSD'
+    size : str = '0.001'
+
+    # Override defaults with command line parameters from BASH wrapper.
+    if len( sys.argv ) == 3 :
+        pair = sys.argv[1]
+        size = sys.argv[2]
+    else : logger.warning ( f'Incorrect number of command line arguments. Using default values of {pair} and {size}...' )
+
+    try : logger.info ( f'{asyncio.run( Requoter( pair, size ).run() )}' )
+    except KeyboardInterrupt : pass
@@ -1,38 +1,30 @@
 #!/usr/bin/env python3
 
 
-import requests
-import datetime
-import time
-
-from decimal import Decimal
-
 from backstopper.logging.logger import logger as logger
 
 import backstopper.informing.definer as definer
+import backstopper.timing.deadline as deadline
+import backstopper.informing.feeschedule as feeschedule
 import backstopper.authenticating.authenticator as authenticator
+import backstopper.accounting.balancecache as balancecache
+
+from backstopper.pricing.quantizer import tickscale, ratio
 
 def bidorder (
         pair : str,
         size : str,
     ) -> str :
 
-    # Determine tick size.
-    list = definer.ticksizes
-    item = [ item['tick'] for item in list if item['currency'] == pair[:3] ]
-    tick = Decimal( item[0] )
-
-    # Determine minimum order size (let's call it a tock).
-    list = definer.minimumorders
-    item = [ item['minimumorder'] for item in list if item['currency'] == pair[:3] ]
-    tock = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
     # Get the lowest ask in the orderbook.
     endpoint = '/v1/pubticker/' + pair
-    response = requests.get( definer.restserver + endpoint )
-    askprice = Decimal( response.json()['ask'] )
-    bidprice = str( Decimal( askprice - tick ).quantize( askprice ) )
-    quantity = str( Decimal( size ).quantize( tick ) )
+    response = deadline.get( 'public', definer.restserver + endpoint )
+    askprice = response.json()['ask']
+    bidprice = scale.pricestring( scale.ticks( askprice ) - 1 )
+    quantity = scale.amountstring( scale.quanta( size ) )
 
     # Update logs.
     logger.debug(f'Askprice: {askprice}')
@@ -42,10 +34,8 @@ def bidorder (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str( int ( time.mktime( t.timetuple() ) * 1000 ) ),
         'symbol': pair,
         'amount': quantity,
         'price': bidprice,
@@ -53,10 +43,15 @@ def bidorder (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
 
@@ -68,27 +63,20 @@ def quotabid (
     # Determine API transaction fee.
     # Refer to https://docs.gemini.com/rest-api/#basis-point.
     # Fees are calculated on the notional value of each trade (price × size).
-    # Meaning (for API transactions): size * price * 1.001 = cash
-    fraction = Decimal( definer.apitransactionfee )
-    notional = Decimal(cash) / Decimal( 1 + fraction )
+    # Meaning (for API transactions): size * price * ( 1 + maker fee ) = cash
+    notional = ratio( cash ) / ratio( 1, feeschedule.makerfee() )
 
-    # Determine tick size.
-    list = definer.ticksizes
-    item = [ item['tick'] for item in list if item['currency'] == pair[:3] ]
-    tick = Decimal( item[0] )
-
-    # Determine minimum order size (let's call it a tock).
-    list = definer.minimumorders
-    item = [ item['minimumorder'] for item in list if item['currency'] == pair[:3] ]
-    tock = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
     # Get the lowest ask in the orderbook.
     # Then determine the bid order size.
     endpoint = '/v1/pubticker/' + pair
-    response = requests.get( definer.restserver + endpoint )
-    askprice = Decimal( response.json()['ask'] )
-    bidprice = str( Decimal( askprice - tick ).quantize( askprice ) )
-    quantity = str( Decimal( notional / Decimal(bidprice) ).quantize( tick ) )
+    response = deadline.get( 'public', definer.restserver + endpoint )
+    askprice = response.json()['ask']
+    bidticks = scale.ticks( askprice ) - 1
+    bidprice = scale.pricestring( bidticks )
+    quantity = scale.amountstring( scale.affordable( notional, bidticks ) )
 
     # Update logs.
     logger.debug(f'Askprice: {askprice}')
@@ -98,10 +86,8 @@ def quotabid (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str( int ( time.mktime( t.timetuple() ) * 1000 ) ),
         'symbol': pair,
         'amount': quantity,
         'price': bidprice,
@@ -109,10 +95,15 @@ def quotabid (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
 
@@ -121,22 +112,15 @@ def askorder (
         size : str,
     ) -> str :
 
-    # Determine tick size.
-    list = definer.ticksizes
-    item = [ item['tick'] for item in list if item['currency'] == pair[:3] ]
-    tick = Decimal( item[0] )
-
-    # Determine minimum order size (let's call it a tock).
-    list = definer.minimumorders
-    item = [ item['minimumorder'] for item in list if item['currency'] == pair[:3] ]
-    tock = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
     # Get the highest bid in the orderbook.
     endpoint = '/v1/pubticker/' + pair
-    response = requests.get( definer.restserver + endpoint )
-    bidprice = Decimal( response.json()['bid'] )
-    askprice = str( Decimal( bidprice + tick ).quantize( bidprice ) )
-    quantity = str( Decimal( size ).quantize( tick ) )
+    response = deadline.get( 'public', definer.restserver + endpoint )
+    bidprice = response.json()['bid']
+    askprice = scale.pricestring( scale.ticks( bidprice ) + 1 )
+    quantity = scale.amountstring( scale.quanta( size ) )
 
     # Update logs.
     logger.debug(f'Bidprice: {bidprice}')
@@ -146,10 +130,8 @@ def askorder (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str( int ( time.mktime( t.timetuple() ) * 1000 ) ),
         'symbol': pair,
         'amount': quantity,
         'price': askprice,
@@ -157,10 +139,15 @@ def askorder (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
 
@@ -172,27 +159,20 @@ def quotaask (
     # Determine API transaction fee.
     # Refer to https://docs.gemini.com/rest-api/#basis-point.
     # Fees are calculated on the notional value of each trade (price × size).
-    # Meaning (for API transactions): size * price * 1.001 = cash
-    fraction = Decimal( definer.apitransactionfee )
-    notional = Decimal(cash) / Decimal( 1 + fraction )
-
-    # Determine tick size.
-    list = definer.ticksizes
-    item = [ item['tick'] for item in list if item['currency'] == pair[:3] ]
-    tick = Decimal( item[0] )
+    # Meaning (for API transactions): size * price * ( 1 + maker fee ) = cash
+    notional = ratio( cash ) / ratio( 1, feeschedule.makerfee() )
 
-    # Determine minimum order size (let's call it a tock).
-    list = definer.minimumorders
-    item = [ item['minimumorder'] for item in list if item['currency'] == pair[:3] ]
-    tock = Decimal( item[0] )
+    # Determine tick size and quantity increments.
+    scale = tickscale( pair )
 
     # Get the highest bid in the orderbook.
     # Then determine the ask order size.
     endpoint = '/v1/pubticker/' + pair
-    response = requests.get( definer.restserver + endpoint )
-    bidprice = Decimal( response.json()['bid'] )
-    askprice = str( Decimal( bidprice + tick ).quantize( bidprice ) )
-    quantity = str( Decimal( notional / Decimal(askprice) ).quantize( tick ) )
+    response = deadline.get( 'public', definer.restserver + endpoint )
+    bidprice = response.json()['bid']
+    askticks = scale.ticks( bidprice ) + 1
+    askprice = scale.pricestring( askticks )
+    quantity = scale.amountstring( scale.affordable( notional, askticks ) )
 
     # Update logs.
     logger.debug(f'Bidprice: {bidprice}')
@@ -202,10 +182,8 @@ def quotaask (
     # Construct buy order payload.
     # Use 'options': ['maker-or-cancel'] for post only orders.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str( int ( time.mktime( t.timetuple() ) * 1000 ) ),
         'symbol': pair,
         'amount': quantity,
         'price': askprice,
@@ -213,9 +191,14 @@ def quotaask (
         'type': 'exchange limit',
         'options': ['maker-or-cancel']
     }
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    try : response = deadline.post('order', request, data = None, headers = headers['restheader'])
+    except Exception :
+        balancecache.release( token )
+        raise
+    balancecache.settle( token, response )
 
     return response
@@ -5,30 +5,29 @@
 # library created: 20220819
 # library purpose: submit a stop-limit order to the orderbook with the Gemini REST API
 
-import requests
-import datetime
-import time
-
 from backstopper.logging.logger import logger as logger
 from backstopper.messaging.messenger import sendmessage as sendmessage
 
 import backstopper.informing.definer as definer
 import backstopper.authenticating.authenticator as authenticator
+import backstopper.recording.intentjournal as intentjournal
+import backstopper.accounting.balancecache as balancecache
+
+from backstopper.ordering.ordermanager import clientorderid, submitorder
 
 def askstoplimit(
         pair : str,
         size : str,
         stop : str,
-        sell : str
+        sell : str,
+        tag : str = None
     ) -> str :
 
     # Construct stop loss order payload.
     # Note that sell orders require the stop_price to be greater than the price.
     endpoint = '/v1/order/new'
-    t = datetime.datetime.now()
     payload = {
         'request': endpoint,
-        'nonce': str( int ( time.mktime( t.timetuple() ) * 1000 ) ),
         'symbol': pair,
         'amount': size,
         'stop_price': stop,
@@ -36,9 +35,14 @@ def askstoplimit(
         'side': 'sell',
         'type': 'exchange stop limit'
     }
+    if tag is not None : payload['client_order_id'] = clientorderid(tag)
+    token = balancecache.reserveorder( payload ) # Refuse orders without the funds before signing.
     headers = authenticator.authenticate(payload)
 
+    # Without a response the order may be live (see ordermanager.UnconfirmedOrder).
     request = definer.restserver + endpoint
-    response = requests.post(request, data = None, headers = headers['restheader'])
+    response = submitorder( request, headers['restheader'], payload.get('client_order_id'), token )
+    balancecache.settle( token, response )
+    intentjournal.record(response)
     
     return response
\ No newline at end of file
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+#
+# library name: quantizer.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: represent prices and quantities as integer ticks/quanta of a trading pair (instead of Decimal objects).
+
+# Design Outline:
+#  1. Each trading pair gets one TickScale built from the tick size and quantity increments in definer.
+#  2. Wire strings (REST responses and websocket events) are parsed straight into integers without allocating Decimals.
+#  3. Integers compare and add exactly, so hot paths (like trademonitor) work on plain ints.
+#  4. Ratios (discounts and fees) are exact fractions prepared once. Scaling by a ratio rounds towards the safe side:
+#       - "bid" rounds down (never pay more than intended),
+#       - "ask" rounds up (never sell for less than intended),
+#       - None rounds to the nearest tick (ties to even, the same as Decimal.quantize).
+#  5. TickPrice wraps ticks with their scale for readable strategy code and only becomes a string at the REST boundary.
+
+import functools
+
+from decimal import Decimal
+from fractions import Fraction
+
+import backstopper.informing.definer as definer
+
+def divide (
+        numerator : int,
+        denominator : int,
+        side : str = None
+    ) -> int :
+
+    # Integer division rounded towards the side specified (denominator must be positive).
+    if side == "bid" : return numerator // denominator
+    if side == "ask" : return -( -numerator // denominator )
+    quotient, remainder = divmod( numerator, denominator )
+    if 2 * remainder > denominator or ( 2 * remainder == denominator and quotient & 1 ) : quotient += 1
+    return quotient
+
+def rational ( value ) -> tuple :
+
+    # Convert a wire string (or an int/Decimal/Fraction) into an exact ( numerator, denominator ) pair.
+    # Plain decimal strings (the only format Gemini sends) take the fast path.
+    if isinstance( value, str ) and 'e' not in value and 'E' not in value :
+        whole, point, fraction = value.strip().partition( '.' )
+        return ( int( whole + fraction ), 10 ** len( fraction ) ) if fraction else ( int( whole ), 1 )
+    if isinstance( value, int ) : return ( value, 1 )
+    if isinstance( value, float ) : value = Decimal( repr( value ) )
+    return Fraction( value ).as_integer_ratio()
+
+def ratio ( *values ) -> Fraction :
+
+    # Sum decimal strings into an exact ratio. For example: ratio( 1, sellinput, fee ) or ratio( 1, '-0.0100' ).
+    return sum( ( Fraction( *rational( value ) ) for value in values ), Fraction( 0 ) )
+
+class TickScale :
+
+    __slots__ = ( 'pair', 'basecurrency', 'quotecurrency', 'tick', 'bump', 'ticknumerator', 'tickdenominator',
+                  'bumpnumerator', 'bumpdenominator', 'tickdigits', 'bumpdigits' )
+
+    def __init__ (
+            self,
+            pair : str,
+            tick : str,
+            bump : str,
+            basecurrency : str = None
+        ) -> None :
+
+        self.pair = pair.upper()
+        self.basecurrency = basecurrency or self.pair[:3]
+        self.quotecurrency = self.pair[ len( self.basecurrency ): ]
+
+        # Keep the increments as exact fractions (e.g. '0.01' is 1/100).
+        self.tick = tick
+        self.bump = bump
+        self.ticknumerator, self.tickdenominator = rational( tick )
+        self.bumpnumerator, self.bumpdenominator = rational( bump )
+        self.tickdigits = max( 0, -Decimal( tick ).normalize().as_tuple().exponent )
+        self.bumpdigits = max( 0, -Decimal( bump ).normalize().as_tuple().exponent )
+
+    def __repr__ ( self ) -> str :
+        return f'TickScale({self.pair}, tick={self.tick}, bump={self.bump})'
+
+    # Prices.
+
+    def ticks (
+            self,
+            price,
+            side : str = None
+        ) -> int :
+
+        # Parse a price into integer ticks (rounding towards the side specified when off-tick).
+        # Fast path: an on-grid wire string with a power of ten tick (e.g. '1501.37' with a 0.01 tick).
+        if self.ticknumerator == 1 and price.__class__ is str :
+            whole, point, fraction = price.partition( '.' )
+            if len( fraction ) <= self.tickdigits and 'e' not in price :
+                return int( whole + fraction.ljust( self.tickdigits, '0' ) )
+        numerator, denominator = rational( price )
+        return divide( numerator * self.tickdenominator, denominator * self.ticknumerator, side )
+
+    def pricestring (
+            self,
+            ticks : int
+        ) -> str :
+
+        # Render ticks as the wire string expected by the REST API (e.g. 150012 ticks of 0.01 is '1500.12').
+        return self.render( ticks * self.ticknumerator, self.tickdenominator, self.tickdigits )
+
+    def scaleticks (
+            self,
+            ticks : int,
+            multiplier : Fraction,
+            side : str = None
+        ) -> int :
+
+        # Multiply a tick count by an exact ratio and round back onto the tick grid.
+        return divide( ticks * multiplier.numerator, multiplier.denominator, side )
+
+    def price (
+            self,
+            price,
+            side : str = None
+        ) -> 'TickPrice' :
+        return TickPrice( self.ticks( price, side ), self )
+
+    # Quantities.
+
+    def quanta (
+            self,
+            amount,
+            side : str = "bid"
+        ) -> int :
+
+        # Parse an amount into integer quantity increments (rounding down by default so orders never oversize).
+        numerator, denominator = rational( amount )
+        return divide( numerator * self.bumpdenominator, denominator * self.bumpnumerator, side )
+
+    def amountstring (
+            self,
+            quanta : int
+        ) -> str :
+        return self.render( quanta * self.bumpnumerator, self.bumpdenominator, self.bumpdigits )
+
+    def affordable (
+            self,
+            cash,
+            ticks : int
+        ) -> int :
+
+        # Number of quanta that a cash (quote currency) amount buys at a price (rounded down).
+        numerator, denominator = rational( cash )
+        return divide( numerator * self.tickdenominator * self.bumpdenominator,
+                       denominator * ticks * self.ticknumerator * self.bumpnumerator, "bid" )
+
+    @staticmethod
+    def render (
+            numerator : int,
+            denominator : int,
+            digits : int
+        ) -> str :
+
+        # Exact fixed point rendering of numerator/denominator with the digits specified.
+        units = numerator * 10 ** digits // denominator
+        sign = '-' if units < 0 else ''
+        whole, fraction = divmod( abs( units ), 10 ** digits )
+        return f'{sign}{whole}.{fraction:0{digits}d}' if digits else f'{sign}{whole}'
+
+class TickPrice :
+
+    # An immutable price on the tick grid of a trading pair.
+    # Arithmetic and comparisons run on the integer tick count. str() gives the REST wire format.
+
+    __slots__ = ( 'ticks', 'scale' )
+
+    def __init__ (
+            self,
+            ticks : int,
+            scale : TickScale
+        ) -> None :
+        self.ticks = ticks
+        self.scale = scale
+
+    def scaled (
+            self,
+            multiplier : Fraction,
+            side : str = None
+        ) -> 'TickPrice' :
+        return TickPrice( self.scale.scaleticks( self.ticks, multiplier, side ), self.scale )
+
+    def decimal ( self ) -> Decimal :
+
+        # For reporting only (i.e. profit/loss arithmetic in the logs).
+        return Decimal( str( self ) )
+
+    def __add__ ( self, other ) -> 'TickPrice' :
+        return TickPrice( self.ticks + ( other.ticks if isinstance( other, TickPrice ) else other ), self.scale )
+
+    def __sub__ ( self, other ) -> 'TickPrice' :
+        return TickPrice( self.ticks - ( other.ticks if isinstance( other, TickPrice ) else other ), self.scale )
+
+    def __neg__ ( self ) -> 'TickPrice' :
+        return TickPrice( -self.ticks, self.scale )
+
+    def __eq__ ( self, other ) -> bool :
+        return isinstance( other, TickPrice ) and self.ticks == other.ticks and self.scale is other.scale
+
+    def __lt__ ( self, other ) -> bool : return self.ticks < other.ticks
+    def __le__ ( self, other ) -> bool : return self.ticks <= other.ticks
+    def __gt__ ( self, other ) -> bool : return self.ticks > other.ticks
+    def __ge__ ( self, other ) -> bool : return self.ticks >= other.ticks
+
+    def __hash__ ( self ) -> int :
+        return hash( self.ticks )
+
+    def __int__ ( self ) -> int :
+        return self.ticks
+
+    def __str__ ( self ) -> str :
+        return self.scale.pricestring( self.ticks )
+
+    def __repr__ ( self ) -> str :
+        return f'TickPrice({self}, {self.scale.pair})'
+
+    def __format__ ( self, spec : str ) -> str :
+
+        # Support the log formats used throughout (e.g. f'{price:,.2f}').
+        return format( self.decimal(), spec )
+
+@functools.lru_cache( maxsize = None )
+def tickscale (
+        pair : str
+    ) -> TickScale :
+
+    # Build (once per pair) the scale of a trading pair from definer.
+    # Match the longest listed base currency so four letter currencies (e.g. LINK) resolve correctly.
+    pair = pair.upper()
+    currencies = [ item['currency'] for item in definer.ticksizes if pair.startswith( item['currency'] ) ]
+    if not currencies : raise KeyError( f'{pair} is not listed in definer.ticksizes' )
+    basecurrency = max( currencies, key = len )
+
+    tick = [ item['tick'] for item in definer.ticksizes if item['currency'] == basecurrency ][0]
+    bump = [ item['minimumquantity'] for item in definer.minimumquantities if item['currency'] == basecurrency ][0]
+
+    return TickScale( pair, tick, bump, basecurrency )
+
+if __name__ == "__main__":
+
+    import sys
+    import timeit
+
+    from backstopper.logging.logger import logger as logger
+
+    # Set default pair in case a BASH wrapper has not been used.
+    tradingpair = "ETHUSD"
+
+    # Override defaults with command line parameters from BASH wrapper.
+    if len(sys.argv) == 2 : tradingpair = sys.argv[1]
+    else : logger.warning ( f'Incorrect number of command line arguments. Using default value of {tradingpair}...' )
+
+    # Compare parsing and comparing a trade price as ticks versus as a Decimal.
+    scale = tickscale( tradingpair )
+    limit = scale.ticks( '1500.00' )
+    bound = Decimal( '1500.00' )
+    tickstime = timeit.timeit( lambda : scale.ticks( '1501.37' ) > limit, number = 200000 ) / 200000
+    decimaltime = timeit.timeit( lambda : Decimal( '1501.37' ).compare( bound ) == 1, number = 200000 ) / 200000
+
+    logger.info ( f'{scale}: 1501.37 is {scale.ticks( "1501.37" )} ticks and renders as {scale.pricestring( scale.ticks( "1501.37" ) )}. ' )
+    logger.info ( f'Ticks: {1e9 * tickstime:,.0f} ns per trade. Decimal: {1e9 * decimaltime:,.0f} ns per trade. ' )
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+#
+# library name: historian.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: cache the fills of the account locally and compute vectorized fee, slippage and holding time analytics with NumPy.
+
+# Storage Outline:
+#  <historydirectory>/<SYMBOL>.npy : the fills of one symbol as a NumPy structured array (see "dtype"), oldest first.
+#
+# Sync Outline:
+#  1. Every symbol is synced by its own worker thread (at most "workers" at a time). Requests wait for the rate budget
+#     of the signing key (see authenticator), so concurrency never exceeds what the exchange allows.
+#  2. A symbol pages forward through /v1/mytrades from the newest fill cached (500 fills per page).
+#     Fills are recognized by trade id, so overlapping pages are never stored twice.
+#  3. Files are written then renamed, so an interrupted sync never corrupts the cache.
+#
+# Analytics Outline (all vectorized over the structured array):
+#  - "summary": fills, volume, notional and fees per strategy (the tag of the client order id, see ordermanager),
+#    slippage of sells versus the price intended when they were placed (see intentjournal) and holding times
+#    (seconds from the latest buy of the same strategy and symbol to each sell).
+#  - "daily": fills, bought and sold notional and fees per UTC day.
+
+import os
+import sys
+import time
+import concurrent.futures
+
+import numpy
+
+import backstopper.informing.definer as definer
+import backstopper.timing.deadline as deadline
+import backstopper.authenticating.authenticator as authenticator
+import backstopper.recording.intentjournal as intentjournal
+
+from backstopper.logging.logger import logger as logger
+
+dtype = numpy.dtype( [ ( 'tid', 'i8' ), ( 'orderid', 'i8' ), ( 'timestampms', 'i8' ), ( 'side', 'i1' ), ( 'price', 'f8' ),
+                       ( 'amount', 'f8' ), ( 'fee', 'f8' ), ( 'symbol', 'U12' ), ( 'tag', 'U48' ) ] )
+
+pagesize : int = 500
+
+def fetchfills (
+        symbol : str,
+        sincems : int
+    ) -> list :
+
+    # Fills of one symbol on or after a timestamp (at most one page).
+    endpoint = '/v1/mytrades'
+    payload = {
+        'request': endpoint,
+        'symbol': symbol.lower(),
+        'timestamp': sincems,
+        'limit_trades': pagesize
+    }
+    headers = authenticator.authenticate( payload )
+    fills = deadline.post( 'account', definer.restserver + endpoint, data = None, headers = headers[ 'restheader' ] ).json()
+    if not isinstance( fills, list ) : raise RuntimeError( f'Unable to retrieve {symbol} fills: {fills}' )
+    return fills
+
+def fetchsymbols ( ) -> list :
+    return [ symbol.upper() for symbol in deadline.get( 'public', definer.restserver + '/v1/symbols' ).json() ]
+
+def torows (
+        symbol : str,
+        fills : list
+    ) -> numpy.ndarray :
+    rows = numpy.empty( len( fills ), dtype = dtype )
+    for row, fill in enumerate( fills ) :
+        clientid = fill.get( 'client_order_id' ) or ''
+        tag, separator, unique = clientid.rpartition( '.' )
+        rows[ row ] = ( int( fill[ 'tid' ] ), int( fill[ 'order_id' ] ), int( fill[ 'timestampms' ] ), 1 if fill[ 'type' ].lower() == 'buy' else -1,
+                        float( fill[ 'price' ] ), float( fill[ 'amount' ] ), float( fill.get( 'fee_amount' ) or 0 ), symbol.upper(),
+                        tag if separator else '' )
+    return rows
+
+class TradeHistory :
+
+    def __init__ (
+            self,
+            directory : str = None
+        ) -> None :
+        self.directory = directory or definer.historydirectory
+        os.makedirs( self.directory, exist_ok = True )
+
+    def path (
+            self,
+            symbol : str
+        ) -> str :
+        return os.path.join( self.directory, f'{symbol.upper()}.npy' )
+
+    def load (
+            self,
+            symbol : str
+        ) -> numpy.ndarray :
+        path = self.path( symbol )
+        return numpy.load( path ) if os.path.exists( path ) else numpy.empty( 0, dtype = dtype )
+
+    def save (
+            self,
+            symbol : str,
+            fills : numpy.ndarray
+        ) -> None :
+        path = self.path( symbol )
+        with open( path + '.tmp', 'wb' ) as file : numpy.save( file, fills )
+        os.replace( path + '.tmp', path )
+
+    def sync (
+            self,
+            symbol : str
+        ) -> int :
+
+        # Page forward from the newest fill cached. Return the number of new fills.
+        cached = self.load( symbol )
+        seen = set( cached[ 'tid' ].tolist() )
+        sincems = int( cached[ 'timestampms' ].max() ) if len( cached ) else 0
+        pages = []
+        while True :
+            fills = fetchfills( symbol, sincems )
+            rows = torows( symbol, [ fill for fill in fills if int( fill[ 'tid' ] ) not in seen ] )
+            seen.update( rows[ 'tid' ].tolist() )
+            if len( rows ) : pages.append( rows )
+            if len( fills ) < pagesize : break
+            # A full page: continue from its newest fill (or a millisecond later when the page did not move forward).
+            newestms = max( int( fill[ 'timestampms' ] ) for fill in fills )
+            sincems = newestms if newestms > sincems else sincems + 1
+        if pages :
+            merged = numpy.concatenate( [ cached ] + pages )
+            self.save( symbol, merged[ numpy.argsort( merged[ 'timestampms' ], kind = 'stable' ) ] )
+        return sum( len( rows ) for rows in pages )
+
+    def syncall (
+            self,
+            symbols : list = None,
+            workers : int = None
+        ) -> dict :
+
+        # Sync several symbols concurrently (every symbol listed by the exchange by default).
+        symbols = [ symbol.upper() for symbol in symbols ] if symbols else fetchsymbols()
+        results : dict = {}
+        with concurrent.futures.ThreadPoolExecutor( max_workers = workers or definer.privaterequestburst ) as pool :
+            futures = { pool.submit( self.sync, symbol ) : symbol for symbol in symbols }
+            for future in concurrent.futures.as_completed( futures ) :
+                symbol = futures[ future ]
+                try : results[ symbol ] = future.result()
+                except Exception as e :
+                    logger.warning ( f'Unable to sync {symbol} fills. Error: {e}' )
+                    results[ symbol ] = None
+        return results
+
+    def fills (
+            self,
+            symbols : list = None
+        ) -> numpy.ndarray :
+
+        # Every cached fill (of the symbols given) in one array, oldest first.
+        if symbols is None : symbols = [ name[ :-4 ] for name in sorted( os.listdir( self.directory ) ) if name.endswith( '.npy' ) ]
+        arrays = [ self.load( symbol ) for symbol in symbols ]
+        merged = numpy.concatenate( arrays ) if arrays else numpy.empty( 0, dtype = dtype )
+        return merged[ numpy.argsort( merged[ 'timestampms' ], kind = 'stable' ) ]
+
+def slippage (
+        fills : numpy.ndarray,
+        intents : dict
+    ) -> numpy.ndarray :
+
+    # Basis points received below the intended price of every sell fill (NaN when the intent is unknown).
+    bps = numpy.full( len( fills ), numpy.nan )
+    known = [ ( orderid, float( entry[ 'price' ] ) ) for orderid, entry in intents.items() if entry.get( 'price' ) ]
+    if not known or not len( fills ) : return bps
+    orderids, prices = ( numpy.array( column ) for column in zip( *sorted( known ) ) )
+    position = numpy.clip( numpy.searchsorted( orderids, fills[ 'orderid' ] ), 0, len( orderids ) - 1 )
+    matched = ( orderids[ position ] == fills[ 'orderid' ] ) & ( fills[ 'side' ] < 0 )
+    intended = prices[ position ]
+    bps[ matched ] = 10000 * ( intended[ matched ] - fills[ 'price' ][ matched ] ) / intended[ matched ]
+    return bps
+
+def holdingtimes (
+        fills : numpy.ndarray
+    ) -> numpy.ndarray :
+
+    # Seconds from the latest buy of the same strategy and symbol to every sell (NaN for buys and unmatched sells).
+    # Rows are ordered by ( group, time ). A running maximum of group-offset buy times then never crosses groups.
+    seconds = numpy.full( len( fills ), numpy.nan )
+    if not len( fills ) : return seconds
+    keys, groups = numpy.unique( numpy.char.add( fills[ 'tag' ], '|' + fills[ 'symbol' ] ), return_inverse = True )
+    order = numpy.lexsort( ( fills[ 'timestampms' ], groups ) )
+    offset = groups[ order ].astype( numpy.int64 ) << 42
+    buytimes = numpy.where( fills[ 'side' ][ order ] > 0, fills[ 'timestampms' ][ order ], 0 )
+    latest = numpy.maximum.accumulate( offset + buytimes ) - offset
+    sells = ( fills[ 'side' ][ order ] < 0 ) & ( latest > 0 )
+    held = numpy.full( len( fills ), numpy.nan )
+    held[ sells ] = ( fills[ 'timestampms' ][ order ][ sells ] - latest[ sells ] ) / 1000
+    seconds[ order ] = held
+    return seconds
+
+def summary (
+        fills : numpy.ndarray,
+        intents : dict = None
+    ) -> dict :
+
+    # Per strategy: fills, volume, notional, fees, slippage and holding time percentiles.
+    if not len( fills ) : return {}
+    intents = intentjournal.load() if intents is None else intents
+    tags, groups = numpy.unique( fills[ 'tag' ], return_inverse = True )
+    notional = fills[ 'price' ] * fills[ 'amount' ]
+    counts = numpy.bincount( groups, minlength = len( tags ) )
+    volumes = numpy.bincount( groups, weights = fills[ 'amount' ], minlength = len( tags ) )
+    notionals = numpy.bincount( groups, weights = notional, minlength = len( tags ) )
+    feespaid = numpy.bincount( groups, weights = fills[ 'fee' ], minlength = len( tags ) )
+    bps = slippage( fills, intents )
+    held = holdingtimes( fills )
+
+    def percentiles ( values : numpy.ndarray ) -> dict :
+        values = values[ ~numpy.isnan( values ) ]
+        if not len( values ) : return {}
+        p50, p90, p99 = numpy.percentile( values, [ 50, 90, 99 ] )
+        return { 'mean': float( values.mean() ), 'p50': float( p50 ), 'p90': float( p90 ), 'p99': float( p99 ), 'count': int( len( values ) ) }
+
+    report : dict = {}
+    for group, tag in enumerate( tags ) :
+        rows = groups == group
+        report[ str( tag ) or '(untagged)' ] = { 'fills': int( counts[ group ] ), 'volume': float( volumes[ group ] ), 'notional': float( notionals[ group ] ),
+                                          'fees': float( feespaid[ group ] ), 'slippagebps': percentiles( bps[ rows ] ),
+                                          'holdingseconds': percentiles( held[ rows ] ) }
+    return report
+
+def daily (
+        fills : numpy.ndarray
+    ) -> list :
+
+    # Per UTC day: fills, bought and sold notional and fees.
+    if not len( fills ) : return []
+    days, groups = numpy.unique( fills[ 'timestampms' ] // 86400000, return_inverse = True )
+    notional = fills[ 'price' ] * fills[ 'amount' ]
+    bought = numpy.bincount( groups, weights = numpy.where( fills[ 'side' ] > 0, notional, 0 ), minlength = len( days ) )
+    sold = numpy.bincount( groups, weights = numpy.where( fills[ 'side' ] < 0, notional, 0 ), minlength = len( days ) )
+    feespaid = numpy.bincount( groups, weights = fills[ 'fee' ], minlength = len( days ) )
+    counts = numpy.bincount( groups, minlength = len( days ) )
+    return [ { 'day': time.strftime( '%Y-%m-%d', time.gmtime( int( day ) * 86400 ) ), 'fills': int( counts[ index ] ),
+               'bought': float( bought[ index ] ), 'sold': float( sold[ index ] ), 'fees': float( feespaid[ index ] ) }
+             for index, day in enumerate( days ) ]
+
+if __name__ == "__main__":
+
+    # Usage: sync [symbol ...] | report [days]
+    arguments = sys.argv[1:] or [ 'report' ]
+    history = TradeHistory()
+
+    if arguments[0] == 'sync' :
+        started = time.perf_counter()
+        results = history.syncall( arguments[1:] or None )
+        logger.info ( f'Synced {sum( count or 0 for count in results.values() ):,} new fills of {len( results )} symbols '
+                      f'in {time.perf_counter() - started:,.1f} seconds. ' )
+    elif arguments[0] == 'report' :
+        started = time.perf_counter()
+        fills = history.fills()
+        if len( arguments ) == 2 : fills = fills[ fills[ 'timestampms' ] >= ( time.time() - 86400 * float( arguments[1] ) ) * 1000 ]
+        for tag, figures in summary( fills ).items() : logger.info ( f'{tag}: {figures}' )
+        for day in daily( fills ) : logger.info ( f'{day}' )
+        logger.info ( f'Reported {len( fills ):,} fills in {time.perf_counter() - started:,.2f} seconds. ' )
+    else :
+        logger.error ( 'Usage: sync [symbol ...] | report [days]' )
+        sys.exit(1)
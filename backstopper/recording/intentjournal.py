@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+#
+# library name: intentjournal.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: journal the prices intended by every sell order placed so that fills can later be compared with them.
+
+# Every accepted sell order appends one JSON line to definer.intentspath:
+#   { "order_id": 7419662, "symbol": "ETHUSD", "type": "exchange stop limit", "price": "1500.00", "stop_price": "1510.00", "tag": "eth-1", "timestampms": ... }
+# Journaling never interferes with ordering (failures are logged and ignored).
+
+import json
+import threading
+
+import backstopper.informing.definer as definer
+
+from backstopper.logging.logger import logger as logger
+from backstopper.ordering.ordermanager import tagof
+
+lock = threading.Lock()
+
+def record (
+        response
+    ) -> None :
+
+    # Journal the order of a REST response (an order that was not accepted has no "order_id").
+    try :
+        order = response.json()
+        if not isinstance( order, dict ) or 'order_id' not in order : return
+        entry = { 'order_id': int( order[ 'order_id' ] ), 'symbol': order.get( 'symbol', '' ).upper(), 'type': order.get( 'type' ),
+                  'price': order.get( 'price' ), 'stop_price': order.get( 'stop_price' ), 'tag': tagof( order ),
+                  'timestampms': order.get( 'timestampms' ) }
+        with lock, open( definer.intentspath, 'a' ) as file : file.write( json.dumps( entry ) + '\n' )
+    except Exception as e :
+        logger.debug ( f'Unable to journal an order intent. Error: {e}' )
+
+def load (
+        path : str = None
+    ) -> dict :
+
+    # Intents indexed by order id (unreadable lines are skipped).
+    intents : dict = {}
+    try :
+        with open( path or definer.intentspath ) as file :
+            for line in file :
+                try : entry = json.loads( line )
+                except ValueError : continue
+                intents[ entry[ 'order_id' ] ] = entry
+    except OSError : pass
+    return intents
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+#
+# library name: tickrecorder.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: record streamed trades into compact fixed-width binary column files (one folder per pair per day).
+
+# Storage Outline:
+#  <tickdirectory>/<PAIR>/<YYYYMMDD>/
+#     timestampms.int64 : exchange timestamp of the trade in milliseconds.
+#     tid.int64         : exchange trade identifier.
+#     price.int64       : trade price in integer ticks of the pair (see the pricing package).
+#     amount.int64      : trade amount in units of 10^-8 (see "amountdigits" below).
+#     makerside.int8    : 1 when the resting order was a bid, -1 when it was an ask, 0 otherwise (e.g. auctions).
+#     index.int64       : sparse time index of ( timestampms, row ) pairs written every "indexstride" rows (see tickstore).
+#     meta.json         : tick size and amount digits needed to convert the integers back into prices and amounts.
+#
+# Every trade takes 33 bytes (versus roughly 250 bytes per trade in the text logs).
+# Files are appended to in the native byte order (little-endian on x86 and ARM hosts).
+#
+# Execution Outline:
+#  1. The feed calls "record" which only appends a tuple to a bounded deque (it never waits on the disk).
+#  2. A writer thread drains the deque every "flushinterval" seconds, converts the trades into integer columns and appends them.
+#  3. Folders rotate on the UTC day of the trade timestamp. Files of the previous day are closed on rotation.
+#  4. If the writer falls behind by more than "maxpending" trades, the oldest trades are dropped (and counted) rather than blocking.
+#  5. One process writes the files of a pair: the first to lock <tickdirectory>/<PAIR>/writer.lock (fcntl.flock).
+#     Other processes (e.g. several bots on the same pair) skip that pair and claim it once the writer exits.
+#     The row count is then taken from the locked files (cut back to whole rows) and trades already written (by trade id) are skipped.
+
+import os
+import json
+import time
+import array
+import fcntl
+import datetime
+import threading
+import collections
+
+import backstopper.informing.definer as definer
+
+from backstopper.logging.logger import logger as logger
+from backstopper.pricing.quantizer import tickscale, rational, divide
+
+amountdigits : int = 8
+indexstride : int = 4096
+
+columns : tuple = (
+    ( 'timestampms', 'q' ),
+    ( 'tid', 'q' ),
+    ( 'price', 'q' ),
+    ( 'amount', 'q' ),
+    ( 'makerside', 'b' )
+)
+
+makersides : dict = { 'bid': 1, 'ask': -1 }
+
+def daystring (
+        timestampms : int
+    ) -> str :
+
+    # UTC day of a millisecond timestamp (e.g. '20261019').
+    return datetime.datetime.fromtimestamp( timestampms // 1000, datetime.timezone.utc ).strftime( '%Y%m%d' )
+
+def amountunits (
+        amount : str
+    ) -> int :
+
+    # Parse an amount string into integer units of 10^-8.
+    numerator, denominator = rational( amount )
+    return divide( numerator * 10 ** amountdigits, denominator )
+
+class TickRecorder :
+
+    def __init__ (
+            self,
+            directory : str = None,
+            flushinterval : float = 1.0,
+            maxpending : int = 1000000
+        ) -> None :
+
+        self.directory = directory or definer.tickdirectory
+        self.flushinterval = flushinterval
+        self.pending = collections.deque( maxlen = maxpending )
+
+        # Open files are keyed by pair. Each entry holds ( day, { column: file }, [ rows ] ).
+        # Locks of the pairs this recorder writes and the last trade id found in their files.
+        self.openfiles : dict = {}
+        self.locks : dict = {}
+        self.lasttids : dict = {}
+
+        # Statistics.
+        self.received : int = 0
+        self.written : int = 0
+        self.skipped : int = 0
+        self.byteswritten : int = 0
+        self.writerseconds : float = 0.0
+
+        self.stopping = threading.Event()
+        self.writer = threading.Thread( target = self.run, name = 'tickrecorder', daemon = True )
+        self.writer.start()
+
+    @property
+    def dropped ( self ) -> int :
+
+        # Trades pushed out of the bounded deque before the writer got to them.
+        return self.received - self.written - len( self.pending )
+
+    def record (
+            self,
+            pair : str,
+            timestampms : int,
+            event : dict
+        ) -> None :
+
+        # Called from the feed for every trade event. Constant time and never touches the disk.
+        self.received += 1
+        self.pending.append( ( pair, timestampms, event ) )
+
+    def run ( self ) -> None :
+
+        # Writer thread loop.
+        while not self.stopping.wait( self.flushinterval ) :
+            self.flush()
+        self.flush()
+        self.closefiles()
+
+    def stop ( self ) -> None :
+
+        # Flush whatever is pending and close all files.
+        self.stopping.set()
+        self.writer.join()
+
+    def flush ( self ) -> None :
+
+        started = time.thread_time()
+        batches : dict = {}
+
+        # Drain the deque into integer columns per pair per day.
+        pending = self.pending
+        while pending :
+            try : pair, timestampms, event = pending.popleft()
+            except IndexError : break
+            try :
+                # Convert every field before appending so a malformed trade cannot misalign the columns.
+                scale = tickscale( pair )
+                values = ( int( timestampms ), int( event[ 'tid' ] ), scale.ticks( event[ 'price' ] ),
+                           amountunits( event[ 'amount' ] ), makersides.get( event.get( 'makerSide' ), 0 ) )
+                key = ( scale.pair, values[0] // 86400000 )
+                batch = batches.get( key )
+                if batch is None :
+                    batch = batches[ key ] = ( scale, values[0], [ array.array( typecode ) for name, typecode in columns ] )
+                for column, value in zip( batch[2], values ) : column.append( value )
+            except Exception as e :
+                logger.debug ( f'Unable to record trade {event}. Error: {e}' )
+            self.written += 1
+
+        # Append each batch to the files of its day (unless another process writes the pair).
+        for ( pair, daynumber ), ( scale, timestampms, arrays ) in sorted( batches.items() ) :
+            try :
+                if not self.claim( pair ) :
+                    self.skipped += len( arrays[0] )
+                    continue
+                arrays = self.unseen( scale, timestampms, arrays )
+                if arrays[0] : self.append( scale, timestampms, arrays )
+            except OSError as e :
+                logger.error ( f'Unable to write {len( arrays[0] )} {pair} trades. Error: {e}' )
+
+        self.writerseconds += time.thread_time() - started
+
+    def append (
+            self,
+            scale,
+            timestampms : int,
+            arrays : list
+        ) -> None :
+
+        # Append integer columns (array.array or NumPy arrays, in the order of "columns") of one pair for one day.
+        if not self.claim( scale.pair ) : raise BlockingIOError( f'{scale.pair} trades are recorded by another process. ' )
+        files, rows = self.files( scale, timestampms )
+        for ( name, typecode ), values in zip( columns, arrays ) :
+            values.tofile( files[ name ] )
+            files[ name ].flush()
+            self.byteswritten += values.itemsize * len( values )
+
+        # Extend the sparse index with the first timestamp of every stride crossed by this batch.
+        first = rows[0]
+        rows[0] += len( arrays[0] )
+        entries = array.array( 'q' )
+        for row in range( -( -first // indexstride ) * indexstride, rows[0], indexstride ) :
+            entries.extend( ( int( arrays[0][ row - first ] ), row ) )
+        entries.tofile( files[ 'index' ] )
+        files[ 'index' ].flush()
+
+    def claim (
+            self,
+            pair : str
+        ) -> bool :
+
+        # Become the only writer of a pair (False while another process holds its lock).
+        if pair in self.locks : return True
+        folder = os.path.join( self.directory, pair )
+        os.makedirs( folder, exist_ok = True )
+        lock = open( os.path.join( folder, 'writer.lock' ), 'a' )
+        try : fcntl.flock( lock, fcntl.LOCK_EX | fcntl.LOCK_NB )
+        except BlockingIOError :
+            lock.close()
+            return False
+        self.locks[ pair ] = lock
+        logger.debug ( f'Recording {pair} trades from process {os.getpid()}. ' )
+        return True
+
+    def unseen (
+            self,
+            scale,
+            timestampms : int,
+            arrays : list
+        ) -> list :
+
+        # Drop trades at or below the last trade id of the files (written by the previous writer of the pair).
+        self.files( scale, timestampms )
+        last = self.lasttids.get( scale.pair )
+        if last is not None and min( arrays[1] ) <= last :
+            keep = [ row for row, tid in enumerate( arrays[1] ) if tid > last ]
+            arrays = [ array.array( typecode, ( column[ row ] for row in keep ) ) for ( name, typecode ), column in zip( columns, arrays ) ]
+        if arrays[0] : self.lasttids[ scale.pair ] = max( last if last is not None else -1, max( arrays[1] ) )
+        return arrays
+
+    def files (
+            self,
+            scale,
+            timestampms : int
+        ) -> tuple :
+
+        # Return the open column files (and row count) of a pair for the day of the timestamp (rotating when the day changes).
+        day = daystring( timestampms )
+        entry = self.openfiles.get( scale.pair )
+        if entry is not None and entry[0] == day : return ( entry[1], entry[2] )
+        if entry is not None :
+            for file in entry[1].values() : file.close()
+
+        folder = os.path.join( self.directory, scale.pair, day )
+        os.makedirs( folder, exist_ok = True )
+        metapath = os.path.join( folder, 'meta.json' )
+        if not os.path.exists( metapath ) :
+            with open( metapath, 'w' ) as file :
+                json.dump( { 'pair': scale.pair, 'tick': scale.tick, 'amountdigits': amountdigits,
+                             'columns': { name: typecode for name, typecode in columns } }, file )
+
+        # Cut every column back to the rows present in all of them (a writer may have stopped midway through a batch).
+        paths = { name: os.path.join( folder, f'{name}.{"int64" if typecode == "q" else "int8"}' ) for name, typecode in columns }
+        sizes = { name: os.path.getsize( paths[ name ] ) if os.path.exists( paths[ name ] ) else 0 for name in paths }
+        count = min( sizes[ name ] // array.array( typecode ).itemsize for name, typecode in columns )
+        for name, typecode in columns :
+            if sizes[ name ] > count * array.array( typecode ).itemsize : os.truncate( paths[ name ], count * array.array( typecode ).itemsize )
+        indexpath = os.path.join( folder, 'index.int64' )
+        if os.path.exists( indexpath ) :
+            index = array.array( 'q' )
+            with open( indexpath, 'rb' ) as file : index.frombytes( file.read() )
+            entries = array.array( 'q', [ value for entry in range( 0, len( index ) - 1, 2 ) if index[ entry + 1 ] < count for value in index[ entry : entry + 2 ] ] )
+            if entries != index :
+                with open( indexpath, 'wb' ) as file : entries.tofile( file )
+        if count :
+            lasttid = array.array( 'q' )
+            with open( paths[ 'tid' ], 'rb' ) as file :
+                file.seek( ( count - 1 ) * 8 )
+                lasttid.frombytes( file.read( 8 ) )
+            self.lasttids[ scale.pair ] = max( self.lasttids.get( scale.pair, -1 ), lasttid[0] )
+
+        files = { name: open( paths[ name ], 'ab' ) for name, typecode in columns }
+        files[ 'index' ] = open( indexpath, 'ab' )
+        rows = [ count ]
+        self.openfiles[ scale.pair ] = ( day, files, rows )
+        logger.debug ( f'Recording {scale.pair} trades to {folder}. ' )
+        return ( files, rows )
+
+    def closefiles ( self ) -> None :
+
+        for day, files, rows in self.openfiles.values() :
+            for file in files.values() : file.close()
+        self.openfiles = {}
+        for lock in self.locks.values() : lock.close()
+        self.locks = {}
+
+if __name__ == "__main__":
+
+    # Measure the cost of recording a synthetic trade stream across several pairs.
+
+    import sys
+    import random
+    import tempfile
+
+    # Set default trade count in case a BASH wrapper has not been used.
+    tradecount : int = 500000
+
+    # Override defaults with command line parameters from BASH wrapper.
+    if len( sys.argv ) == 2 : tradecount = int( sys.argv[1] )
+    else : logger.warning ( f'Incorrect number of command line arguments. Using default value of {tradecount} trades...' )
+
+    pairs = [ 'BTCUSD', 'ETHUSD', 'LINKUSD', 'ENSUSD' ]
+    events = [ ( random.choice( pairs ), { 'type': 'trade', 'tid': 1000000 + i, 'price': f'{1500 + random.random() * 10:.2f}',
+               'amount': f'{random.random():.6f}', 'makerSide': random.choice( [ 'bid', 'ask' ] ) } ) for i in range( tradecount ) ]
+
+    with tempfile.TemporaryDirectory() as directory :
+        recorder = TickRecorder( directory )
+        started = time.perf_counter()
+        feedstarted = time.thread_time()
+        timestampms = int( time.time() * 1000 )
+        for pair, event in events :
+            recorder.record( pair, timestampms, event )
+            timestampms += 1
+        feedseconds = time.thread_time() - feedstarted
+        recorder.stop()
+        elapsed = time.perf_counter() - started
+
+        logger.info ( f'Feed side: {1e9 * feedseconds / tradecount:,.0f} ns per trade. Writer: {1e6 * recorder.writerseconds / tradecount:,.2f} us per trade. ' )
+        logger.info ( f'Recorded {recorder.written:,} trades ({recorder.dropped} dropped, {recorder.skipped} skipped) into {recorder.byteswritten:,} bytes '
+                      f'[{recorder.byteswritten / tradecount:.0f} bytes per trade] in {elapsed:,.2f} seconds. ' )
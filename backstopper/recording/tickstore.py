@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+#
+# library name: tickstore.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: query trades recorded by tickrecorder through memory maps and compute vectorized analytics with NumPy.
+
+# Query Outline:
+#  1. Each day folder is opened as a set of read-only memory maps (nothing is read until a page is touched).
+#  2. The sparse index (one timestamp every "indexstride" rows) narrows a time range down to two strides.
+#  3. A binary search inside those strides finds the exact rows. The result is a slice of the maps (i.e. zero-copy).
+#  4. Ranges spanning several days are concatenated (the only case that copies).
+#
+# Analytics (vwap, realizedvolatility, drawdown and resample) are vectorized and work on any TickFrame.
+
+import os
+import json
+
+import numpy
+
+import backstopper.informing.definer as definer
+
+from backstopper.recording.tickrecorder import columns, daystring
+
+class TickFrame :
+
+    # Columns of trades (integer ticks and amount units) together with the scale needed to convert them.
+
+    def __init__ (
+            self,
+            pair : str,
+            tick : str,
+            amountdigits : int,
+            arrays : dict
+        ) -> None :
+
+        self.pair = pair
+        self.tick = tick
+        self.amountdigits = amountdigits
+        self.timestampms = arrays[ 'timestampms' ]
+        self.tid = arrays[ 'tid' ]
+        self.price = arrays[ 'price' ]
+        self.amount = arrays[ 'amount' ]
+        self.makerside = arrays[ 'makerside' ]
+
+    def __len__ ( self ) -> int :
+        return len( self.timestampms )
+
+    @property
+    def prices ( self ) -> numpy.ndarray :
+
+        # Trade prices in quote currency (floating point, for analytics only).
+        return self.price * float( self.tick )
+
+    @property
+    def amounts ( self ) -> numpy.ndarray :
+
+        # Trade amounts in base currency (floating point, for analytics only).
+        return self.amount * 10.0 ** -self.amountdigits
+
+class TickDay :
+
+    # Read-only memory maps of the column files of one pair for one day.
+
+    def __init__ (
+            self,
+            folder : str
+        ) -> None :
+
+        with open( os.path.join( folder, 'meta.json' ) ) as file : meta = json.load( file )
+        self.pair = meta[ 'pair' ]
+        self.tick = meta[ 'tick' ]
+        self.amountdigits = meta[ 'amountdigits' ]
+
+        # Use the row count of the shortest column in case the writer was interrupted midway through a batch.
+        dtypes = { 'q': numpy.int64, 'b': numpy.int8 }
+        paths = { name: os.path.join( folder, f'{name}.{"int64" if typecode == "q" else "int8"}' ) for name, typecode in columns }
+        sizes = { name: os.path.getsize( paths[ name ] ) // numpy.dtype( dtypes[ typecode ] ).itemsize for name, typecode in columns }
+        self.rows = min( sizes.values() )
+
+        self.maps = {}
+        for name, typecode in columns :
+            self.maps[ name ] = numpy.memmap( paths[ name ], dtype = dtypes[ typecode ], mode = 'r', shape = ( self.rows, ) ) \
+                if self.rows else numpy.empty( 0, dtype = dtypes[ typecode ] )
+
+        # The sparse index is small enough to read whole: an array of ( timestampms, row ) pairs.
+        indexpath = os.path.join( folder, 'index.int64' )
+        index = numpy.fromfile( indexpath, dtype = numpy.int64 ) if os.path.exists( indexpath ) else numpy.empty( 0, dtype = numpy.int64 )
+        index = index[ : len( index ) // 2 * 2 ].reshape( -1, 2 )
+        self.indextimes = index[ :, 0 ]
+        self.indexrows = index[ :, 1 ]
+
+    def locate (
+            self,
+            timestampms : int
+        ) -> int :
+
+        # First row with a timestamp at or after the one specified.
+        # Use the sparse index to pick the stride, then binary search inside it (touching only a page or two).
+        position = numpy.searchsorted( self.indextimes, timestampms, side = 'left' )
+        lower = int( self.indexrows[ position - 1 ] ) if position > 0 else 0
+        upper = int( self.indexrows[ position ] ) + 1 if position < len( self.indexrows ) else self.rows
+        upper = min( upper, self.rows )
+        return lower + int( numpy.searchsorted( self.maps[ 'timestampms' ][ lower : upper ], timestampms, side = 'left' ) )
+
+    def slice (
+            self,
+            startms : int,
+            endms : int
+        ) -> dict :
+
+        # Zero-copy views of the rows in [ startms, endms ).
+        first = self.locate( startms )
+        last = self.locate( endms )
+        return { name: self.maps[ name ][ first : last ] for name, typecode in columns }
+
+def daysof (
+        pair : str,
+        directory : str = None
+    ) -> list :
+
+    # List the days recorded for a pair (e.g. [ '20261018', '20261019' ]).
+    folder = os.path.join( directory or definer.tickdirectory, pair.upper() )
+    if not os.path.isdir( folder ) : return []
+    return sorted( day for day in os.listdir( folder ) if os.path.exists( os.path.join( folder, day, 'meta.json' ) ) )
+
+def loadticks (
+        pair : str,
+        startms : int,
+        endms : int,
+        directory : str = None
+    ) -> TickFrame :
+
+    # Load the trades of a pair recorded in [ startms, endms ).
+    # A range within one day returns views of the memory maps. Longer ranges are concatenated.
+    directory = directory or definer.tickdirectory
+    firstday = daystring( startms )
+    lastday = daystring( max( startms, endms - 1 ) )
+    days = [ day for day in daysof( pair, directory ) if firstday <= day <= lastday ]
+
+    slices = []
+    meta = ( pair.upper(), None, None )
+    for day in days :
+        tickday = TickDay( os.path.join( directory, pair.upper(), day ) )
+        meta = ( tickday.pair, tickday.tick, tickday.amountdigits )
+        slices.append( tickday.slice( startms, endms ) )
+
+    if len( slices ) == 1 :
+        arrays = slices[0]
+    else :
+        dtypes = { 'q': numpy.int64, 'b': numpy.int8 }
+        arrays = { name: numpy.concatenate( [ item[ name ] for item in slices ] ) if slices else numpy.empty( 0, dtype = dtypes[ typecode ] )
+                   for name, typecode in columns }
+
+    return TickFrame( meta[0], meta[1] or '1', meta[2] or 0, arrays )
+
+def vwap (
+        frame : TickFrame
+    ) -> float :
+
+    # Volume weighted average price.
+    amounts = frame.amount.astype( numpy.float64 )
+    total = amounts.sum()
+    return float( numpy.dot( frame.price, amounts ) / total * float( frame.tick ) ) if total else float( 'nan' )
+
+def realizedvolatility (
+        frame : TickFrame
+    ) -> float :
+
+    # Realized volatility over the frame: square root of the sum of squared trade-to-trade log returns.
+    if len( frame ) < 2 : return 0.0
+    returns = numpy.diff( numpy.log( frame.price.astype( numpy.float64 ) ) )
+    return float( numpy.sqrt( numpy.dot( returns, returns ) ) )
+
+def drawdown (
+        frame : TickFrame
+    ) -> tuple :
+
+    # Return the maximum drawdown (a negative fraction) and the drawdown series relative to the running high.
+    if not len( frame ) : return ( 0.0, numpy.empty( 0 ) )
+    prices = frame.price.astype( numpy.float64 )
+    series = prices / numpy.maximum.accumulate( prices ) - 1.0
+    return ( float( series.min() ), series )
+
+def resample (
+        frame : TickFrame,
+        barms : int
+    ) -> dict :
+
+    # Aggregate trades into OHLCV bars of "barms" milliseconds (bars without trades are omitted).
+    # Prices are returned in ticks and volumes in amount units (i.e. the same integers as the frame).
+    if not len( frame ) :
+        empty = numpy.empty( 0, dtype = numpy.int64 )
+        return { 'timestampms': empty, 'open': empty, 'high': empty, 'low': empty, 'close': empty, 'volume': empty, 'trades': empty }
+
+    buckets = frame.timestampms // barms
+    starts = numpy.concatenate( ( [ 0 ], numpy.flatnonzero( numpy.diff( buckets ) ) + 1 ) )
+    ends = numpy.concatenate( ( starts[ 1: ], [ len( frame ) ] ) )
+
+    return {
+        'timestampms': buckets[ starts ] * barms,
+        'open': frame.price[ starts ],
+        'high': numpy.maximum.reduceat( frame.price, starts ),
+        'low': numpy.minimum.reduceat( frame.price, starts ),
+        'close': frame.price[ ends - 1 ],
+        'volume': numpy.add.reduceat( frame.amount, starts ),
+        'trades': ends - starts
+    }
+
+if __name__ == "__main__":
+
+    import sys
+    import time
+
+    from backstopper.logging.logger import logger as logger
+
+    # Set default pair and range in case a BASH wrapper has not been used.
+    tradingpair = "ETHUSD"
+    dayscovered = 1
+
+    # Override defaults with command line parameters from BASH wrapper.
+    if len(sys.argv) == 3 :
+        tradingpair = sys.argv[1]
+        dayscovered = int( sys.argv[2] )
+    else : logger.warning ( f'Incorrect number of command line arguments. Using default values of {tradingpair} and {dayscovered} day(s)...' )
+
+    endms = int( time.time() * 1000 )
+    startms = endms - dayscovered * 86400000
+
+    started = time.perf_counter()
+    frame = loadticks( tradingpair, startms, endms )
+    loaded = time.perf_counter() - started
+
+    logger.info ( f'Loaded {len( frame ):,} {tradingpair} trades covering {dayscovered} day(s) in {1e3 * loaded:,.2f} ms. ' )
+    if len( frame ) :
+        bars = resample( frame, 60000 )
+        logger.info ( f'VWAP: {vwap( frame ):,.2f}. Realized volatility: {100 * realizedvolatility( frame ):.2f}%. '
+                      f'Maximum drawdown: {100 * drawdown( frame )[0]:.2f}%. One minute bars: {len( bars[ "open" ] ):,}. ' )
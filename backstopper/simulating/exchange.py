@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+#
+# library name: exchange.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: stand in for the Gemini order entry endpoints so engines can run against replayed trades (see soak.py).
+
+# Matching Outline:
+#  1. SimulatedExchange provides the methods of Gateway (buy, placestop, sell, cancel, status, orders and fee) and answers
+#     with responses shaped like the REST API's. Engines take it in place of a Gateway.
+#  2. Trades are replayed through "trade" (in timestamp order). Nothing rests on a book, orders are matched against the tape:
+#       - a bid (booked at the last trade price) fills at its price once a trade prints at or below it,
+#       - a stop-limit ask triggers once a trade prints at or below its stop price, then fills at its limit price
+#         (or at the trade price when that is higher) once a trade prints at or above it,
+#       - a limit ask fills at once at the last trade price when that reaches its limit price (and like a triggered stop-limit ask otherwise).
+#  3. Fills and closings are queued as order events (the "fill" and "closed" messages of /v1/order/events).
+#     The caller drains them and delivers them to the engine.
+#  4. Every request draws a nonce from the authenticator (as signing would) so that nonces repeated by a key are counted.
+#     Client order ids submitted twice are counted as well.
+#     Within one process the nonces of a key never repeat (see authenticator), so that count only guards the authenticator.
+#     Repeats happen when processes share a key: the exchanges of a fleet (see soak.fleet) also forward every ( key, nonce )
+#     to a queue the parent checks across processes.
+#
+# Orders are matched whole (no partial fills) and the fee is the maker fee of definer.apitransactionfee.
+
+import threading
+import itertools
+import collections
+
+from decimal import Decimal
+
+import backstopper.informing.definer as definer
+import backstopper.authenticating.authenticator as authenticator
+
+from backstopper.ordering.ordermanager import clientorderid, tagof
+from backstopper.pricing.quantizer import tickscale
+
+class SimulatedOrder :
+
+    __slots__ = ( 'response', 'pair', 'side', 'price', 'stop', 'triggered' )
+
+    def __init__ (
+            self,
+            response : dict,
+            pair : str,
+            side : str,
+            price : int,
+            stop : int = None
+        ) -> None :
+        self.response = response
+        self.pair = pair
+        self.side = side
+        self.price = price
+        self.stop = stop
+        self.triggered : bool = stop is None
+
+class SimulatedExchange :
+
+    def __init__ (
+            self,
+            fee : str = None,
+            nonces = None
+        ) -> None :
+
+        self.makerfee = Decimal( fee or definer.apitransactionfee )
+        self.noncequeue = nonces # A multiprocessing queue shared by the processes of a fleet (None otherwise).
+        self.lock = threading.Lock()
+        self.sequence = itertools.count( 1 )
+        self.tradesequence = itertools.count( 1 )
+
+        # Live orders by order id (and by pair, for matching), last trade per pair (ticks) and the exchange clock (ms).
+        self.live : dict = {}
+        self.books : dict = {}
+        self.last : dict = {}
+        self.now : int = 0
+
+        # Order events not yet drained.
+        self.events : list = []
+
+        # Client order ids seen (bounded) and nonces seen per key (bounded).
+        self.clientids : collections.OrderedDict = collections.OrderedDict()
+        self.nonces : dict = {}
+
+        self.counts : dict = { 'requests': 0, 'placed': 0, 'rejected': 0, 'cancelled': 0, 'filled': 0, 'duplicates': 0, 'nonces': 0 }
+
+    # Bookkeeping.
+
+    def request ( self ) -> None :
+
+        # Draw a nonce like a signed request would (a nonce repeated by a key would be rejected by the exchange).
+        apikey = authenticator.selectkey()
+        nonce = apikey.nextnonce()
+        with self.lock :
+            self.counts[ 'requests' ] += 1
+            seen = self.nonces.setdefault( apikey.name, collections.OrderedDict() )
+            if nonce in seen : self.counts[ 'nonces' ] += 1
+            seen[ nonce ] = None
+            while len( seen ) > 4096 : seen.popitem( last = False )
+        if self.noncequeue is not None : self.noncequeue.put( ( apikey.name, nonce ) )
+
+    def book (
+            self,
+            pair : str,
+            side : str,
+            ordertype : str,
+            size : str,
+            price : int,
+            stop : int,
+            tag : str
+        ) -> dict :
+
+        # Book an order (the lock is held by the caller).
+        scale = tickscale( pair )
+        clientid = clientorderid( tag ) if tag is not None else None
+        if clientid is not None :
+            if clientid in self.clientids : self.counts[ 'duplicates' ] += 1
+            self.clientids[ clientid ] = None
+            while len( self.clientids ) > 65536 : self.clientids.popitem( last = False )
+        order = str( next( self.sequence ) )
+        response = { 'order_id': order, 'id': order, 'symbol': pair.lower(), 'exchange': 'gemini', 'side': side, 'type': ordertype,
+                     'timestamp': str( self.now // 1000 ), 'timestampms': self.now, 'is_live': True, 'is_cancelled': False,
+                     'is_hidden': False, 'was_forced': False, 'avg_execution_price': '0.00', 'executed_amount': '0',
+                     'remaining_amount': scale.amountstring( scale.quanta( size ) ), 'original_amount': scale.amountstring( scale.quanta( size ) ),
+                     'price': scale.pricestring( price ), 'options': [ 'maker-or-cancel' ] if side == 'buy' else [] }
+        if stop is not None : response[ 'stop_price' ] = scale.pricestring( stop )
+        if clientid is not None : response[ 'client_order_id' ] = clientid
+        self.live[ order ] = SimulatedOrder( response, pair, side, price, stop )
+        self.books.setdefault( pair, {} )[ order ] = self.live[ order ]
+        self.counts[ 'placed' ] += 1
+        return dict( response )
+
+    def reject (
+            self,
+            reason : str,
+            message : str
+        ) -> dict :
+        self.counts[ 'rejected' ] += 1
+        return { 'result': 'error', 'reason': reason, 'message': message }
+
+    def close (
+            self,
+            simulated : SimulatedOrder,
+            cancelled : bool
+        ) -> dict :
+
+        # Take an order off the book and queue its closed event (the lock is held by the caller).
+        self.live.pop( simulated.response[ 'order_id' ], None )
+        self.books[ simulated.pair ].pop( simulated.response[ 'order_id' ], None )
+        response = simulated.response
+        response.update( { 'is_live': False, 'is_cancelled': cancelled, 'timestampms': self.now } )
+        self.events.append( dict( response, type = 'closed', order_type = response[ 'type' ] ) )
+        return dict( response )
+
+    def fill (
+            self,
+            simulated : SimulatedOrder,
+            price : int
+        ) -> None :
+
+        # Fill the whole order at the price given (the lock is held by the caller).
+        scale = tickscale( simulated.pair )
+        response = simulated.response
+        amount = response[ 'remaining_amount' ]
+        pricestring = scale.pricestring( price )
+        fee = Decimal( amount ) * Decimal( pricestring ) * self.makerfee
+        response.update( { 'avg_execution_price': pricestring, 'executed_amount': amount, 'remaining_amount': '0' } )
+        self.events.append( dict( response, type = 'fill', order_type = response[ 'type' ], is_live = False, timestampms = self.now,
+                                  fill = { 'trade_id': str( next( self.tradesequence ) ), 'liquidity': 'Maker', 'price': pricestring,
+                                           'amount': amount, 'fee': str( fee ), 'fee_currency': scale.quotecurrency } ) )
+        self.counts[ 'filled' ] += 1
+        self.close( simulated, False )
+
+    # Gateway.
+
+    def buy (
+            self,
+            pair : str,
+            size : str,
+            tag : str = None
+        ) -> dict :
+
+        # Maker-or-cancel bid at the last trade price.
+        self.request()
+        pair = pair.upper()
+        with self.lock :
+            if pair not in self.last : return self.reject( 'InvalidPrice', f'No trades in {pair} yet.' )
+            return self.book( pair, 'buy', 'exchange limit', size, self.last[ pair ], None, tag )
+
+    def placestop (
+            self,
+            pair : str,
+            size : str,
+            stop : str,
+            sell : str,
+            tag : str = None
+        ) -> dict :
+        self.request()
+        pair = pair.upper()
+        scale = tickscale( pair )
+        stopticks, sellticks = scale.ticks( stop ), scale.ticks( sell )
+        with self.lock :
+            # The same checks as the exchange: the stop of an ask above its limit price and below the market.
+            if stopticks <= sellticks : return self.reject( 'InvalidStopPriceSell', 'The stop price must exceed the limit price of a sell order.' )
+            if pair in self.last and stopticks >= self.last[ pair ] :
+                return self.reject( 'InvalidStopPriceSell', 'The stop price of a sell order must be below the last price.' )
+            return self.book( pair, 'sell', 'stop-limit', size, sellticks, stopticks, tag )
+
+    def sell (
+            self,
+            pair : str,
+            size : str,
+            sell : str,
+            tag : str = None
+        ) -> dict :
+        self.request()
+        pair = pair.upper()
+        sellticks = tickscale( pair ).ticks( sell )
+        with self.lock :
+            response = self.book( pair, 'sell', 'exchange limit', size, sellticks, None, tag )
+            if self.last.get( pair, sellticks - 1 ) < sellticks : return response
+            simulated = self.live[ response[ 'order_id' ] ]
+            self.fill( simulated, self.last[ pair ] )
+            return dict( simulated.response )
+
+    def cancel (
+            self,
+            order : str
+        ) -> dict :
+        self.request()
+        with self.lock :
+            simulated = self.live.get( order )
+            if simulated is None : return self.reject( 'OrderNotFound', f'Order {order} is not live.' )
+            self.counts[ 'cancelled' ] += 1
+            return self.close( simulated, True )
+
+    def status (
+            self,
+            order : str
+        ) -> dict :
+        self.request()
+        with self.lock :
+            simulated = self.live.get( order )
+            if simulated is None : return self.reject( 'OrderNotFound', f'Order {order} is not live.' )
+            return dict( simulated.response )
+
+    def orders ( self ) -> dict :
+
+        # Every live order indexed by order id, symbol and tag (like ordermanager.ordersnapshot).
+        self.request()
+        snapshot = { 'orders': {}, 'symbols': {}, 'tags': {} }
+        with self.lock :
+            for order, simulated in self.live.items() :
+                snapshot[ 'orders' ][ order ] = dict( simulated.response )
+                snapshot[ 'symbols' ].setdefault( simulated.pair, [] ).append( order )
+                tag = tagof( simulated.response )
+                if tag is not None : snapshot[ 'tags' ].setdefault( tag, [] ).append( order )
+        return snapshot
+
+    def fee ( self ) -> Decimal :
+        return self.makerfee
+
+    # Tape.
+
+    def trade (
+            self,
+            pair : str,
+            ticks : int,
+            timestampms : int
+        ) -> None :
+
+        # Match the live orders of a pair against one trade.
+        with self.lock :
+            self.now = timestampms
+            self.last[ pair ] = ticks
+            book = self.books.get( pair )
+            if not book : return
+            for simulated in list( book.values() ) :
+                if simulated.side == 'buy' :
+                    if ticks <= simulated.price : self.fill( simulated, simulated.price )
+                    continue
+                if not simulated.triggered :
+                    if ticks > simulated.stop : continue
+                    simulated.triggered = True
+                if ticks >= simulated.price : self.fill( simulated, ticks )
+
+    def drain ( self ) -> list :
+
+        # Order events queued since the previous drain.
+        with self.lock :
+            events, self.events = self.events, []
+        return events
+
+    def liveorders ( self ) -> dict :
+
+        # Live order ids per tag (orders without a tag are listed under None).
+        tags = {}
+        with self.lock :
+            for order, simulated in self.live.items() : tags.setdefault( tagof( simulated.response ), [] ).append( order )
+        return tags
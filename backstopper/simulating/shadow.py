@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+#
+# library name: shadow.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: paper trade hundreds of stop/sell discount pairs on one market data feed to compare them without placing orders.
+
+# Design Outline:
+#  1. Every parameter set ( stopdiscount, selldiscount ) is one paper position following the Trailer state machine (see trailer.py)
+#     with orders that are accepted at once: arming, trailing (ratcheting above the exit price), triggered, then sold.
+#     A sold position buys again at the next batch, so every set keeps trading for as long as the shadow runs.
+#  2. The state of every set lives in NumPy arrays and each batch of trades (see marketfeed.TradeBatch) updates all of them
+#     with a handful of vectorized operations: its highest bid taken can breach exit prices, its lowest ask taken stop prices.
+#  3. Prices are integer ticks scaled by exact integer multipliers, rounded like the Trailer (stop and sell prices up,
+#     exit prices to the nearest tick), so a set ratchets and sells at the same ticks a bot would.
+#  4. Triggered sets sell at the lowest ask taken when it is at or above their sell price, otherwise at their sell price
+#     once a later trade reaches it (like a resting stop-limit ask).
+#  5. One feed per pair serves every set. Its gate (see marketfeed) drops trades that cannot change any set.
+#  6. Round trips, ratchets and profit/loss (fees included) per set are written to definer.shadowpath every "interval" seconds.
+#
+# Execution:
+#   python3 -m backstopper.simulating.shadow [pair ...]   (evaluating the grid of definer.shadowgrid on the live feeds)
+#   python3 -m backstopper.simulating.shadow show [count]
+
+import sys
+import json
+import time
+import asyncio
+
+from decimal import Decimal
+
+import numpy
+
+import backstopper.informing.definer as definer
+import backstopper.informing.feeschedule as feeschedule
+import backstopper.logging.metrics as metrics
+
+from backstopper.logging.logger import logger as logger
+from backstopper.monitoring.marketfeed import MarketFeed
+from backstopper.pricing.quantizer import tickscale, rational
+
+# States of a paper position.
+waiting, arming, trailing, triggered = 0, 1, 2, 3
+
+def grid (
+        start : str = None,
+        stop : str = None,
+        step : str = None
+    ) -> list :
+
+    # Every ( stopdiscount, selldiscount ) pair of the grid where the sell discount is at least the stop discount (as the Trailer requires).
+    start, stop, step = ( Decimal( value ) for value in ( start or definer.shadowgrid[0], stop or definer.shadowgrid[1], step or definer.shadowgrid[2] ) )
+    values = []
+    while start <= stop :
+        values.append( start )
+        start += step
+    return [ ( str( stopdiscount ), str( selldiscount ) ) for stopdiscount in values for selldiscount in values if selldiscount >= stopdiscount ]
+
+def scaled (
+        ticks : numpy.ndarray,
+        numerators : numpy.ndarray,
+        denominator : int,
+        side : str = None
+    ) -> numpy.ndarray :
+
+    # Vectorized quantizer.divide( ticks * numerator, denominator, side ).
+    products = ticks * numerators
+    if side == 'ask' : return -( -products // denominator )
+    quotients, remainders = numpy.divmod( products, denominator )
+    return quotients + ( ( 2 * remainders > denominator ) | ( ( 2 * remainders == denominator ) & ( quotients & 1 == 1 ) ) )
+
+class Shadow :
+
+    def __init__ (
+            self,
+            pair : str,
+            parametersets : list = None,
+            size : str = '1',
+            fee : Decimal = None
+        ) -> None :
+
+        self.scale = tickscale( pair )
+        self.pair = self.scale.pair
+        self.parametersets = list( parametersets or grid() )
+        self.size = float( size )
+        self.tick = float( self.scale.tick )
+        self.fee = Decimal( fee if fee is not None else feeschedule.makerfee() )
+
+        # Discounts and the fee as integer numerators over one common denominator.
+        values = [ value for parameterset in self.parametersets for value in parameterset ] + [ str( self.fee ) ]
+        self.denominator = max( rational( value )[1] for value in values )
+        numerator = lambda value : rational( value )[0] * self.denominator // rational( value )[1]
+        stopnumerators = numpy.array( [ numerator( stopdiscount ) for stopdiscount, selldiscount in self.parametersets ], dtype = numpy.int64 )
+        sellnumerators = numpy.array( [ numerator( selldiscount ) for stopdiscount, selldiscount in self.parametersets ], dtype = numpy.int64 )
+        feenumerator = numerator( str( self.fee ) )
+        self.entrymultiplier = self.denominator + sellnumerators + feenumerator
+        self.ratchetmultiplier = self.denominator + stopnumerators + feenumerator
+        self.stopmultiplier = self.denominator - stopnumerators
+        self.sellmultiplier = self.denominator - sellnumerators - feenumerator
+        self.feerate = float( self.fee )
+
+        count = len( self.parametersets )
+        self.state = numpy.full( count, waiting, dtype = numpy.int8 )
+        self.cost = numpy.zeros( count, dtype = numpy.int64 )
+        self.exit = numpy.zeros( count, dtype = numpy.int64 )
+        self.stop = numpy.zeros( count, dtype = numpy.int64 )
+        self.sell = numpy.zeros( count, dtype = numpy.int64 )
+        self.ratchets = numpy.zeros( count, dtype = numpy.int64 )
+        self.roundtrips = numpy.zeros( count, dtype = numpy.int64 )
+        self.realized = numpy.zeros( count, dtype = numpy.float64 )
+        self.returns = numpy.zeros( count, dtype = numpy.float64 )
+        self.last : int = None
+
+        self.batches : int = 0
+        self.seconds : float = 0.0
+        self.started : float = time.monotonic()
+
+    # Evaluation.
+
+    def reprice (
+            self,
+            mask : numpy.ndarray,
+            basis : numpy.ndarray
+        ) -> None :
+
+        # Stop and sell prices of an ask derived from the basis (rounded up, like Trailer.reprice).
+        self.stop[ mask ] = scaled( basis, self.stopmultiplier[ mask ], self.denominator, 'ask' )
+        self.sell[ mask ] = scaled( basis, self.sellmultiplier[ mask ], self.denominator, 'ask' )
+
+    def update (
+            self,
+            highbid : int,
+            lowask : int,
+            high : int,
+            last : int
+        ) -> None :
+
+        # Apply one batch of trades (ticks: highest bid taken, lowest ask taken, highest trade and last trade) to every set.
+        started = time.thread_time()
+        state = self.state
+        active = state != waiting
+
+        # Upper bounds: an arming set places its first stop, trailing and triggered sets ratchet to the highest bid taken.
+        upper = active & ( self.exit < highbid ) if highbid is not None else numpy.zeros_like( active )
+        if upper.any() :
+            ratchet = upper & ( state != arming )
+            if ratchet.any() :
+                basis = numpy.full( int( ratchet.sum() ), highbid, dtype = numpy.int64 )
+                self.reprice( ratchet, basis )
+                self.ratchets[ ratchet ] += 1
+            # The exit price rises from the basis after every placement (the first exit price for arming sets).
+            bases = numpy.where( ratchet, highbid, self.exit )[ upper ]
+            self.exit[ upper ] = scaled( bases, self.ratchetmultiplier[ upper ], self.denominator )
+            state[ upper ] = trailing
+
+        # Lower bounds: trailing sets whose stop price was traded through trigger (a set is handled once per batch, uppers first).
+        sold = numpy.zeros_like( active )
+        saleprice = numpy.zeros( len( state ), dtype = numpy.int64 )
+        if lowask is not None :
+            trigger = ( state == trailing ) & ~upper & ( lowask <= self.stop )
+            state[ trigger ] = triggered
+            # The stop-limit ask fills against the trade that triggered it when that trade is at or above its sell price.
+            immediate = trigger & ( lowask >= self.sell )
+            sold |= immediate
+            saleprice[ immediate ] = lowask
+        resting = ( state == triggered ) & ~sold & ~upper & ( high >= self.sell ) if high is not None else numpy.zeros_like( active )
+        if lowask is not None : resting &= ~trigger
+        sold |= resting
+        saleprice[ resting ] = self.sell[ resting ]
+
+        if sold.any() :
+            costs = self.cost[ sold ] * self.tick
+            sales = saleprice[ sold ] * self.tick
+            self.realized[ sold ] += ( sales * ( 1 - self.feerate ) - costs * ( 1 + self.feerate ) ) * self.size
+            self.returns[ sold ] += sales * ( 1 - self.feerate ) / ( costs * ( 1 + self.feerate ) ) - 1
+            self.roundtrips[ sold ] += 1
+            state[ sold ] = waiting
+
+        # Sets without a position buy at the last trade (in the batch after they sold, like a relaunched bot).
+        entering = ~active
+        if last is not None and entering.any() :
+            self.cost[ entering ] = last
+            self.exit[ entering ] = scaled( numpy.full( int( entering.sum() ), last, dtype = numpy.int64 ), self.entrymultiplier[ entering ], self.denominator )
+            self.reprice( entering, self.exit[ entering ] )
+            state[ entering ] = arming
+
+        if last is not None : self.last = last
+        self.batches += 1
+        self.seconds += time.thread_time() - started
+
+    def bounds ( self ) -> tuple :
+
+        # Ticks between which trades cannot change any set (None when every trade matters, e.g. while a set waits or rests triggered).
+        if ( self.state == waiting ).any() or ( self.state == triggered ).any() : return ( None, None )
+        upper = int( self.exit.min() )
+        stops = self.stop[ self.state == trailing ]
+        lower = int( stops.max() ) + 1 if len( stops ) else None
+        return ( lower, upper )
+
+    def replay (
+            self,
+            frame,
+            stepms : int = 1000
+        ) -> None :
+
+        # Evaluate a TickFrame (see tickstore or tickgenerator) in batches of "stepms" with the aggregates computed at once.
+        if not len( frame ) : return
+        buckets = frame.timestampms // stepms
+        starts = numpy.concatenate( ( [ 0 ], numpy.flatnonzero( numpy.diff( buckets ) ) + 1 ) )
+        ends = numpy.concatenate( ( starts[ 1: ], [ len( frame ) ] ) )
+        bids = numpy.where( frame.makerside > 0, frame.price, numpy.iinfo( numpy.int64 ).min )
+        asks = numpy.where( frame.makerside < 0, frame.price, numpy.iinfo( numpy.int64 ).max )
+        highbids = numpy.maximum.reduceat( bids, starts ).tolist()
+        lowasks = numpy.minimum.reduceat( asks, starts ).tolist()
+        highs = numpy.maximum.reduceat( frame.price, starts ).tolist()
+        lasts = frame.price[ ends - 1 ].tolist()
+        for highbid, lowask, high, last in zip( highbids, lowasks, highs, lasts ) :
+            self.update( highbid if highbid != numpy.iinfo( numpy.int64 ).min else None,
+                         lowask if lowask != numpy.iinfo( numpy.int64 ).max else None, high, last )
+
+    # Reporting.
+
+    def report (
+            self,
+            count : int = None
+        ) -> list :
+
+        # Sets ordered by total profit/loss (realized plus the open position marked at the last trade, fees included).
+        unrealized = numpy.zeros( len( self.state ), dtype = numpy.float64 )
+        if self.last is not None :
+            holding = self.state != waiting
+            unrealized[ holding ] = ( self.last * self.tick * ( 1 - self.feerate ) - self.cost[ holding ] * self.tick * ( 1 + self.feerate ) ) * self.size
+        order = numpy.argsort( -( self.realized + unrealized ) )[ :count ]
+        names = { waiting: 'waiting', arming: 'arming', trailing: 'trailing', triggered: 'triggered' }
+        return [ { 'stopdiscount': self.parametersets[ index ][0], 'selldiscount': self.parametersets[ index ][1],
+                   'roundtrips': int( self.roundtrips[ index ] ), 'ratchets': int( self.ratchets[ index ] ),
+                   'realized': round( float( self.realized[ index ] ), 8 ), 'unrealized': round( float( unrealized[ index ] ), 8 ),
+                   'return': round( float( self.returns[ index ] ), 6 ), 'state': names[ int( self.state[ index ] ) ] } for index in order.tolist() ]
+
+    def snapshot ( self ) -> dict :
+        elapsed = time.monotonic() - self.started
+        return { 'pair': self.pair, 'size': str( self.size ), 'fee': str( self.fee ), 'sets': len( self.parametersets ),
+                 'batches': self.batches, 'cpushare': round( self.seconds / elapsed, 6 ) if elapsed > 0 else None,
+                 'last': self.scale.pricestring( self.last ) if self.last is not None else None, 'results': self.report() }
+
+    # Live evaluation.
+
+    async def run ( self ) -> None :
+
+        # Evaluate every batch of the pair's trades (reconnecting whenever the connection drops).
+        while True :
+            try :
+                async with MarketFeed( self.pair, connections = definer.feedconnections ) as marketfeed :
+                    logger.info ( f'Shadowing {len( self.parametersets )} parameter sets on {self.pair} trades. ' )
+                    async for batch in marketfeed.batches( definer.batchwindowms ) :
+                        self.update( batch.highbid, batch.lowask, batch.high, batch.last )
+                        metrics.increment( 'shadow.batches', pair = self.pair )
+                        lower, upper = self.bounds()
+                        marketfeed.setgate( self.scale.pricestring( lower ) if lower is not None else None,
+                                            self.scale.pricestring( upper ) if upper is not None else None )
+            except asyncio.CancelledError :
+                raise
+            except Exception as e :
+                logger.debug ( f'{e} : The {self.pair} market data connection failed. Let\'s reestablish the connection and try again! ' )
+                await asyncio.sleep( 3 )
+
+def readsnapshot (
+        path : str = None
+    ) -> dict :
+    with open( path or definer.shadowpath ) as file : return json.load( file )
+
+async def shadow (
+        pairs : list,
+        interval : float = 60.0,
+        path : str = None
+    ) -> None :
+
+    # Shadow the grid on every pair and publish the results every "interval" seconds.
+    shadows = [ Shadow( pair ) for pair in pairs ]
+    tasks = [ asyncio.create_task( item.run() ) for item in shadows ]
+    try :
+        while True :
+            await asyncio.sleep( interval )
+            with open( path or definer.shadowpath, 'w' ) as file : json.dump( { item.pair: item.snapshot() for item in shadows }, file )
+            for item in shadows :
+                best = item.report( 1 )
+                logger.info ( f'{item.pair} shadow: {item.batches:,} batches on {len( item.parametersets )} sets '
+                              f'({100 * item.seconds / ( time.monotonic() - item.started ):.3f}% of a core). Best: {best[0] if best else None}' )
+    finally :
+        for task in tasks : task.cancel()
+
+if __name__ == "__main__":
+
+    arguments = sys.argv[1:] or [ 'ETHUSD' ]
+
+    if arguments[0] == 'show' :
+        count = int( arguments[1] ) if len( arguments ) == 2 else 10
+        for pair, snapshot in readsnapshot().items() :
+            logger.info ( f'{pair}: {snapshot["sets"]} sets, {snapshot["batches"]:,} batches, last {snapshot["last"]}, {snapshot["cpushare"]} of a core. ' )
+            for result in snapshot[ 'results' ][ :count ] : logger.info ( f'{result}' )
+    else :
+        try : asyncio.run( shadow( arguments ) )
+        except KeyboardInterrupt : pass
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+#
+# library name: soak.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: run the engine against the simulated exchange on days of replayed trades (in minutes) and check its invariants.
+
+# Soak Outline:
+#  1. Trades come from tick frames (see tickstore): synthetic ones (see tickgenerator.py), ones recorded by tickrecorder ("recorded")
+#     or the trades of a fixture file (see tickgenerator.writefixtures).
+#  2. The engine (see engine.py) is the real one: its trailers, trigger indexes, locks, worker threads and ledger.
+#     Only its connections are replaced: the simulated exchange (see exchange.py) is its gateway and the replay is its feed.
+#  3. Trades are replayed in steps of "stepms" of exchange time. Each step:
+#       - matches the trades against the live orders of the exchange, then hands them to the engine as one batch,
+#       - delivers the order events of the exchange until the engine only waits on timers (settling),
+#       - reopens closed positions (and modifies one every "modifyevery" steps) so orders keep churning,
+#       - checks the invariants.
+#  4. The event loop runs on a virtual clock that follows the exchange time, so retries and timers of the engine
+#     take as long in exchange time as they would live (trades keep flowing meanwhile). Once the replay ends the clock
+#     jumps from timer to timer until the engine is done.
+#  5. Memory (resident set size), file descriptors, tasks and threads are sampled every "sampleevery" steps together with
+#     the throughput. The summary holds these curves and is written to definer.soakpath.
+#  6. A fleet ("fleet") soaks several processes at once, each signing with the key allocated to it (as the supervisor and
+#     the coordinator allocate them, see authenticator.allocate). Their exchanges forward every nonce to the parent, which checks
+#     that no key signs the same nonce twice across processes. Sharing one key among them ("shared") must violate it.
+#
+# Coverage: the engine (see engine.py, i.e. the controller and the workers of the coordinator) is soaked.
+# app.py (a bot run on its own or by the supervisor) talks to the REST and websocket endpoints directly and is NOT soaked.
+#
+# Invariants:
+#  - at most one live order per position (one stop, or one bid while buying),
+#  - the live orders of a position are the order its trailer holds (no orphans, no lost orders),
+#  - the engine tracks no more orders than positions,
+#  - no client order id and no nonce is used twice (nonces per key, across the processes of a fleet as well),
+#  - memory and file descriptors stay within definer.soakmemorylimit and definer.soakfdslack of the first sample,
+#  - no task of the engine waits more than "stuckseconds" of exchange time (e.g. retrying an order the exchange keeps rejecting).
+#
+# Execution:
+#   python3 -m backstopper.simulating.soak [pair] [days] [positions] [synthetic|recorded|fixture path] [processes] [shared]
+
+import os
+import sys
+import json
+import time
+import queue
+import asyncio
+import logging
+import datetime
+import threading
+import collections
+import multiprocessing
+
+import numpy
+
+import backstopper.informing.definer as definer
+import backstopper.recording.tickstore as tickstore
+import backstopper.authenticating.authenticator as authenticator
+
+from backstopper.logging.logger import logger as logger
+from backstopper.controlling.engine import Engine
+from backstopper.monitoring.marketfeed import TradeBatch
+from backstopper.monitoring.triggerindex import TriggerIndex
+from backstopper.recording.tickrecorder import amountdigits
+from backstopper.recording.tickstore import TickFrame
+from backstopper.pricing.quantizer import tickscale
+from backstopper.simulating.exchange import SimulatedExchange
+from backstopper.simulating.tickgenerator import TickGenerator, readfixtures
+
+# Tick sources.
+
+def recorded (
+        pair : str,
+        startms : int = 0,
+        endms : int = 2 ** 62,
+        directory : str = None,
+        chunk : int = 65536
+    ) :
+
+    # Yield frames of the trades recorded by tickrecorder in [ startms, endms ).
+    for day in tickstore.daysof( pair, directory ) :
+        daystart = int( datetime.datetime.strptime( day, '%Y%m%d' ).replace( tzinfo = datetime.timezone.utc ).timestamp() * 1000 )
+        frame = tickstore.loadticks( pair, max( startms, daystart ), min( endms, daystart + 86400000 ), directory )
+        for start in range( 0, len( frame ), chunk ) :
+            yield TickFrame( frame.pair, frame.tick, frame.amountdigits, { 'timestampms': frame.timestampms[ start:start + chunk ],
+                                                                           'tid': frame.tid[ start:start + chunk ],
+                                                                           'price': frame.price[ start:start + chunk ],
+                                                                           'amount': frame.amount[ start:start + chunk ],
+                                                                           'makerside': frame.makerside[ start:start + chunk ] } )
+
+# Virtual clock.
+
+class VirtualLoop ( asyncio.SelectorEventLoop ) :
+
+    # An event loop whose clock can be moved ahead (timers due meanwhile fire on its next iteration).
+    # It tracks the worker thread calls in flight so that callers can tell when only timers are left.
+
+    def __init__ ( self ) -> None :
+        super().__init__()
+        self.offset : float = 0.0
+        self.inflight : set = set()
+
+    def time ( self ) -> float :
+        return super().time() + self.offset
+
+    def advanceto (
+            self,
+            seconds : float
+        ) -> None :
+
+        # Move the clock to "seconds" (never backwards).
+        self.offset = max( self.offset, seconds - super().time() )
+
+    def run_in_executor ( self, executor, func, *arguments ) -> asyncio.Future :
+        future = super().run_in_executor( executor, func, *arguments )
+        self.inflight.add( future )
+        future.add_done_callback( self.inflight.discard )
+        return future
+
+    def idle ( self ) -> bool :
+
+        # Nothing is ready to run and no worker thread call is outstanding (tasks left are waiting on timers or on each other).
+        return not self.inflight and not self._ready
+
+    def nexttimer ( self ) -> float :
+
+        # Time of the earliest timer scheduled (None without timers).
+        return self._scheduled[0].when() if self._scheduled else None
+
+class SoakEngine ( Engine ) :
+
+    # The engine without its market data connections (the soak hands it batches instead).
+
+    def startfeed (
+            self,
+            pair : str
+        ) -> None :
+        if pair in self.feeds : return
+        self.indexes[ pair ] = TriggerIndex()
+        self.feeds[ pair ] = None
+
+# Resources.
+
+def resources ( ) -> dict :
+
+    # Resident set size (bytes), open file descriptors, threads and tasks of this process.
+    rss, fds = None, None
+    if os.path.exists( '/proc/self/statm' ) :
+        with open( '/proc/self/statm' ) as file : rss = int( file.read().split()[1] ) * os.sysconf( 'SC_PAGE_SIZE' )
+        fds = len( os.listdir( '/proc/self/fd' ) )
+    else :
+        import resource
+        rss = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    return { 'rss': rss, 'fds': fds, 'threads': threading.active_count(), 'tasks': len( asyncio.all_tasks() ) }
+
+class Soak :
+
+    def __init__ (
+            self,
+            pair : str,
+            positions : int = 8,
+            size : str = None,
+            stop : str = '0.002',
+            sell : str = '0.004',
+            stepms : int = 1000,
+            sampleevery : int = 1000,
+            modifyevery : int = 50,
+            stuckseconds : float = 600,
+            seed : int = None,
+            nonces = None
+        ) -> None :
+
+        self.pair = pair.upper()
+        self.scale = tickscale( self.pair )
+        self.names = [ f'{self.pair.lower()}-{index}' for index in range( positions ) ]
+        self.size = size or [ item[ 'minimumorder' ] for item in definer.minimumorders if item[ 'currency' ] == self.scale.basecurrency ][0]
+        self.discounts = [ ( stop, sell ), ( '0.001', '0.003' ), ( '0.003', '0.005' ) ]
+        self.stepms = stepms
+        self.sampleevery = sampleevery
+        self.modifyevery = modifyevery
+        self.stuckseconds = stuckseconds
+        self.generator = numpy.random.default_rng( seed )
+
+        self.exchange = SimulatedExchange( nonces = nonces )
+        self.engine = SoakEngine( gateway = self.exchange )
+        self.loop : VirtualLoop = None
+
+        self.steps : int = 0
+        self.trades : int = 0
+        self.roundtrips : int = 0
+        self.ratchets : int = 0
+        self.openfailures : int = 0
+        self.origin : float = None
+        self.born : dict = {}
+        self.commanding : set = set()
+        self.firstms : int = None
+        self.lastms : int = None
+        self.started : float = None
+
+        self.violations : dict = {}
+        self.examples : list = []
+        self.samples : list = []
+        self.baseline : dict = None
+        self.counted : dict = { 'duplicates': 0, 'nonces': 0 }
+
+    # Invariants.
+
+    def violation (
+            self,
+            kind : str,
+            detail : str
+        ) -> None :
+        self.violations[ kind ] = self.violations.get( kind, 0 ) + 1
+        if len( self.examples ) < 20 : self.examples.append( { 'step': self.steps, 'kind': kind, 'detail': detail } )
+        logger.warning ( f'Soak step {self.steps}: {kind} violation. {detail}' )
+
+    def check ( self ) -> None :
+        live = self.exchange.liveorders()
+        for tag, orders in live.items() :
+            if tag is None : self.violation( 'untagged', f'Orders {orders} carry no position. ' )
+            elif len( orders ) > 1 : self.violation( 'orders', f'{tag} has {len( orders )} live orders: {orders}' )
+        for name, position in self.engine.positions.items() :
+            expected = [ position.trailer.order ] if position.trailer.order is not None else []
+            if sorted( live.get( name, [] ) ) != expected :
+                self.violation( 'desync', f'{name} ({position.trailer.state}) holds {expected} but {live.get( name, [] )} are live. ' )
+        if len( self.engine.orders ) > len( self.engine.positions ) :
+            self.violation( 'registry', f'The engine tracks {len( self.engine.orders )} orders for {len( self.engine.positions )} positions. ' )
+        now, current = self.loop.time(), asyncio.current_task()
+        born = {}
+        for task in asyncio.all_tasks() - { current } :
+            born[ task ] = self.born.get( task, now )
+            if now - born[ task ] > self.stuckseconds and self.born.get( task ) != float( '-inf' ) :
+                waiting = [ f'{name} ({position.trailer.state})' for name, position in self.engine.positions.items() if position.trailer.next() is not None ]
+                self.violation( 'stuck', f'A task has waited {now - born[ task ]:,.0f} seconds. Positions with pending actions: {waiting}' )
+                born[ task ] = float( '-inf' )
+        self.born = born
+        for kind in self.counted :
+            if self.exchange.counts[ kind ] > self.counted[ kind ] :
+                self.violation( kind, f'{self.exchange.counts[ kind ] - self.counted[ kind ]} repeated since the previous step. ' )
+                self.counted[ kind ] = self.exchange.counts[ kind ]
+
+    def sample ( self ) -> None :
+        wallseconds = time.perf_counter() - self.started
+        sample = dict( resources(), step = self.steps, trades = self.trades, wallseconds = round( wallseconds, 3 ),
+                       virtualseconds = ( self.lastms - self.firstms ) / 1000 )
+        previous = self.samples[ -1 ] if self.samples else { 'trades': 0, 'wallseconds': 0.0 }
+        elapsed = sample[ 'wallseconds' ] - previous[ 'wallseconds' ]
+        sample[ 'tradespersecond' ] = round( ( sample[ 'trades' ] - previous[ 'trades' ] ) / elapsed ) if elapsed > 0 else None
+        self.samples.append( sample )
+        if self.baseline is None :
+            self.baseline = sample
+            return
+        if sample[ 'rss' ] - self.baseline[ 'rss' ] > definer.soakmemorylimit :
+            self.violation( 'memory', f'Resident set grew by {( sample[ "rss" ] - self.baseline[ "rss" ] ) / 2**20:,.1f} MiB. ' )
+        if sample[ 'fds' ] is not None and sample[ 'fds' ] - self.baseline[ 'fds' ] > definer.soakfdslack :
+            self.violation( 'fds', f'{sample[ "fds" ] - self.baseline[ "fds" ]} more file descriptors are open. ' )
+
+    # Steps.
+
+    async def settle ( self ) -> None :
+
+        # Deliver order events until the engine only waits on timers (which fire as the clock follows the trades).
+        # One iteration of the loop first, so that timers due since the clock moved are run.
+        await asyncio.sleep( 0 )
+        while True :
+            for event in self.exchange.drain() : self.engine.onorderevent( event )
+            if self.loop.idle() and not self.exchange.events : return
+            if self.loop.inflight and not self.loop._ready : await asyncio.wait( set( self.loop.inflight ), return_when = asyncio.FIRST_COMPLETED )
+            else : await asyncio.sleep( 0 )
+
+    async def finish ( self ) -> None :
+
+        # Let the timers still scheduled fire (jumping the clock to each) until every task of the engine is done.
+        current = asyncio.current_task()
+        for attempt in range( 1000 ) :
+            await self.settle()
+            if not asyncio.all_tasks() - { current } or self.loop.nexttimer() is None : return
+            self.loop.advanceto( self.loop.nexttimer() )
+            await asyncio.sleep( 0 )
+
+    async def command (
+            self,
+            name : str,
+            command : dict
+        ) -> None :
+
+        # Commands run as tasks (like commands from the controller) so a position waiting on its lock never blocks the replay.
+        try : await self.engine.command( command )
+        except ValueError as e :
+            if command[ 'command' ] == 'open' : self.openfailures += 1
+            logger.debug ( f'Unable to {command["command"]} {name}. Error: {e}' )
+        finally :
+            self.commanding.discard( name )
+
+    def submit (
+            self,
+            name : str,
+            command : dict
+        ) -> None :
+        self.commanding.add( name )
+        asyncio.create_task( self.command( name, dict( command, name = name ) ) )
+
+    def churn ( self ) -> None :
+
+        # Reopen closed positions and modify one trailing position now and then.
+        for name in self.names :
+            position = self.engine.positions.get( name )
+            if name in self.commanding or position is not None and position.trailer.state != 'closed' : continue
+            if position is not None :
+                if position.trailer.saleprice is not None : self.roundtrips += 1
+                self.ratchets += position.trailer.ratchets
+            stop, sell = self.discounts[0]
+            self.submit( name, { 'command': 'open', 'pair': self.pair, 'size': self.size, 'stop': stop, 'sell': sell } )
+        if self.modifyevery and self.steps % self.modifyevery == 0 :
+            trailing = [ name for name, position in self.engine.positions.items() if position.trailer.state == 'trailing' and name not in self.commanding ]
+            if trailing :
+                stop, sell = self.discounts[ self.generator.integers( len( self.discounts ) ) ]
+                self.submit( trailing[ self.generator.integers( len( trailing ) ) ], { 'command': 'modify', 'stop': stop, 'sell': sell } )
+
+    async def step (
+            self,
+            timestampms : list,
+            tid : list,
+            price : list,
+            amount : list,
+            makerside : list
+        ) -> None :
+        self.loop.advanceto( self.origin + ( timestampms[ -1 ] - self.firstms ) / 1000 )
+        batch = TradeBatch()
+        for index, ticks in enumerate( price ) :
+            self.exchange.trade( self.pair, ticks, timestampms[ index ] )
+            event = { 'type': 'trade', 'tid': tid[ index ], 'price': self.scale.pricestring( ticks ),
+                      'amount': f'{amount[ index ] * 10.0 ** -amountdigits:.{amountdigits}f}', 'makerSide': 'bid' if makerside[ index ] > 0 else 'ask' }
+            batch.add( timestampms[ index ], event, ticks )
+        self.engine.onbatch( self.pair, batch )
+        await self.settle()
+        self.churn()
+        await self.settle()
+        self.steps += 1
+        self.trades += len( batch )
+        self.lastms = timestampms[ -1 ]
+        self.check()
+        if self.steps % self.sampleevery == 0 : self.sample()
+
+    async def replay (
+            self,
+            frames
+        ) -> None :
+        self.started = time.perf_counter()
+        for frame in frames :
+            if not len( frame ) : continue
+            if self.firstms is None :
+                self.firstms = self.lastms = int( frame.timestampms[0] )
+                self.origin = self.loop.time()
+            # Cut the frame into steps of "stepms" (a step never spans two frames).
+            buckets = frame.timestampms // self.stepms
+            starts = numpy.concatenate( ( [ 0 ], numpy.flatnonzero( numpy.diff( buckets ) ) + 1 ) ).tolist()
+            ends = starts[ 1: ] + [ len( frame ) ]
+            columns = [ frame.timestampms.tolist(), frame.tid.tolist(), frame.price.tolist(), frame.amount.tolist(), frame.makerside.tolist() ]
+            for start, end in zip( starts, ends ) : await self.step( *[ column[ start:end ] for column in columns ] )
+
+        # Close every position. No order may remain live afterwards.
+        for name in self.names :
+            if name in self.engine.positions : self.submit( name, { 'command': 'close' } )
+        await self.finish()
+        self.check()
+        for tag, orders in self.exchange.liveorders().items() : self.violation( 'orphans', f'{tag} left {orders} live after closing. ' )
+        self.sample()
+
+        # Tasks still waiting (already reported as stuck) are cancelled.
+        leftovers = asyncio.all_tasks() - { asyncio.current_task() }
+        for task in leftovers : task.cancel()
+        await asyncio.gather( *leftovers, return_exceptions = True )
+
+    def run (
+            self,
+            frames
+        ) -> dict :
+
+        # Replay the frames on a virtual clock and return the summary (quieting the engine's logs meanwhile).
+        level = logger.level
+        logger.setLevel( logging.WARNING )
+        self.loop = VirtualLoop()
+        try :
+            self.loop.run_until_complete( self.replay( frames ) )
+            self.loop.run_until_complete( self.loop.shutdown_default_executor() )
+        finally :
+            self.loop.close()
+            logger.setLevel( level )
+        return self.summary()
+
+    def summary ( self ) -> dict :
+        wallseconds = time.perf_counter() - self.started
+        virtualseconds = ( self.lastms - self.firstms ) / 1000 if self.firstms is not None else 0.0
+        ledger = self.engine.ledger.snapshot()
+        return { 'pair': self.pair, 'positions': len( self.names ), 'steps': self.steps, 'trades': self.trades,
+                 'virtualseconds': virtualseconds, 'wallseconds': round( wallseconds, 3 ),
+                 'speedup': round( virtualseconds / wallseconds, 1 ) if wallseconds else None,
+                 'tradespersecond': round( self.trades / wallseconds ) if wallseconds else None,
+                 'stepspersecond': round( self.steps / wallseconds ) if wallseconds else None,
+                 'roundtrips': self.roundtrips, 'ratchets': self.ratchets, 'openfailures': self.openfailures,
+                 'exchange': dict( self.exchange.counts ), 'realized': ledger.get( 'realized' ),
+                 'passed': not self.violations, 'violations': self.violations, 'examples': self.examples, 'samples': self.samples }
+
+# Fleets.
+
+def framesof (
+        pair : str,
+        days : float,
+        source : str,
+        seed : int = None
+    ) :
+
+    # Frames of a source: 'synthetic', 'recorded' or the path of a fixture file.
+    if source == 'synthetic' : return TickGenerator( pair, seed = seed ).frames( days, chunk = 65536 )
+    if source == 'recorded' : return recorded( pair )
+    return readfixtures( pair, source )
+
+def member (
+        index : int,
+        apikey : str,
+        pair : str,
+        days : float,
+        positions : int,
+        source : str,
+        nonces,
+        results
+    ) -> None :
+
+    # One process of a fleet: a soak signing with its own key (like a worker launched with BACKSTOPPER_APIKEY).
+    authenticator.restrict( apikey )
+    try : summary = Soak( pair, positions, seed = index, nonces = nonces ).run( framesof( pair, days, source, index ) )
+    except Exception as e : summary = { 'passed': False, 'error': repr( e ) }
+    results.put( ( index, summary ) )
+
+def fleet (
+        pair : str,
+        days : float,
+        positions : int,
+        processes : int,
+        source : str = 'synthetic',
+        shared : bool = False
+    ) -> dict :
+
+    # Soak "processes" processes at once and check the nonces they sign per key across processes.
+    # Each process is allocated a key of its own (ValueError when credentials.py lists too few) unless the first key is "shared".
+    apikeys = [ authenticator.keys[0].name ] * processes if shared else authenticator.allocate( processes )
+    context = multiprocessing.get_context( 'fork' )
+    nonces, results = context.Queue(), context.Queue()
+    members = [ context.Process( target = member, args = ( index, apikey, pair, days, positions, source, nonces, results ), name = f'soak-{index}' )
+                for index, apikey in enumerate( apikeys ) ]
+    for process in members : process.start()
+
+    # Read both queues until every process exited and nothing is left (nonces arrive in the order the exchange would see them).
+    seen, repeats, summaries = {}, {}, {}
+    requests : int = 0
+    while True :
+        alive = any( process.is_alive() for process in members )
+        try :
+            while True :
+                index, summary = results.get_nowait()
+                summaries[ index ] = summary
+        except queue.Empty : pass
+        try : name, nonce = nonces.get( timeout = 0.1 )
+        except queue.Empty :
+            if alive : continue
+            break
+        requests += 1
+        signed = seen.setdefault( name, collections.OrderedDict() )
+        if nonce in signed :
+            repeats[ name ] = repeats.get( name, 0 ) + 1
+            if repeats[ name ] <= 5 : logger.warning ( f'Key {name} signed nonce {nonce} twice (across the processes of the fleet). ' )
+        signed[ nonce ] = None
+        while len( signed ) > 65536 : signed.popitem( last = False )
+    for process in members : process.join()
+
+    missing = [ index for index in range( processes ) if index not in summaries ]
+    for index in missing : summaries[ index ] = { 'passed': False, 'error': f'Exited with status {members[ index ].exitcode} without a summary.' }
+    passed = not repeats and all( summaries[ index ].get( 'passed' ) for index in range( processes ) )
+    return { 'pair': pair.upper(), 'processes': processes, 'keys': apikeys, 'requests': requests, 'nonces': repeats,
+             'passed': passed, 'members': [ summaries[ index ] for index in range( processes ) ] }
+
+if __name__ == "__main__":
+
+    # Set default pair, days, positions, source and processes in case a BASH wrapper has not been used.
+    pair : str = 'ETHUSD'
+    days : float = 3.0
+    positions : int = 8
+    source : str = 'synthetic'
+    processes : int = 1
+
+    # Override defaults with command line parameters from BASH wrapper.
+    if len( sys.argv ) >= 2 : pair = sys.argv[1]
+    if len( sys.argv ) >= 3 : days = float( sys.argv[2] )
+    if len( sys.argv ) >= 4 : positions = int( sys.argv[3] )
+    if len( sys.argv ) >= 5 : source = sys.argv[4]
+    if len( sys.argv ) >= 6 : processes = int( sys.argv[5] )
+
+    if processes > 1 :
+        try : summary = fleet( pair, days, positions, processes, source, len( sys.argv ) >= 7 and sys.argv[6] == 'shared' )
+        except ValueError as e :
+            logger.error ( f'Unable to soak {processes} processes. {e}' )
+            sys.exit(1)
+        with open( definer.soakpath, 'w' ) as file : json.dump( summary, file, indent = 1 )
+        for index, apikey, member in zip( range( processes ), summary[ 'keys' ], summary[ 'members' ] ) :
+            if 'error' in member : logger.error ( f'Process {index} (key {apikey}) failed: {member["error"]}' )
+            else : logger.info ( f'Process {index} (key {apikey}): {member["trades"]:,} trades, {member["roundtrips"]:,} round trips, '
+                                 f'exchange {member["exchange"]}, violations {member["violations"]}. ' )
+        logger.info ( f'{summary["requests"]:,} requests signed by {len( set( summary["keys"] ) )} keys. Nonces repeated across processes: {summary["nonces"]}. ' )
+        if summary[ 'passed' ] : logger.info ( f'Every invariant held in every process. Summary written to {definer.soakpath}. ' )
+        else : logger.error ( f'Invariants violated. Summary written to {definer.soakpath}. ' )
+        sys.exit( 0 if summary[ 'passed' ] else 1 )
+
+    soak = Soak( pair, positions )
+    summary = soak.run( framesof( pair, days, source ) )
+    with open( definer.soakpath, 'w' ) as file : json.dump( summary, file, indent = 1 )
+
+    logger.info ( f'Replayed {summary["trades"]:,} {pair} trades ({summary["virtualseconds"] / 3600:,.1f} hours) in {summary["wallseconds"]:,.1f} seconds '
+                  f'({summary["speedup"]:,.0f}x, {summary["tradespersecond"]:,} trades per second). ' )
+    logger.info ( f'Round trips: {summary["roundtrips"]:,}. Ratchets: {summary["ratchets"]:,}. Exchange: {summary["exchange"]}. ' )
+    for sample in summary[ 'samples' ][ :: max( 1, len( summary[ 'samples' ] ) // 20 ) ] :
+        logger.info ( f'{sample["virtualseconds"] / 3600:8,.1f}h {sample["tradespersecond"] or 0:>9,} trades/s {sample["rss"] / 2**20:8,.1f} MiB '
+                      f'{sample["fds"]} fds {sample["threads"]} threads {sample["tasks"]} tasks' )
+    if summary[ 'passed' ] : logger.info ( f'Every invariant held. Summary written to {definer.soakpath}. ' )
+    else : logger.error ( f'Invariants violated: {summary["violations"]}. Summary written to {definer.soakpath}. ' )
+    sys.exit( 0 if summary[ 'passed' ] else 1 )
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+#
+# library name: tickgenerator.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: generate realistic trade streams with NumPy (regimes, jumps and bursts) for benchmarks, soaks and tests.
+
+# Model Outline (every step is vectorized over a whole chunk of trades):
+#  1. Prices follow a random walk of log returns in ticks of the pair (see definer.ticksizes), so every price is on the tick grid.
+#  2. Volatility regimes: the daily "volatility" is multiplied by one of "regimes", switching "regimeswitches" times a day on average.
+#  3. Jumps: "jumpsperday" times a day on average a normal jump of "jumpsize" (as a decimal) is added to the return.
+#  4. Bursts: "burstsperday" times a day on average the next "burstlength" trades arrive "burstintensity" times faster.
+#  5. Gaps between trades are exponential. Amounts are lognormal multiples of the minimum quantity (mean "meanamount").
+#  6. Maker sides follow the direction of each trade (upticks take asks, downticks take bids).
+# The state (clock, price, regime, burst and trade id) carries over from one chunk to the next.
+#
+# Outputs:
+#  - TickFrame chunks (see tickstore), which the soak harness replays (see soak.py),
+#  - binary tick files written through a TickRecorder (readable by tickstore.loadticks),
+#  - Gemini v1 market data updates as JSON lines (fixtures), which "readfixtures" turns back into frames and "serve" streams
+#    over a local websocket (point definer.sockserver at it to feed marketfeed, blockpricerange or the engine).
+#
+# Execution:
+#   python3 -m backstopper.simulating.tickgenerator bench [pair] [trades]
+#   python3 -m backstopper.simulating.tickgenerator ticks [pair] [days] [directory]
+#   python3 -m backstopper.simulating.tickgenerator fixtures [pair] [trades] [path]
+#   python3 -m backstopper.simulating.tickgenerator serve [path] [port] [speed]
+
+import re
+import sys
+import json
+import time
+import asyncio
+import websockets
+
+import numpy
+
+import backstopper.informing.definer as definer
+
+from backstopper.logging.logger import logger as logger
+from backstopper.recording.tickrecorder import TickRecorder, amountdigits, amountunits
+from backstopper.recording.tickstore import TickFrame
+from backstopper.pricing.quantizer import tickscale
+
+class TickGenerator :
+
+    def __init__ (
+            self,
+            pair : str,
+            price : str = '1000',
+            tradesperday : int = 50000,
+            volatility : float = 0.03,
+            regimes : tuple = ( 0.5, 1.0, 3.0 ),
+            regimeswitches : float = 4,
+            jumpsperday : float = 2,
+            jumpsize : float = 0.01,
+            burstsperday : float = 24,
+            burstlength : int = 200,
+            burstintensity : float = 20,
+            meanamount : str = None,
+            startms : int = None,
+            seed : int = None
+        ) -> None :
+
+        self.scale = tickscale( pair )
+        self.pair = self.scale.pair
+        self.generator = numpy.random.default_rng( seed )
+
+        self.tradesperday = tradesperday
+        self.sigmas = numpy.asarray( regimes, dtype = numpy.float64 ) * volatility / numpy.sqrt( tradesperday )
+        self.switchprobability = regimeswitches / tradesperday
+        self.jumpprobability = jumpsperday / tradesperday
+        self.jumpsize = jumpsize
+        self.burstprobability = burstsperday / tradesperday
+        self.burstlength = burstlength
+        self.burstintensity = burstintensity
+        self.meangapms = 86400000 / tradesperday
+
+        # Amounts are drawn in quanta (minimum quantities) and stored in units of 10^-8 (see tickrecorder).
+        minimumorder = [ item[ 'minimumorder' ] for item in definer.minimumorders if item[ 'currency' ] == self.scale.basecurrency ][0]
+        self.meanquanta = max( 1, self.scale.quanta( meanamount or str( 10 * float( minimumorder ) ) ) )
+        self.quantumunits = amountunits( self.scale.bump )
+
+        # State carried from one chunk to the next.
+        self.clock : float = float( startms if startms is not None else int( time.time() * 1000 ) )
+        self.level : float = float( numpy.log( self.scale.ticks( price ) ) )
+        self.ticks : int = self.scale.ticks( price )
+        self.regime : int = min( 1, len( regimes ) - 1 )
+        self.sinceburst : int = burstlength
+        self.tid : int = 1
+
+    def generate (
+            self,
+            count : int
+        ) -> TickFrame :
+
+        # The next "count" trades.
+        generator = self.generator
+        index = numpy.arange( count )
+
+        # Regimes: a new regime is drawn at every switch (the first segment keeps the current one).
+        segments = numpy.cumsum( generator.random( count ) < self.switchprobability )
+        choices = generator.integers( len( self.sigmas ), size = int( segments[ -1 ] ) + 1 )
+        choices[0] = self.regime
+        regime = choices[ segments ]
+        self.regime = int( regime[ -1 ] )
+
+        # Returns: normal moves scaled by the regime plus occasional jumps.
+        returns = generator.standard_normal( count ) * self.sigmas[ regime ]
+        jumps = generator.random( count ) < self.jumpprobability
+        returns[ jumps ] += generator.normal( 0.0, self.jumpsize, int( jumps.sum() ) )
+        levels = self.level + numpy.cumsum( returns )
+        price = numpy.maximum( 1, numpy.rint( numpy.exp( levels ) ) ).astype( numpy.int64 )
+
+        # Bursts: trades within "burstlength" of the latest burst start arrive faster.
+        starts = numpy.where( generator.random( count ) < self.burstprobability, index, -self.sinceburst )
+        sinceburst = index - numpy.maximum.accumulate( starts )
+        gaps = generator.exponential( self.meangapms, count )
+        gaps[ sinceburst < self.burstlength ] /= self.burstintensity
+        timestampms = ( self.clock + numpy.cumsum( gaps ) ).astype( numpy.int64 )
+
+        # Maker sides from the direction of each trade (a coin flip when the price did not change).
+        moves = numpy.diff( price, prepend = self.ticks )
+        makerside = numpy.where( moves > 0, -1, numpy.where( moves < 0, 1, numpy.where( generator.random( count ) < 0.5, 1, -1 ) ) ).astype( numpy.int8 )
+
+        amount = numpy.maximum( 1, numpy.rint( generator.lognormal( -0.5, 1.0, count ) * self.meanquanta ) ).astype( numpy.int64 ) * self.quantumunits
+        tid = numpy.arange( self.tid, self.tid + count, dtype = numpy.int64 )
+
+        self.clock = self.clock + float( gaps.sum() )
+        self.level = float( levels[ -1 ] )
+        self.ticks = int( price[ -1 ] )
+        self.sinceburst = int( sinceburst[ -1 ] ) + 1
+        self.tid += count
+        return TickFrame( self.pair, self.scale.tick, amountdigits, { 'timestampms': timestampms, 'tid': tid, 'price': price,
+                                                                      'amount': amount, 'makerside': makerside } )
+
+    def frames (
+            self,
+            days : float,
+            chunk : int = 1 << 20
+        ) :
+
+        # Yield frames covering about "days" days of trades.
+        remaining = int( days * self.tradesperday )
+        while remaining > 0 :
+            count = min( chunk, remaining )
+            remaining -= count
+            yield self.generate( count )
+
+# Binary tick files.
+
+def writeticks (
+        frames,
+        directory : str = None
+    ) -> int :
+
+    # Append frames to the tick files of their pair (one folder per day, see tickrecorder). Return the trades written.
+    recorder = TickRecorder( directory )
+    written = 0
+    try :
+        for frame in frames :
+            scale = tickscale( frame.pair )
+            days = frame.timestampms // 86400000
+            starts = numpy.concatenate( ( [ 0 ], numpy.flatnonzero( numpy.diff( days ) ) + 1 ) ).tolist()
+            for start, end in zip( starts, starts[ 1: ] + [ len( frame ) ] ) :
+                arrays = [ frame.timestampms[ start:end ], frame.tid[ start:end ], frame.price[ start:end ], frame.amount[ start:end ], frame.makerside[ start:end ] ]
+                recorder.append( scale, int( arrays[0][0] ), arrays )
+            written += len( frame )
+    finally :
+        recorder.stop()
+    return written
+
+# Websocket fixtures.
+
+def writefixtures (
+        frames,
+        path : str
+    ) -> int :
+
+    # Write Gemini v1 market data updates (one JSON object per line, trades sharing a timestamp share an update). Return the updates written.
+    updates = 0
+    with open( path, 'w' ) as file :
+        file.write( json.dumps( { 'type': 'update', 'eventId': 0, 'socket_sequence': 0, 'events': [] } ) + '\n' )
+        for frame in frames :
+            scale = tickscale( frame.pair )
+            timestampms, tid, amount = frame.timestampms.tolist(), frame.tid.tolist(), frame.amount.tolist()
+            prices = [ scale.pricestring( ticks ) for ticks in frame.price.tolist() ]
+            makers = [ 'bid' if side > 0 else 'ask' for side in frame.makerside.tolist() ]
+            starts = numpy.concatenate( ( [ 0 ], numpy.flatnonzero( numpy.diff( frame.timestampms ) ) + 1 ) ).tolist()
+            lines = []
+            for start, end in zip( starts, starts[ 1: ] + [ len( frame ) ] ) :
+                updates += 1
+                events = ','.join( f'{{"type":"trade","tid":{tid[ row ]},"price":"{prices[ row ]}",'
+                                   f'"amount":"{amount[ row ] * 10.0 ** -amountdigits:.{amountdigits}f}","makerSide":"{makers[ row ]}"}}'
+                                   for row in range( start, end ) )
+                lines.append( f'{{"type":"update","eventId":{tid[ start ]},"socket_sequence":{updates},"timestamp":{timestampms[ start ] // 1000},'
+                              f'"timestampms":{timestampms[ start ]},"events":[{events}]}}\n' )
+            file.writelines( lines )
+    return updates
+
+def readfixtures (
+        pair : str,
+        path : str,
+        chunk : int = 65536
+    ) :
+
+    # Yield the trades of a fixture file as frames.
+    scale = tickscale( pair )
+    rows = { 'timestampms': [], 'tid': [], 'price': [], 'amount': [], 'makerside': [] }
+
+    def frame () -> TickFrame :
+        arrays = { name: numpy.asarray( values, dtype = numpy.int8 if name == 'makerside' else numpy.int64 ) for name, values in rows.items() }
+        for values in rows.values() : values.clear()
+        return TickFrame( scale.pair, scale.tick, amountdigits, arrays )
+
+    with open( path ) as file :
+        for line in file :
+            update = json.loads( line )
+            for event in update.get( 'events', () ) :
+                if event.get( 'type' ) != 'trade' : continue
+                rows[ 'timestampms' ].append( update[ 'timestampms' ] )
+                rows[ 'tid' ].append( event[ 'tid' ] )
+                rows[ 'price' ].append( scale.ticks( event[ 'price' ] ) )
+                rows[ 'amount' ].append( amountunits( event[ 'amount' ] ) )
+                rows[ 'makerside' ].append( 1 if event.get( 'makerSide' ) == 'bid' else -1 )
+            if len( rows[ 'tid' ] ) >= chunk : yield frame()
+    if rows[ 'tid' ] : yield frame()
+
+timestamppattern = re.compile( r'"timestamp":([0-9]+),"timestampms":([0-9]+)' )
+
+async def serve (
+        path : str,
+        port : int = 8765,
+        speed : float = 0
+    ) -> None :
+
+    # Stream a fixture file to every client that connects (whatever the path requested).
+    # Timestamps are restamped at sending time (so lag checks pass). Gaps are replayed "speed" times faster (0 sends at once).
+    async def replay ( websocket, *arguments ) -> None :
+        previous = None
+        with open( path ) as file :
+            for line in file :
+                match = timestamppattern.search( line )
+                if match is not None :
+                    timestampms = int( match.group( 2 ) )
+                    if speed and previous is not None and timestampms > previous : await asyncio.sleep( ( timestampms - previous ) / 1000 / speed )
+                    previous = timestampms
+                    now = int( time.time() * 1000 )
+                    line = line[ :match.start() ] + f'"timestamp":{now // 1000},"timestampms":{now}' + line[ match.end(): ]
+                await websocket.send( line.rstrip( '\n' ) )
+                if not speed : await asyncio.sleep( 0 )
+        await websocket.wait_closed()
+
+    async with websockets.serve( replay, '127.0.0.1', port ) :
+        logger.info ( f'Serving {path} on ws://127.0.0.1:{port} (set definer.sockserver to connect). ' )
+        await asyncio.Future()
+
+if __name__ == "__main__":
+
+    # Usage: bench [pair] [trades] | ticks [pair] [days] [directory] | fixtures [pair] [trades] [path] | serve [path] [port] [speed]
+    arguments = sys.argv[1:] or [ 'bench' ]
+    command = arguments[0]
+    pair = arguments[1] if len( arguments ) >= 2 and command != 'serve' else 'ETHUSD'
+
+    if command == 'bench' :
+        count = int( float( arguments[2] ) ) if len( arguments ) >= 3 else 10000000
+        generator = TickGenerator( pair, seed = 1 )
+        started = time.perf_counter()
+        generated = sum( len( frame ) for frame in generator.frames( count / generator.tradesperday ) )
+        elapsed = time.perf_counter() - started
+        logger.info ( f'Generated {generated:,} {pair} trades in {elapsed:,.2f} seconds ({generated / elapsed:,.0f} trades per second). ' )
+    elif command == 'ticks' :
+        days = float( arguments[2] ) if len( arguments ) >= 3 else 1.0
+        directory = arguments[3] if len( arguments ) >= 4 else definer.tickdirectory
+        started = time.perf_counter()
+        written = writeticks( TickGenerator( pair ).frames( days ), directory )
+        logger.info ( f'Wrote {written:,} {pair} trades to {directory} in {time.perf_counter() - started:,.2f} seconds. ' )
+    elif command == 'fixtures' :
+        count = int( float( arguments[2] ) ) if len( arguments ) >= 3 else 10000
+        path = arguments[3] if len( arguments ) >= 4 else f'/tmp/{pair.lower()}-fixtures.jsonl'
+        generator = TickGenerator( pair )
+        updates = writefixtures( generator.frames( count / generator.tradesperday ), path )
+        logger.info ( f'Wrote {count:,} {pair} trades in {updates:,} updates to {path}. ' )
+    elif command == 'serve' :
+        path = arguments[1] if len( arguments ) >= 2 else '/tmp/ethusd-fixtures.jsonl'
+        port = int( arguments[2] ) if len( arguments ) >= 3 else 8765
+        speed = float( arguments[3] ) if len( arguments ) >= 4 else 1.0
+        try : asyncio.run( serve( path, port, speed ) )
+        except KeyboardInterrupt : pass
+    else :
+        logger.error ( 'Usage: bench [pair] [trades] | ticks [pair] [days] [directory] | fixtures [pair] [trades] [path] | serve [path] [port] [speed]' )
+        sys.exit(1)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+#
+# library name: supervisor.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: launch, monitor and stop many backstopper bots (i.e. workers) from one process.
+
+# Supervision Outline:
+#  1. Every bot listed (or specified on the command line) runs as a worker process: python3 -m backstopper pair size stop sell.
+#  2. Workers are launched a fraction of a second apart (so 50 bots start within seconds) with their output in /tmp.
+#  3. A worker exiting with status 0 completed its trade and is not restarted.
+#     A worker exiting otherwise is restarted after an exponential backoff (up to "maxrestarts" times),
+#     unless it may have bought already: a restart would buy again. Workers mark that they may hold an order or the asset
+#     by writing <supervisordirectory>/<name>.holding (see app.py). Those are left "stranded" (their orders carry their name).
+#  4. SIGTERM (or SIGINT) is forwarded to every worker. Workers either cancel or keep their live stop order
+#     (see "terminationpolicy" in definer) and exit. Workers still running after "graceperiod" seconds are killed.
+#  5. The health of every worker is written to <supervisordirectory>/<supervisor pid>.json once a second.
+#  6. Every worker signs with an API key of its own (the first keys listed in credentials.py, in order, see authenticator).
+#     A supervisor refuses to start more workers than there are keys. Other processes signing meanwhile (e.g. ordermonitor)
+#     need a key no worker uses (BACKSTOPPER_APIKEY=<name>), as do the workers of any other supervisor.
+#
+# Execution:
+#   python3 -m backstopper.supervising.supervisor start bots.json                   (see examples/example-bots.json)
+#   python3 -m backstopper.supervising.supervisor start ETHUSD 0.0010 0.0100 0.0200
+#   python3 -m backstopper.supervising.supervisor status
+#   python3 -m backstopper.supervising.supervisor stop
+
+import os
+import sys
+import json
+import time
+import signal
+import subprocess
+
+import backstopper.informing.definer as definer
+import backstopper.authenticating.authenticator as authenticator
+
+from backstopper.logging.logger import logger as logger
+
+packageroot : str = os.path.dirname( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+class Worker :
+
+    def __init__ (
+            self,
+            name : str,
+            arguments : list,
+            apikey : str
+        ) -> None :
+
+        self.name = name
+        self.arguments = arguments
+        self.apikey = apikey
+        self.process : subprocess.Popen = None
+        self.state : str = 'pending'
+        self.starts : int = 0
+        self.exitcode : int = None
+        self.startedat : float = None
+        self.restartat : float = 0.0
+        self.backoff : float = 0.0
+        self.logpath : str = f'/tmp/backstopper-{name}.log'
+        self.holdingpath : str = os.path.join( definer.supervisordirectory, f'{name}.holding' )
+
+    def launch (
+            self,
+            policy : str
+        ) -> None :
+
+        # Start the worker (appending its output to its own log file). A marker left by an earlier supervisor is stale.
+        if not self.starts and os.path.exists( self.holdingpath ) : os.remove( self.holdingpath )
+        environment = dict( os.environ, BACKSTOPPER_POSITION = self.name, BACKSTOPPER_ONTERM = policy, BACKSTOPPER_HOLDING = self.holdingpath,
+                            BACKSTOPPER_APIKEY = self.apikey )
+        with open( self.logpath, 'ab' ) as logfile :
+            self.process = subprocess.Popen( [ sys.executable, '-m', 'backstopper', *self.arguments ], cwd = packageroot,
+                                             env = environment, stdout = logfile, stderr = subprocess.STDOUT,
+                                             start_new_session = True )
+        self.state = 'running'
+        self.starts += 1
+        self.startedat = time.monotonic()
+        logger.info ( f'Started {self.name} (pid {self.process.pid}, key {self.apikey}): {" ".join( self.arguments )}' )
+
+    def health ( self ) -> dict :
+        return { 'name': self.name, 'arguments': self.arguments, 'apikey': self.apikey, 'state': self.state, 'pid': self.process.pid if self.process else None,
+                 'starts': self.starts, 'exitcode': self.exitcode, 'backoff': self.backoff,
+                 'uptime': round( time.monotonic() - self.startedat, 1 ) if self.state == 'running' else 0, 'log': self.logpath }
+
+class Supervisor :
+
+    def __init__ (
+            self,
+            bots : list,
+            policy : str = None,
+            maxrestarts : int = 10,
+            maxbackoff : float = 300.0,
+            graceperiod : float = 30.0,
+            launchinterval : float = 0.1
+        ) -> None :
+
+        # One API key per worker (ValueError when credentials.py lists fewer keys than bots).
+        apikeys = authenticator.allocate( len( bots ) )
+        self.workers : list = [ Worker( bot.get( 'name' ) or f'{bot["pair"].lower()}-{index}', [ bot['pair'], bot['size'], bot['stop'], bot['sell'] ], apikey )
+                                for ( index, bot ), apikey in zip( enumerate( bots ), apikeys ) ]
+        self.policy = policy or definer.terminationpolicy
+        self.maxrestarts = maxrestarts
+        self.maxbackoff = maxbackoff
+        self.graceperiod = graceperiod
+        self.launchinterval = launchinterval
+        self.stopping : bool = False
+        self.statuspath = os.path.join( definer.supervisordirectory, f'{os.getpid()}.json' )
+
+    def terminate (
+            self,
+            signum,
+            frame
+        ) -> None :
+        logger.info ( f'Received signal {signum}. Stopping {len( self.workers )} workers (policy: {self.policy})...' )
+        self.stopping = True
+
+    def run ( self ) -> None :
+
+        signal.signal( signal.SIGTERM, self.terminate )
+        signal.signal( signal.SIGINT, self.terminate )
+        os.makedirs( definer.supervisordirectory, exist_ok = True )
+
+        # Launch every worker (slightly staggered to spread the initial REST calls).
+        for worker in self.workers :
+            if self.stopping : break
+            worker.launch( self.policy )
+            time.sleep( self.launchinterval )
+
+        # Monitor.
+        while not self.stopping :
+            self.check()
+            self.writestatus()
+            if all( worker.state in ( 'completed', 'failed', 'stranded' ) for worker in self.workers ) : break
+            time.sleep( 1 )
+
+        self.shutdown()
+        self.writestatus()
+
+    def check ( self ) -> None :
+
+        now = time.monotonic()
+        for worker in self.workers :
+
+            if worker.state == 'running' :
+                exitcode = worker.process.poll()
+                if exitcode is None : continue
+                worker.exitcode = exitcode
+                if exitcode == 0 :
+                    worker.state = 'completed'
+                    logger.info ( f'{worker.name} completed. ' )
+                    continue
+                if os.path.exists( worker.holdingpath ) :
+                    worker.state = 'stranded'
+                    logger.error ( f'{worker.name} exited with status {exitcode} after it may have bought. Not restarting it (it would buy again). '
+                                   f'Its orders are tagged {worker.name}. See {worker.logpath}. ' )
+                    continue
+                if worker.starts > self.maxrestarts :
+                    worker.state = 'failed'
+                    logger.error ( f'{worker.name} exited with status {exitcode} and exhausted its {self.maxrestarts} restarts. See {worker.logpath}. ' )
+                    continue
+
+                # Double the backoff (resetting it for workers that ran for a while before failing).
+                ranfor = now - worker.startedat
+                worker.backoff = 1.0 if ranfor > self.maxbackoff or not worker.backoff else min( self.maxbackoff, 2 * worker.backoff )
+                worker.restartat = now + worker.backoff
+                worker.state = 'backoff'
+                logger.warning ( f'{worker.name} exited with status {exitcode} after {ranfor:,.0f} seconds. Restarting in {worker.backoff:,.0f} seconds. ' )
+
+            elif worker.state == 'backoff' and now >= worker.restartat :
+                worker.launch( self.policy )
+
+    def shutdown ( self ) -> None :
+
+        # Forward SIGTERM to running workers, give them the grace period, then kill whatever remains.
+        running = [ worker for worker in self.workers if worker.state == 'running' and worker.process.poll() is None ]
+        for worker in running :
+            try : worker.process.send_signal( signal.SIGTERM )
+            except ProcessLookupError : pass
+
+        deadline = time.monotonic() + self.graceperiod
+        while running and time.monotonic() < deadline :
+            running = [ worker for worker in running if worker.process.poll() is None ]
+            time.sleep( 0.2 )
+
+        for worker in running :
+            logger.warning ( f'{worker.name} did not exit within {self.graceperiod} seconds. Killing it. ' )
+            worker.process.kill()
+            worker.process.wait()
+
+        for worker in self.workers :
+            if worker.state in ( 'running', 'backoff', 'pending' ) :
+                worker.exitcode = worker.process.poll() if worker.process else None
+                worker.state = 'stopped'
+
+    def writestatus ( self ) -> None :
+        status = { 'pid': os.getpid(), 'updated': time.time(), 'policy': self.policy, 'workers': [ worker.health() for worker in self.workers ] }
+        try :
+            with open( self.statuspath + '.tmp', 'w' ) as file : json.dump( status, file )
+            os.replace( self.statuspath + '.tmp', self.statuspath )
+        except OSError as e :
+            logger.warning ( f'Unable to write supervisor status. Error: {e}' )
+
+def supervisors ( ) -> list :
+
+    # Status of every supervisor process still alive (stale status files are removed).
+    found = []
+    if not os.path.isdir( definer.supervisordirectory ) : return found
+    for filename in os.listdir( definer.supervisordirectory ) :
+        if not filename.endswith( '.json' ) : continue
+        path = os.path.join( definer.supervisordirectory, filename )
+        try :
+            with open( path ) as file : status = json.load( file )
+            os.kill( status[ 'pid' ], 0 )
+        except ( OSError, ValueError, KeyError ) :
+            try : os.remove( path )
+            except OSError : pass
+            continue
+        found.append( status )
+    return found
+
+if __name__ == "__main__":
+
+    # Set default action in case a BASH wrapper has not been used.
+    action = sys.argv[1] if len( sys.argv ) > 1 else 'status'
+
+    if action == 'start' :
+
+        # Either a JSON file listing bots or a single bot's pair, size, stop and sell.
+        if len( sys.argv ) == 3 :
+            with open( sys.argv[2] ) as file : bots = json.load( file )
+        elif len( sys.argv ) == 6 :
+            bots = [ { 'pair': sys.argv[2], 'size': sys.argv[3], 'stop': sys.argv[4], 'sell': sys.argv[5] } ]
+        else :
+            logger.error ( 'Specify a JSON file listing bots or a pair, size, stop and sell. ' )
+            sys.exit(1)
+        try : supervisor = Supervisor( bots )
+        except ValueError as e :
+            logger.error ( f'Unable to start {len( bots )} bots. {e}' )
+            sys.exit(1)
+        supervisor.run()
+
+    elif action == 'stop' :
+
+        # Ask every supervisor to stop its workers (they cancel or keep their orders according to the policy).
+        for status in supervisors() :
+            logger.info ( f'Stopping supervisor {status["pid"]} and its {len( status["workers"] )} workers. ' )
+            os.kill( status[ 'pid' ], signal.SIGTERM )
+
+    elif action == 'status' :
+
+        for status in supervisors() :
+            for worker in status[ 'workers' ] :
+                logger.info ( f'[supervisor {status["pid"]}] {worker["name"]:<16} {worker["state"]:<10} pid {worker["pid"]} '
+                              f'starts {worker["starts"]} uptime {worker["uptime"]}s exit {worker["exitcode"]} ({" ".join( worker["arguments"] )})' )
+
+    else :
+        logger.error ( f'Unknown action "{action}". Use start, stop or status. ' )
+        sys.exit(1)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+# library name: deadline.py
+# library author: munair simpson
+# library created: 20261019
+# library purpose: bound every network call by a default timeout per endpoint class and by the budget of the strategy step making it.
+
+# Design Outline:
+#  1. Every REST and websocket call names its endpoint class ( 'public', 'order', 'account', 'message', 'connect' or 'stream' ).
+#     Each class has a default timeout in definer.timeouts.
+#  2. A strategy step (e.g. one ratchet or one engine action) runs within a Deadline:
+#       with Deadline( definer.stepbudget ) : ...
+#     The deadline is held in a context variable, so it reaches every call the step makes
+#     (including calls made by tasks it creates and by worker threads started with asyncio.to_thread).
+#     Nested deadlines can only shorten the budget.
+#  3. A call gets the smaller of its default timeout and the time left. With no time left it is not made (DeadlineExceeded).
+#  4. Timeouts are counted in the metrics module ("deadline.timeouts" and "deadline.expired" per endpoint class).
+
+import time
+import asyncio
+import requests
+import contextvars
+import websockets
+
+import backstopper.informing.definer as definer
+import backstopper.logging.metrics as metrics
+
+current : contextvars.ContextVar = contextvars.ContextVar( 'deadline', default = None )
+
+class DeadlineExceeded ( TimeoutError ) :
+    pass
+
+class Deadline :
+
+    def __init__ (
+            self,
+            seconds : float
+        ) -> None :
+        self.expiresat = time.monotonic() + seconds
+        self.token = None
+
+    def remaining ( self ) -> float :
+        return self.expiresat - time.monotonic()
+
+    def __enter__ ( self ) -> 'Deadline' :
+        outer = current.get()
+        if outer is not None : self.expiresat = min( self.expiresat, outer.expiresat )
+        self.token = current.set( self )
+        return self
+
+    def __exit__ ( self, *exception ) -> None :
+        current.reset( self.token )
+
+def timeout (
+        category : str
+    ) -> float :
+
+    # Seconds allowed for one call of the endpoint class given (within the current deadline, if any).
+    seconds = definer.timeouts[ category ]
+    deadline = current.get()
+    if deadline is None : return seconds
+    remaining = deadline.remaining()
+    if remaining <= 0 :
+        metrics.increment( 'deadline.expired', category = category )
+        raise DeadlineExceeded( f'No time is left for the {category} call. ' )
+    return min( seconds, remaining )
+
+def request (
+        method : str,
+        category : str,
+        url : str,
+        **arguments
+    ) -> requests.Response :
+    try :
+        return requests.request( method, url, timeout = timeout( category ), **arguments )
+    except requests.Timeout :
+        metrics.increment( 'deadline.timeouts', category = category )
+        raise
+
+def get (
+        category : str,
+        url : str,
+        **arguments
+    ) -> requests.Response :
+    return request( 'GET', category, url, **arguments )
+
+def post (
+        category : str,
+        url : str,
+        **arguments
+    ) -> requests.Response :
+    return request( 'POST', category, url, **arguments )
+
+async def connect (
+        url : str,
+        **arguments
+    ) :
+
+    # Open a websocket (the opening handshake is bounded like any other call).
+    try :
+        return await websockets.connect( url, open_timeout = timeout( 'connect' ), **arguments )
+    except asyncio.TimeoutError :
+        metrics.increment( 'deadline.timeouts', category = 'connect' )
+        raise
+
+async def recv (
+        websocket,
+        category : str = 'stream'
+    ) :
+
+    # Receive one message. Streams with heartbeats never stay silent for long, so silence means a hung connection.
+    try :
+        return await asyncio.wait_for( websocket.recv(), timeout( category ) )
+    except asyncio.TimeoutError :
+        metrics.increment( 'deadline.timeouts', category = category )
+        raise
@@ -3,34 +3,34 @@
 # script name: backstopper.bash
 # script author: munair simpson
 # script created: 20220909
-# script purpose: start or stop a Gemini backstopper bot
-# script argument: the action desired [start/stop]
+# script purpose: start or stop Gemini backstopper bots (through the supervisor)
+# script argument: the action desired [start/stop/status] followed by a bots JSON file or a pair, size, stop and sell
 
-# check for running bots/processes.
+# run from the repository containing this script.
+cd "$(dirname "$0")/.." || exit 1
+
+# report the bots supervised.
 echo -e "\nchecking for active backstopper bots... "
-ps auwx | grep -e "[b]ackstopper" && echo -e "\t...there are active backstopper bots running.\n "
-if [ $? == "1" ]; then echo -e "\t...no active bots found...\n " ; fi
+python3 -m backstopper.supervising.supervisor status
 
-# do we kill existing processes or start a new bot?
-action="start" && read -p "start/stop trading bot [$action]: " enteredvalue && action=${enteredvalue:-$action}
-if [ $action == "stop" ]; then kill -s KILL $(ps auwx | grep -e "backstopper" | grep -v "grep" | awk '{print $2}') ; fi
+# do we stop existing bots or start new ones?
+if [ $# -ge "1" ]; then action=$1 && shift ; else action="start" && read -p "start/stop/status trading bots [$action]: " enteredvalue && action=${enteredvalue:-$action} ; fi
+if [ $action == "stop" ]; then python3 -m backstopper.supervising.supervisor stop ; fi
 if [ $action == "start" ]; then 
 
-    # either use arguments.
-    if [ $# == "4" ]; then
-        pair=$1
-        size=$2
-        stop=$3
-        sell=$4
+    # either use arguments (a bots JSON file or a pair, size, stop and sell).
+    if [ $# == "1" ] || [ $# == "4" ]; then
+        arguments="$@"
     else
         # or confirm/define default values.
         pair="ETHUSD" && read -p "specify asset pair [the default value is $pair]: " enteredvalue && pair=${enteredvalue:-$pair}
         size="0.0010" && read -p "specify trade size [the default value is $size]: " enteredvalue && size=${enteredvalue:-$size}
         stop="0.0010" && read -p "specify price stop [the default value is $stop]: " enteredvalue && stop=${enteredvalue:-$stop}
         sell="0.0010" && read -p "specify price sell [the default value is $sell]: " enteredvalue && sell=${enteredvalue:-$sell}
-        echo -e "\ngoing to execute:\n\npython3 -m backstopper $pair $size $stop $sell\n\n"
+        arguments="$pair $size $stop $sell"
     fi
     
-    # fetch and execute the latest version of backstopper.
-    cd $(find / -type d -name "backstopper" 2>/dev/null | head -1) && git pull && python3 -m backstopper $pair $size $stop $sell
-fi
\ No newline at end of file
+    # start the supervisor in the background (each bot logs to /tmp/backstopper-<name>.log).
+    echo -e "\ngoing to execute:\n\npython3 -m backstopper.supervising.supervisor start $arguments\n\n"
+    nohup python3 -m backstopper.supervising.supervisor start $arguments >> /tmp/backstopper-supervisor.log 2>&1 &
+fi
@@ -0,0 +1,20 @@
+#! /bin/bash
+#
+# script name: tickrecorder.bash
+# script author: munair simpson
+# script created: 20261019
+# script purpose: wrapper for the tickrecorder.py benchmark
+
+# Measure the cost (CPU and disk) of recording a synthetic trade stream to binary column files.
+# Parameter 0 is the number of synthetic trades recorded.
+
+# Execution:
+# python3 ../tickrecorder.py 500000
+
+tradecount="500000"
+
+read -p "type trade count or press enter to continue with default [$tradecount]: " tradecount
+tradecount=${tradecount:-500000}
+
+cd ../..
+python3 -m backstopper.recording.tickrecorder $tradecount
@@ -0,0 +1,25 @@
+#! /bin/bash
+#
+# script name: tickstore.bash
+# script author: munair simpson
+# script created: 20261019
+# script purpose: wrapper for tickstore.py
+
+# Load recorded trades of a pair through memory maps and report the load time and analytics.
+# Parameter 0 is the pair.
+# Parameter 1 is the number of days (ending now) loaded.
+
+# Execution:
+# python3 ../tickstore.py ETHUSD 1
+
+pair="ETHUSD"
+days="1"
+
+read -p "type (market/trading) pair or press enter to continue with default [$pair]: " pair
+read -p "type number of days or press enter to continue with default [$days]: " days
+
+pair=${pair:-ETHUSD}
+days=${days:-1}
+
+cd ../..
+python3 -m backstopper.recording.tickstore $pair $days
@@ -0,0 +1,20 @@
+#! /bin/bash
+#
+# script name: triggerindex.bash
+# script author: munair simpson
+# script created: 20261019
+# script purpose: wrapper for the triggerindex.py benchmark
+
+# Benchmark the per-trade cost of the price trigger index from 1 to 10,000 active positions.
+# Parameter 0 is the number of simulated trades per run.
+
+# Execution:
+# python3 ../triggerindex.py 200000
+
+tradecount="200000"
+
+read -p "type trade count or press enter to continue with default [$tradecount]: " tradecount
+tradecount=${tradecount:-200000}
+
+cd ../..
+python3 -m backstopper.monitoring.triggerindex $tradecount